@@ -0,0 +1,43 @@
+"""
+Compare the throughput of the xsdata serializer and parser with the
+compiled codecs in shapeshifter_uftp.xml_codecs.
+
+Run from the root of the repository:
+
+    python -m benchmarks.codec_throughput
+"""
+import timeit
+
+from shapeshifter_uftp import transport, xml_codecs
+
+from .messages import message_factories
+
+NUMBER = 20
+
+
+def per_second(function) -> float:
+    return NUMBER / timeit.timeit(function, number=NUMBER)
+
+
+def main():
+    print(f"{'message':20} {'serialize/s':>12} {'compiled':>10} {'parse/s':>10} {'compiled':>10}")
+    for factory in message_factories:
+        message = factory()
+        xml_message = transport.serializer.render(message).encode("utf-8")
+        assert xml_codecs.to_xml(message) == xml_message.decode("utf-8")
+        assert xml_codecs.from_xml(xml_message) == transport.parser.from_bytes(xml_message)
+
+        # Compile the codec before timing.
+        xml_codecs.get_codec(type(message))
+
+        print(
+            f"{type(message).__name__:20} "
+            f"{per_second(lambda: transport.serializer.render(message)):12.0f} "
+            f"{per_second(lambda: xml_codecs.to_xml(message)):10.0f} "
+            f"{per_second(lambda: transport.parser.from_bytes(xml_message)):10.0f} "
+            f"{per_second(lambda: xml_codecs.from_xml(xml_message)):10.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compare parsing an incoming SignedMessage envelope with the dataclass
+parser and with the streaming envelope parser.
+
+Run from the root of the repository:
+
+    python -m benchmarks.envelope_parsing
+"""
+import logging
+import timeit
+from base64 import b64encode
+
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import transport
+from shapeshifter_uftp.logging import logger
+
+from .messages import message_factories
+
+NUMBER = 20
+
+
+def main():
+    logger.setLevel(logging.WARNING)
+    _, private_key = crypto_sign_keypair()
+    signing_key = b64encode(private_key).decode()
+
+    print(f"{'message':20} {'size':>10} {'xsdata (ms)':>12} {'streaming (ms)':>15}")
+    for factory in message_factories:
+        message = factory()
+        sealed = transport.seal_message(message, signing_key)
+        envelope = transport.to_signed_xml("agr.dev", "AGR", sealed)
+        xsdata = timeit.timeit(lambda: transport.from_xml(envelope), number=NUMBER) / NUMBER
+        streaming = timeit.timeit(lambda: transport.parse_signed_message(envelope), number=NUMBER) / NUMBER
+        print(f"{type(message).__name__:20} {len(envelope):10} {xsdata * 1000:12.3f} {streaming * 1000:15.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""
+Compare the peak memory use and the duration of writing and reading a
+large FlexSettlement with the dataclasses and with the streaming
+writer and reader.
+
+Run from the root of the repository:
+
+    python -m benchmarks.flex_settlement_streaming
+"""
+import logging
+import time
+import tracemalloc
+
+from shapeshifter_uftp import streaming, transport
+from shapeshifter_uftp.logging import logger
+from shapeshifter_uftp.uftp import FlexSettlement
+
+from .messages import PERIOD, contract_settlement, default_args, flex_order_settlement
+
+SIZES = [100, 1000]
+
+
+def attributes():
+    return {"period_start": PERIOD, "period_end": PERIOD, "currency": "EUR", **default_args()}
+
+
+def build(num_orders):
+    message = FlexSettlement(
+        flex_order_settlements=[flex_order_settlement(order) for order in range(num_orders)],
+        contract_settlements=[contract_settlement()],
+        **attributes(),
+    )
+    return transport.to_xml(message).encode()
+
+
+def write(num_orders):
+    writer = streaming.write_flex_settlement(
+        (flex_order_settlement(order) for order in range(num_orders)),
+        [contract_settlement()],
+        **attributes(),
+    )
+    return writer.to_xml()
+
+
+def parse(data):
+    return len(transport.from_xml(data).flex_order_settlements)
+
+
+def read(data):
+    return sum(1 for _ in streaming.read_message(data).flex_order_settlements())
+
+
+def measure(function, argument):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = function(argument)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, duration, peak
+
+
+def main():
+    logger.setLevel(logging.WARNING)
+    print(
+        f"{'orders':>7} {'size (MB)':>10} "
+        f"{'build (s)':>10} {'build (MB)':>11} {'write (s)':>10} {'write (MB)':>11} "
+        f"{'parse (s)':>10} {'parse (MB)':>11} {'read (s)':>9} {'read (MB)':>10}"
+    )
+    for num_orders in SIZES:
+        data, build_duration, build_peak = measure(build, num_orders)
+        _, write_duration, write_peak = measure(write, num_orders)
+        count, parse_duration, parse_peak = measure(parse, data)
+        read_count, read_duration, read_peak = measure(read, data)
+        assert count == read_count == num_orders
+        print(
+            f"{num_orders:7} {len(data) / 1e6:10.1f} "
+            f"{build_duration:10.2f} {build_peak / 1e6:11.1f} {write_duration:10.2f} {write_peak / 1e6:11.1f} "
+            f"{parse_duration:10.2f} {parse_peak / 1e6:11.1f} {read_duration:9.2f} {read_peak / 1e6:10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
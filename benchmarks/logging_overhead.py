@@ -0,0 +1,102 @@
+"""
+Measure the per-message overhead of logging, by sending and receiving
+messages (serialize, sign, wrap, unwrap, verify and parse) with the
+logger configured in different ways, compared to logging switched off.
+The compiled codecs are used, so that the time spent on logging is not
+lost in the time spent on serialization. The log output goes to
+/dev/null.
+
+"debug, old formatter" is comparable to the logging before it was
+made lazy: the logger was fixed at DEBUG, the full messages were
+formatted at INFO, and the formatter looked up the local timezone for
+every record.
+
+Run from the root of the repository:
+
+    python -m benchmarks.logging_overhead
+"""
+import logging
+import os
+import timeit
+from base64 import b64encode
+from datetime import datetime
+
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import ShapeshifterDsoAgrClient, transport
+from shapeshifter_uftp.logging import (
+    ShapeshifterLogFormatter,
+    configure_logging,
+    handler,
+)
+
+from .messages import message_factories
+
+NUMBER = 10
+REPEAT = 5
+
+
+class OldLogFormatter(logging.Formatter):
+    """
+    The formatter as it was before it was optimized.
+    """
+
+    def format(self, record):
+        return f"{record.levelname:10}{datetime.now().astimezone().isoformat()} - {record.getMessage()}"
+
+
+configurations = [
+    ("off", logging.CRITICAL + 1, ShapeshifterLogFormatter),
+    ("debug, old formatter", logging.DEBUG, OldLogFormatter),
+    ("debug", logging.DEBUG, ShapeshifterLogFormatter),
+    ("info (default)", logging.INFO, ShapeshifterLogFormatter),
+    ("warning", logging.WARNING, ShapeshifterLogFormatter),
+]
+
+
+def round_trip(client, message, public_key):
+    envelope = client._prepare_message(message)  # pylint: disable=protected-access
+    signed_message = transport.parse_signed_message(envelope)
+    return transport.unseal_message(signed_message.body, public_key)
+
+
+def main():
+    transport.USE_COMPILED_CODECS = True
+    public_key, private_key = [b64encode(key).decode() for key in crypto_sign_keypair()]
+    client = ShapeshifterDsoAgrClient(
+        sender_domain="dso.dev",
+        signing_key=private_key,
+        recipient_domain="agr.dev",
+        recipient_endpoint="http://localhost/message",
+    )
+
+    with open(os.devnull, "w", encoding="utf-8") as devnull:
+        stream = handler.setStream(devnull)
+        try:
+            print(
+                f"{'message':20} {'off (ms)':>9} "
+                + " ".join(f"{'+ ' + name + ' (ms)':>28}" for name, _, _ in configurations[1:])
+            )
+            for factory in message_factories:
+                message = factory()
+                round_trip(client, message, public_key)
+                timings = []
+                for _, level, formatter in configurations:
+                    configure_logging(level=level)
+                    handler.setFormatter(formatter())
+                    seconds = min(
+                        timeit.repeat(lambda: round_trip(client, message, public_key), number=NUMBER, repeat=REPEAT)
+                    )
+                    timings.append(seconds / NUMBER * 1000)
+                baseline = timings[0]
+                print(
+                    f"{type(message).__name__:20} {baseline:9.3f} "
+                    + " ".join(f"{timing - baseline:28.3f}" for timing in timings[1:])
+                )
+        finally:
+            handler.setStream(stream)
+            configure_logging(level=logging.INFO, log_format="color")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,247 @@
+"""
+Realistically sized messages for the benchmarks: a full day of
+15-minute ISPs (96), for a number of congestion points.
+"""
+from datetime import datetime, timezone
+from uuid import uuid4
+
+from xsdata.models.datatype import XmlDate
+
+from shapeshifter_uftp.uftp import (
+    AgrPortfolioQueryResponse,
+    AgrPortfolioQueryResponseCongestionPoint,
+    AgrPortfolioQueryResponseConnection,
+    AgrPortfolioQueryResponseDSOPortfolio,
+    AgrPortfolioQueryResponseDSOView,
+    AvailableRequested,
+    ContractSettlement,
+    ContractSettlementISP,
+    ContractSettlementPeriod,
+    DPrognosis,
+    DPrognosisISP,
+    FlexOffer,
+    FlexOfferOption,
+    FlexOfferOptionISP,
+    FlexOrder,
+    FlexOrderISP,
+    FlexOrderSettlement,
+    FlexOrderSettlementISP,
+    FlexRequest,
+    FlexRequestISP,
+    FlexSettlement,
+    Metering,
+    MeteringISP,
+    MeteringProfile,
+    MeteringProfileEnum,
+    MeteringUnit,
+    RedispatchBy,
+)
+
+NUM_ISPS = 96
+NUM_CONGESTION_POINTS = 50
+PERIOD = XmlDate(2024, 1, 1)
+
+
+def default_args():
+    return {
+        "version": "3.1.0",
+        "sender_domain": "agr.dev",
+        "recipient_domain": "dso.dev",
+        "time_stamp": datetime.now(timezone.utc).isoformat(),
+        "message_id": str(uuid4()),
+        "conversation_id": str(uuid4()),
+    }
+
+
+def d_prognosis():
+    return DPrognosis(
+        isp_duration="PT15M",
+        period=PERIOD,
+        congestion_point="ean.123456789012",
+        isps=[DPrognosisISP(power=1000 + start, start=start, duration=1) for start in range(1, NUM_ISPS + 1)],
+        revision=1,
+        **default_args(),
+    )
+
+
+def flex_request():
+    return FlexRequest(
+        isp_duration="PT15M",
+        period=PERIOD,
+        congestion_point="ean.123456789012",
+        isps=[
+            FlexRequestISP(
+                disposition=AvailableRequested.REQUESTED,
+                min_power=-500,
+                max_power=500,
+                start=start,
+                duration=1,
+            )
+            for start in range(1, NUM_ISPS + 1)
+        ],
+        revision=1,
+        expiration_date_time=datetime.now(timezone.utc).isoformat(),
+        contract_id=str(uuid4()),
+        service_type="MyService",
+        **default_args(),
+    )
+
+
+def flex_offer():
+    return FlexOffer(
+        isp_duration="PT15M",
+        period=PERIOD,
+        congestion_point="ean.123456789012",
+        expiration_date_time=datetime.now(timezone.utc).isoformat(),
+        offer_options=[
+            FlexOfferOption(
+                isps=[FlexOfferOptionISP(power=250, start=start, duration=1) for start in range(1, NUM_ISPS + 1)],
+                option_reference=f"Option{option}",
+                price=2.30,
+                min_activation_factor=0.5,
+            )
+            for option in range(4)
+        ],
+        flex_request_message_id=str(uuid4()),
+        **default_args(),
+    )
+
+
+def flex_order():
+    return FlexOrder(
+        isps=[FlexOrderISP(power=250, duration=1, start=start) for start in range(1, NUM_ISPS + 1)],
+        isp_duration="PT15M",
+        period=PERIOD,
+        congestion_point="ean.123456789012",
+        flex_offer_message_id=str(uuid4()),
+        contract_id=str(uuid4()),
+        d_prognosis_message_id=str(uuid4()),
+        baseline_reference=str(uuid4()),
+        price=2.00,
+        currency="EUR",
+        order_reference=str(uuid4()),
+        option_reference="Option0",
+        activation_factor=0.5,
+        **default_args(),
+    )
+
+
+def flex_order_settlement(congestion_point=0):
+    return FlexOrderSettlement(
+        isps=[
+            FlexOrderSettlementISP(
+                start=start,
+                duration=1,
+                baseline_power=1000,
+                ordered_flex_power=250,
+                actual_power=760,
+                delivered_flex_power=240,
+                power_deficiency=10,
+            )
+            for start in range(1, NUM_ISPS + 1)
+        ],
+        period=PERIOD,
+        congestion_point=f"ean.{123456789000 + congestion_point}",
+        order_reference=str(uuid4()),
+        contract_id=str(uuid4()),
+        d_prognosis_message_id=str(uuid4()),
+        baseline_reference=str(uuid4()),
+        price=100.0,
+        penalty=4.0,
+        net_settlement=96.0,
+    )
+
+
+def contract_settlement():
+    return ContractSettlement(
+        periods=[
+            ContractSettlementPeriod(
+                isps=[
+                    ContractSettlementISP(
+                        start=start,
+                        duration=1,
+                        reserved_power=500,
+                        requested_power=250,
+                        available_power=500,
+                        offered_power=250,
+                        ordered_power=250,
+                    )
+                    for start in range(1, NUM_ISPS + 1)
+                ],
+                period=PERIOD,
+            )
+        ],
+        contract_id=str(uuid4()),
+    )
+
+
+def flex_settlement():
+    return FlexSettlement(
+        flex_order_settlements=[
+            flex_order_settlement(congestion_point) for congestion_point in range(NUM_CONGESTION_POINTS)
+        ],
+        contract_settlements=[contract_settlement()],
+        period_start=PERIOD,
+        period_end=XmlDate(2024, 1, 31),
+        currency="EUR",
+        **default_args(),
+    )
+
+
+def metering():
+    return Metering(
+        profiles=[
+            MeteringProfile(
+                isps=[MeteringISP(start=start, value=1000 + start) for start in range(1, NUM_ISPS + 1)],
+                profile_type=profile_type,
+                unit=MeteringUnit.K_W,
+            )
+            for profile_type in MeteringProfileEnum
+        ],
+        revision=1,
+        isp_duration="PT15M",
+        time_zone="Europe/Amsterdam",
+        currency="EUR",
+        period=PERIOD,
+        ean="E1234567890123456",
+        **default_args(),
+    )
+
+
+def agr_portfolio_query_response(num_congestion_points=NUM_CONGESTION_POINTS, num_connections=100):
+    """
+    A portfolio of num_congestion_points congestion points with
+    num_connections connections each.
+    """
+    return AgrPortfolioQueryResponse(
+        dso_views=[
+            AgrPortfolioQueryResponseDSOView(
+                dso_portfolios=[
+                    AgrPortfolioQueryResponseDSOPortfolio(
+                        congestion_points=[
+                            AgrPortfolioQueryResponseCongestionPoint(
+                                connections=[
+                                    AgrPortfolioQueryResponseConnection(
+                                        entity_address=f"ean.{871000000000000000 + congestion_point * num_connections + connection}"
+                                    )
+                                    for connection in range(num_connections)
+                                ],
+                                entity_address=f"ean.{123456789000 + congestion_point}",
+                                mutex_offers_supported=True,
+                                day_ahead_redispatch_by=RedispatchBy.AGR,
+                                intraday_redispatch_by=RedispatchBy.AGR,
+                            )
+                            for congestion_point in range(num_congestion_points)
+                        ],
+                        dso_domain="dso.dev",
+                    )
+                ]
+            )
+        ],
+        period=PERIOD,
+        agr_portfolio_query_message_id=str(uuid4()),
+        **default_args(),
+    )
+
+
+message_factories = [d_prognosis, flex_request, flex_offer, flex_order, flex_settlement, metering]
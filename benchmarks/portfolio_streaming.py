@@ -0,0 +1,65 @@
+"""
+Compare the peak memory use and the duration of reading a large
+AgrPortfolioQueryResponse with the dataclass parser and with the
+streaming reader.
+
+Run from the root of the repository:
+
+    python -m benchmarks.portfolio_streaming
+"""
+import logging
+import time
+import tracemalloc
+
+from shapeshifter_uftp import streaming, transport
+from shapeshifter_uftp.logging import logger
+
+from .messages import agr_portfolio_query_response
+
+SIZES = [(10, 100), (100, 100), (100, 1000)]
+
+
+def parse(data):
+    message = transport.from_xml(data)
+    return sum(
+        len(congestion_point.connections)
+        for view in message.dso_views
+        for portfolio in view.dso_portfolios
+        for congestion_point in portfolio.congestion_points
+    )
+
+
+def stream(data):
+    reader = streaming.read_message(data)
+    return sum(
+        sum(1 for _ in connections)
+        for _, connections in reader.congestion_points()
+    )
+
+
+def measure(function, data):
+    tracemalloc.start()
+    start = time.perf_counter()
+    count = function(data)
+    duration = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return count, duration, peak
+
+
+def main():
+    logger.setLevel(logging.WARNING)
+    print(f"{'connections':>12} {'size (MB)':>10} {'parse (s)':>10} {'parse (MB)':>11} {'stream (s)':>11} {'stream (MB)':>12}")
+    for num_congestion_points, num_connections in SIZES:
+        data = transport.to_xml(agr_portfolio_query_response(num_congestion_points, num_connections)).encode()
+        count, parse_duration, parse_peak = measure(parse, data)
+        streamed_count, stream_duration, stream_peak = measure(stream, data)
+        assert count == streamed_count
+        print(
+            f"{count:12} {len(data) / 1e6:10.1f} {parse_duration:10.2f} {parse_peak / 1e6:11.1f} "
+            f"{stream_duration:11.2f} {stream_peak / 1e6:12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+"""
+Compare the size of compact and pretty (indented) serialized messages,
+and the size of the SignedMessage that is sent over the wire.
+
+Run from the root of the repository:
+
+    python -m benchmarks.serialization_size
+"""
+import logging
+from base64 import b64encode
+
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import transport
+from shapeshifter_uftp.logging import logger
+
+from .messages import message_factories
+
+
+def main():
+    logger.setLevel(logging.WARNING)
+    _, private_key = crypto_sign_keypair()
+    signing_key = b64encode(private_key).decode()
+
+    print(f"{'message':20} {'pretty':>10} {'compact':>10} {'saved':>7} {'on the wire':>12}")
+    for factory in message_factories:
+        message = factory()
+        pretty = len(transport.to_xml(message, pretty=True).encode("utf-8"))
+        compact = len(transport.to_xml(message).encode("utf-8"))
+        sealed = transport.seal_message(message, signing_key)
+        wire = len(transport.to_signed_xml("agr.dev", "AGR", sealed))
+        print(
+            f"{type(message).__name__:20} {pretty:10} {compact:10} "
+            f"{1 - compact / pretty:7.0%} {wire:12}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measure how unsealing (verifying and parsing) incoming messages scales
+with the number of worker processes, compared to the unseal threads
+that a service uses by default. Each pool unseals the same batch of
+sealed messages; the throughput with threads stays flat because of the
+GIL (unless Python is free-threaded), while each process adds a core.
+
+The number of processes goes from 1 to the number of cores of this
+machine, or to the number given on the command line.
+
+Run from the root of the repository:
+
+    python -m benchmarks.unseal_scaling [max_workers]
+"""
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from base64 import b64encode
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import transport
+from shapeshifter_uftp.logging import logger
+from shapeshifter_uftp.service.base_service import (
+    _init_unseal_process,
+    _unseal_message,
+)
+
+from .messages import message_factories
+
+NUM_MESSAGES = 200
+
+
+def unseal_all(executor, bodies, public_key) -> float:
+    start = time.perf_counter()
+    futures = [executor.submit(_unseal_message, body, public_key, ()) for body in bodies]
+    for future in futures:
+        future.result()
+    return time.perf_counter() - start
+
+
+def main():
+    logger.setLevel(logging.WARNING)
+    transport.USE_COMPILED_CODECS = True
+    max_workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
+    public_key, private_key = [b64encode(key).decode() for key in crypto_sign_keypair()]
+    bodies = [
+        transport.seal_message(message_factories[i % len(message_factories)](), private_key)
+        for i in range(NUM_MESSAGES)
+    ]
+    context = multiprocessing.get_context("spawn")
+
+    print(f"Unsealing {NUM_MESSAGES} messages on a machine with {os.cpu_count()} cores")
+    print(f"{'workers':>7} {'threads (msg/s)':>16} {'processes (msg/s)':>18}")
+    for workers in range(1, max_workers + 1):
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            unseal_all(executor, bodies[:workers], public_key)
+            thread_seconds = unseal_all(executor, bodies, public_key)
+        with ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=_init_unseal_process,
+            initargs=(True, logging.WARNING),
+        ) as executor:
+            # Start all worker processes before measuring.
+            unseal_all(executor, bodies[:workers * 2], public_key)
+            process_seconds = unseal_all(executor, bodies, public_key)
+        print(f"{workers:7} {NUM_MESSAGES / thread_seconds:16.0f} {NUM_MESSAGES / process_seconds:18.0f}")
+
+
+if __name__ == "__main__":
+    main()
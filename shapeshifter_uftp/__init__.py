@@ -1,4 +1,10 @@
 from .client import (
+    AsyncShapeshifterAgrCroClient,
+    AsyncShapeshifterAgrDsoClient,
+    AsyncShapeshifterCroAgrClient,
+    AsyncShapeshifterCroDsoClient,
+    AsyncShapeshifterDsoAgrClient,
+    AsyncShapeshifterDsoCroClient,
     ShapeshifterAgrCroClient,
     ShapeshifterAgrDsoClient,
     ShapeshifterCroAgrClient,
@@ -74,6 +80,12 @@ from .uftp import (
 )
 
 __all__ = [
+    "AsyncShapeshifterAgrCroClient",
+    "AsyncShapeshifterAgrDsoClient",
+    "AsyncShapeshifterCroAgrClient",
+    "AsyncShapeshifterCroDsoClient",
+    "AsyncShapeshifterDsoAgrClient",
+    "AsyncShapeshifterDsoCroClient",
     "ShapeshifterAgrCroClient",
     "ShapeshifterAgrDsoClient",
     "ShapeshifterCroAgrClient",
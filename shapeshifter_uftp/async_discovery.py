@@ -0,0 +1,168 @@
+"""
+Service discovery for asyncio applications.
+
+These functions perform the same DNS lookups as get_version(),
+get_endpoint() and get_keys() in the transport module, but use the
+asyncio resolver of dnspython, so that the lookups for a participant
+(and for many participants) run concurrently instead of one after the
+other. The DNS names and the parsing of the records are shared with
+the transport module.
+
+Results are read from and stored in the same caches as the synchronous
+functions, so resolving participants here also warms the caches that
+the clients and services use.
+"""
+import asyncio
+from dataclasses import dataclass
+from functools import partial
+
+import dns.asyncresolver
+import dns.exception
+
+from . import transport
+from .cache import Expiring, TTLCache
+from .exceptions import AuthenticationTimeoutException, ServiceDiscoveryException
+from .logging import logger
+
+_MISSING = object()
+
+# Lookups that are in progress, so that concurrent coroutines that
+# need the same record wait for a single DNS query.
+_pending = {}
+
+
+@dataclass
+class Participant:
+    """
+    The discovered details of a participant. The version and the
+    encryption key are None when the participant was looked up with
+    lookup functions that don't provide them.
+    """
+    domain: str
+    role: str
+    version: str | None
+    endpoint: str
+    signing_key: str
+    encryption_key: str | None
+
+
+async def _resolve(dns_name: str, rdtype: str, exception_class: type, description: str):
+    """
+    Resolve a DNS record, and return the first record of the answer
+    together with its (bounded) TTL.
+    """
+    try:
+        answer = await dns.asyncresolver.resolve(dns_name, rdtype)
+    except dns.exception.DNSException as exc:
+        raise transport.lookup_error(exc, dns_name, rdtype, exception_class, description) from exc
+    rrset = answer.response.answer[0]
+    return rrset[0], transport.record_ttl(rrset.ttl)
+
+
+async def _cached(cache: TTLCache, key, load):
+    """
+    Return the cached value for the key, or await load() to obtain it
+    and store the result (or a cacheable error) in the cache. Like the
+    synchronous functions, an expired value is still returned during
+    its stale period, while it is refreshed in the background.
+    """
+    stale_value = cache.get_stale(key, _MISSING)
+    if stale_value is _MISSING:
+        value = cache.get(key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+    pending_key = (cache, key, asyncio.get_running_loop())
+    task = _pending.get(pending_key)
+    if task is None:
+        task = _pending[pending_key] = asyncio.ensure_future(_load(cache, key, load))
+        task.add_done_callback(lambda _: _pending.pop(pending_key, None))
+        if stale_value is not _MISSING:
+            task.add_done_callback(partial(_log_refresh_error, key))
+    if stale_value is not _MISSING:
+        return stale_value
+    return await asyncio.shield(task)
+
+
+def _log_refresh_error(key, task: asyncio.Task):
+    if not task.cancelled() and task.exception() is not None:
+        error = task.exception()
+        logger.warning("Could not refresh cached value for %s: %s: %s", key, error.__class__.__name__, error)
+
+
+async def _load(cache: TTLCache, key, load):
+    try:
+        result = await load()
+    except Exception as err:
+        cache.store_error(key, err)
+        raise
+    return cache.store_result(key, result)
+
+
+async def get_version(domain):
+    """
+    Retrieve the supported Shapeshifter version of the participant.
+    """
+    async def load():
+        record, ttl = await _resolve(
+            transport.version_dns_name(domain), "TXT", ServiceDiscoveryException, "version"
+        )
+        return Expiring(transport.parse_version(record), ttl)
+
+    return await _cached(transport.get_version.cache, (domain,), load)
+
+
+async def get_endpoint(domain, role):
+    """
+    Retrieve the endpoint of the participant. The endpoint record and
+    the version are resolved concurrently.
+    """
+    async def load():
+        (record, ttl), version = await asyncio.gather(
+            _resolve(transport.endpoint_dns_name(domain, role), "CNAME", ServiceDiscoveryException, "endpoint"),
+            get_version(domain),
+        )
+        return Expiring(transport.endpoint_url(record, version), ttl)
+
+    return await _cached(transport.get_endpoint.cache, (domain, role), load)
+
+
+async def get_keys(domain, role):
+    """
+    Retrieve the public signing key and encryption key of the participant.
+    """
+    async def load():
+        dns_name = transport.keys_dns_name(domain, role)
+        record, ttl = await _resolve(dns_name, "TXT", AuthenticationTimeoutException, "public keys")
+        return Expiring(transport.parse_keys(dns_name, record), ttl)
+
+    return await _cached(transport.get_keys.cache, (domain, role), load)
+
+
+async def resolve_participant(domain, role) -> Participant:
+    """
+    Resolve the version, endpoint and keys of a participant concurrently.
+    """
+    version, endpoint, (signing_key, encryption_key) = await asyncio.gather(
+        get_version(domain),
+        get_endpoint(domain, role),
+        get_keys(domain, role),
+    )
+    return Participant(domain, role, version, endpoint, signing_key, encryption_key)
+
+
+async def resolve_participants(participants) -> dict:
+    """
+    Resolve many participants at once, for instance to warm the
+    discovery caches at startup. 'participants' is an iterable of
+    (domain, role) tuples.
+
+    Returns a dict that maps each (domain, role) to its Participant, or
+    to the exception that occurred while resolving it.
+    """
+    participants = list(dict.fromkeys(participants))
+    results = await asyncio.gather(
+        *(resolve_participant(domain, role) for domain, role in participants),
+        return_exceptions=True,
+    )
+    return dict(zip(participants, results))
@@ -0,0 +1,367 @@
+"""
+Thread-safe, bounded caching with expiry, used for service discovery.
+
+The cache evicts the least recently used entries when it is full,
+and makes sure that only one thread at a time loads the value for a
+given key: other threads that miss on the same key wait for that
+result instead of performing the same (DNS) lookup themselves.
+
+Entries can be served for a while after they expired (stale while
+revalidate); the first access to a stale entry triggers a refresh in
+a background thread, so that callers don't have to wait for it.
+
+A loader can decide how long its result may be cached by returning an
+Expiring value, and can have its error cached (negative caching) by
+raising an exception that was marked using cacheable().
+"""
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Event, Lock, Thread
+from typing import Any, NamedTuple
+
+from .logging import logger
+
+
+class Expiring(NamedTuple):
+    """
+    A value that should be cached for 'ttl' seconds, instead of the
+    default ttl of the cache.
+    """
+    value: Any
+    ttl: float
+
+
+def cacheable(error: Exception, ttl: float) -> Exception:
+    """
+    Mark an exception so that a cache stores it for 'ttl' seconds, and
+    raises it again for that key instead of calling the loader.
+    """
+    error.cache_ttl = ttl
+    return error
+
+
+def cache_ttl(error: Exception) -> float | None:
+    """
+    Return the number of seconds that the error may be cached for, if
+    it was marked using cacheable().
+    """
+    return getattr(error, "cache_ttl", None)
+
+
+class CacheStats:
+    """
+    Counters that describe how well a cache is performing.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale_hits = 0
+        self.negative_hits = 0
+        self.evictions = 0
+        self.refreshes = 0
+        self.load_errors = 0
+
+    def as_dict(self) -> dict:
+        """
+        Return a snapshot of the counters.
+        """
+        return dict(vars(self))
+
+
+class _CacheEntry:
+    __slots__ = ("value", "error", "expires_at", "stale_until")
+
+    def __init__(self, value, expires_at: float, stale_until: float, error: Exception | None = None):
+        self.value = value
+        self.error = error
+        self.expires_at = expires_at
+        self.stale_until = stale_until
+
+
+class _PendingLoad:
+    """
+    A load that is in progress. Threads that need the same key wait
+    on it rather than loading the value themselves.
+    """
+
+    def __init__(self):
+        self.done = Event()
+        self.value = None
+        self.error = None
+
+    def result(self):
+        """
+        Wait for the load to finish, and return its value or raise its error.
+        """
+        self.done.wait()
+        if self.error is not None:
+            raise self.error
+        return self.value
+
+
+class TTLCache:
+    """
+    Bounded LRU cache whose entries expire after 'ttl' seconds.
+    """
+
+    def __init__(self, ttl: float, maxsize: int = 1024, stale_ttl: float = 0):
+        """
+        Each setting can also be a function without arguments, which is
+        called whenever the setting is used, so that it can be changed
+        at runtime.
+
+        :param float ttl: the number of seconds that an entry is fresh.
+        :param int maxsize: the maximum number of entries in the cache.
+        :param float stale_ttl: the number of seconds after expiry during
+                                which the old value is still returned,
+                                while it is refreshed in the background.
+        """
+        self._ttl = ttl
+        self._maxsize = maxsize
+        self._stale_ttl = stale_ttl
+        self.stats = CacheStats()
+        self._entries = OrderedDict()
+        self._pending = {}
+        self._lock = Lock()
+
+    @property
+    def ttl(self) -> float:
+        """
+        The number of seconds that an entry is fresh.
+        """
+        return self._ttl() if callable(self._ttl) else self._ttl
+
+    @property
+    def maxsize(self) -> int:
+        """
+        The maximum number of entries in the cache.
+        """
+        return self._maxsize() if callable(self._maxsize) else self._maxsize
+
+    @property
+    def stale_ttl(self) -> float:
+        """
+        The number of seconds after expiry during which an entry is still used.
+        """
+        return self._stale_ttl() if callable(self._stale_ttl) else self._stale_ttl
+
+    def get_or_load(self, key, loader):
+        """
+        Return the cached value for the key, calling loader() to
+        obtain it if there is no usable cached value.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.error is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.stats.negative_hits += 1
+                raise entry.error.with_traceback(None)
+
+            if entry is not None and now < entry.expires_at:
+                self._entries.move_to_end(key)
+                self.stats.hits += 1
+                return entry.value
+
+            if entry is not None and entry.error is None and now < entry.stale_until:
+                self._entries.move_to_end(key)
+                self.stats.stale_hits += 1
+                if key not in self._pending:
+                    self._pending[key] = _PendingLoad()
+                    Thread(target=self._refresh, args=(key, loader), daemon=True).start()
+                return entry.value
+
+            self.stats.misses += 1
+            pending = self._pending.get(key)
+            if pending is not None:
+                leader = False
+            else:
+                pending = self._pending[key] = _PendingLoad()
+                leader = True
+
+        if leader:
+            self._load(key, loader, pending)
+        return pending.result()
+
+    def get(self, key, default=None):
+        """
+        Return the cached value for the key without loading it. If the
+        key is not cached or has expired, the default is returned. A
+        cached error is raised.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now >= entry.expires_at:
+                self.stats.misses += 1
+                return default
+            self._entries.move_to_end(key)
+            if entry.error is not None:
+                self.stats.negative_hits += 1
+                raise entry.error.with_traceback(None)
+            self.stats.hits += 1
+            return entry.value
+
+    def get_stale(self, key, default=None):
+        """
+        Return the value for the key if it has expired, but may still
+        be used while it is refreshed. Otherwise, the default is
+        returned.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.error is not None or not entry.expires_at <= now < entry.stale_until:
+                return default
+            self._entries.move_to_end(key)
+            self.stats.stale_hits += 1
+            return entry.value
+
+    def set(self, key, value, ttl: float | None = None):
+        """
+        Store a value in the cache, optionally with a specific ttl.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        self._store(key, _CacheEntry(value, now + ttl, now + ttl + self.stale_ttl))
+
+    def set_error(self, key, error: Exception, ttl: float):
+        """
+        Store an error for the key, which is raised on every access
+        during the next 'ttl' seconds.
+        """
+        now = time.monotonic()
+        self._store(key, _CacheEntry(None, now + ttl, now + ttl, error=error))
+
+    def store_result(self, key, result):
+        """
+        Store the result of a loader, which may be an Expiring value,
+        and return the value.
+        """
+        if isinstance(result, Expiring):
+            self.set(key, result.value, result.ttl)
+            return result.value
+        self.set(key, result)
+        return result
+
+    def store_error(self, key, error: Exception):
+        """
+        Store the error of a loader, if it was marked using cacheable().
+        """
+        ttl = cache_ttl(error)
+        if ttl is not None:
+            self.set_error(key, error, ttl)
+
+    def _store(self, key, entry: _CacheEntry):
+        maxsize = self.maxsize
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def dump(self) -> list:
+        """
+        Return the cached values as (key, value, expires_at, stale_until)
+        tuples, with the times as unix timestamps, so that they can be
+        stored outside of this process. Cached errors are not included.
+        """
+        offset = time.time() - time.monotonic()
+        with self._lock:
+            return [
+                (key, entry.value, entry.expires_at + offset, entry.stale_until + offset)
+                for key, entry in self._entries.items()
+                if entry.error is None
+            ]
+
+    def restore(self, entries) -> int:
+        """
+        Load entries that were created by dump(). Entries that have
+        expired are served as stale (and refreshed on first use) until
+        their stale period has passed as well. Returns the number of
+        entries that were restored.
+        """
+        offset = time.time() - time.monotonic()
+        now = time.monotonic()
+        restored = 0
+        for key, value, expires_at, stale_until in entries:
+            if stale_until - offset <= now:
+                continue
+            self._store(key, _CacheEntry(value, expires_at - offset, stale_until - offset))
+            restored += 1
+        return restored
+
+    def invalidate(self, key):
+        """
+        Remove a single key from the cache.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self):
+        """
+        Remove all entries from the cache.
+        """
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _load(self, key, loader, pending: _PendingLoad):
+        try:
+            result = loader()
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            pending.error = err
+            with self._lock:
+                self.stats.load_errors += 1
+            self.store_error(key, err)
+        else:
+            pending.value = self.store_result(key, result)
+        finally:
+            with self._lock:
+                del self._pending[key]
+            pending.done.set()
+
+    def _refresh(self, key, loader):
+        with self._lock:
+            pending = self._pending[key]
+            self.stats.refreshes += 1
+        self._load(key, loader, pending)
+        if pending.error is not None:
+            logger.warning(
+                "Could not refresh cached value for %s: %s: %s",
+                key,
+                pending.error.__class__.__name__,
+                pending.error,
+            )
+
+
+def ttl_cache(ttl, maxsize=1024, stale_ttl=0):
+    """
+    Caching decorator that will cache the result of an operation for 'ttl' seconds.
+    The underlying TTLCache is available as the 'cache' attribute of the
+    decorated function.
+    """
+
+    def decorator(func):
+        cache = TTLCache(ttl, maxsize=maxsize, stale_ttl=stale_ttl)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            # Create the cache key from the args and kwargs.
+            cache_key = args
+            if kwargs:
+                cache_key += tuple((kwargs.items()))
+            return cache.get_or_load(cache_key, lambda: func(*args, **kwargs))
+
+        wrapper.cache = cache
+        return wrapper
+
+    return decorator
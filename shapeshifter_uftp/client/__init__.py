@@ -1,5 +1,13 @@
 from .agr_cro_client import ShapeshifterAgrCroClient
 from .agr_dso_client import ShapeshifterAgrDsoClient
+from .async_client import (
+    AsyncShapeshifterAgrCroClient,
+    AsyncShapeshifterAgrDsoClient,
+    AsyncShapeshifterCroAgrClient,
+    AsyncShapeshifterCroDsoClient,
+    AsyncShapeshifterDsoAgrClient,
+    AsyncShapeshifterDsoCroClient,
+)
 from .cro_agr_client import ShapeshifterCroAgrClient
 from .cro_dso_client import ShapeshifterCroDsoClient
 from .dso_agr_client import ShapeshifterDsoAgrClient
@@ -11,10 +19,35 @@ __all__ = [
     "ShapeshifterCroAgrClient",
     "ShapeshifterCroDsoClient",
     "ShapeshifterDsoAgrClient",
-    "ShapeshifterDsoCroClient"
+    "ShapeshifterDsoCroClient",
+    "AsyncShapeshifterAgrCroClient",
+    "AsyncShapeshifterAgrDsoClient",
+    "AsyncShapeshifterCroAgrClient",
+    "AsyncShapeshifterCroDsoClient",
+    "AsyncShapeshifterDsoAgrClient",
+    "AsyncShapeshifterDsoCroClient",
 ]
 
 client_map = {
     (client.sender_role, client.recipient_role): client
-    for client in [globals()[name] for name in __all__]
+    for client in [
+        ShapeshifterAgrCroClient,
+        ShapeshifterAgrDsoClient,
+        ShapeshifterCroAgrClient,
+        ShapeshifterCroDsoClient,
+        ShapeshifterDsoAgrClient,
+        ShapeshifterDsoCroClient,
+    ]
+}
+
+async_client_map = {
+    (client.sender_role, client.recipient_role): client
+    for client in [
+        AsyncShapeshifterAgrCroClient,
+        AsyncShapeshifterAgrDsoClient,
+        AsyncShapeshifterCroAgrClient,
+        AsyncShapeshifterCroDsoClient,
+        AsyncShapeshifterDsoAgrClient,
+        AsyncShapeshifterDsoCroClient,
+    ]
 }
@@ -52,7 +52,7 @@ class ShapeshifterAgrDsoClient(ShapeshifterClient):
         sure that it can actually provide the flexibility offered across all of
         its FlexOffers.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_offer_revocation(self, message: FlexOfferRevocation) -> None:
         """
@@ -61,13 +61,13 @@ class ShapeshifterAgrDsoClient(ShapeshifterClient):
         time has not yet expired. Revocation is not allowed for FlexOffers that
         already have associated accepted FlexOrders.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_order_response(self, message: FlexOrderResponse) -> None:
         """
         Confirm the flex order.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_settlement_response(self, message: FlexSettlementResponse) -> None:
         """
@@ -77,16 +77,16 @@ class ShapeshifterAgrDsoClient(ShapeshifterClient):
         rejected, the DSO should consider all FlexOrderSettlement elements of
         that message related to potential dispute.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_reservation_update_response(self, message: FlexReservationUpdateResponse) -> None:
         """
         Confirm the flex reservation update.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_metering(self, message: Metering) -> None:
         """
         Send metering data to the DSO.
         """
-        self._send_message(message)
+        return self._send_message(message)
@@ -0,0 +1,262 @@
+"""
+Asyncio variants of the Shapeshifter clients.
+
+These clients have the same send_* methods as their threaded
+counterparts, but every method returns an awaitable and the HTTP
+request is performed on a non-blocking httpx connection pool. This
+allows a single event loop to deliver messages to many participants
+concurrently:
+
+    async with AsyncShapeshifterDsoAgrClient(...) as client:
+        await client.send_flex_request(message)
+
+Messages that are queued for delivery are sent in a task on the
+running event loop, and are retried with the same exponential backoff
+as the threaded clients.
+
+The async clients require the optional httpx dependency, which is
+installed with ``pip install shapeshifter-uftp[async]``.
+"""
+import asyncio
+import functools
+import inspect
+from collections.abc import Coroutine
+from typing import Any
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover
+    httpx = None
+
+from ..logging import logger
+from ..oauth import PassthroughOAuthClient
+from ..uftp import PayloadMessage
+from .agr_cro_client import ShapeshifterAgrCroClient
+from .agr_dso_client import ShapeshifterAgrDsoClient
+from .base_client import ShapeshifterClient
+from .cro_agr_client import ShapeshifterCroAgrClient
+from .cro_dso_client import ShapeshifterCroDsoClient
+from .dso_agr_client import ShapeshifterDsoAgrClient
+from .dso_cro_client import ShapeshifterDsoCroClient
+
+
+class AsyncShapeshifterClient(ShapeshifterClient):
+    """
+    Basis for all asyncio Shapeshifter clients.
+    """
+
+    max_connections = 100
+    max_keepalive_connections = 20
+    keepalive_expiry = 300.0
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # The send_* methods of the threaded clients return what
+        # _send_message returns, which is a coroutine here. They are
+        # wrapped in coroutine functions, so that they are recognized
+        # (and annotated) as such.
+        for name, method in inspect.getmembers(cls, inspect.isfunction):
+            if name.startswith("send_") and not inspect.iscoroutinefunction(method):
+                setattr(cls, name, _coroutine_method(method))
+
+    def __init__(self, *args, **kwargs):
+        if httpx is None:
+            raise ImportError(
+                "The async Shapeshifter clients require httpx. "
+                "Install it using 'pip install shapeshifter-uftp[async]'."
+            )
+        super().__init__(*args, **kwargs)
+        self.http_client = None
+        self.auth_lock = None
+
+        # The tasks that deliver queued messages, and the ones among
+        # them that are waiting for a retry.
+        self.delivery_tasks = set()
+        self.retrying_tasks = set()
+
+    def _send_message(self, message: PayloadMessage) -> Coroutine[Any, Any, None]:
+        """
+        Return a coroutine that delivers the message to the recipient.
+        """
+        return self._deliver_message(message)
+
+    async def _deliver_message(self, message: PayloadMessage) -> None:
+        """
+        Seal the message and deliver it to the recipient without
+        blocking the event loop. Sealing the message and obtaining
+        an OAuth token are done on the default executor.
+        """
+        loop = asyncio.get_running_loop()
+        serialized_message = await loop.run_in_executor(None, self._prepare_message, message)
+        await self._ensure_authenticated()
+
+        response = await self._get_http_client().post(
+            self.recipient_endpoint,
+            content=serialized_message,
+            headers=self._request_headers(),
+        )
+        self._check_response(response)
+
+    async def _ensure_authenticated(self):
+        """
+        Obtain an OAuth token if we don't have a valid one. The token
+        request is blocking, so it runs on the default executor, and
+        concurrent sends wait for the same request.
+        """
+        if isinstance(self.oauth_client, PassthroughOAuthClient) or self.oauth_client.authenticated:
+            return
+        if self.auth_lock is None:
+            self.auth_lock = asyncio.Lock()
+        async with self.auth_lock:
+            if not self.oauth_client.authenticated:
+                await asyncio.get_running_loop().run_in_executor(None, self.oauth_client.authenticate)
+
+    def _get_http_client(self) -> "httpx.AsyncClient":
+        """
+        Create the pooled http client on first use, so that it is
+        bound to the event loop that actually sends the messages.
+        """
+        if self.http_client is None:
+            self.http_client = httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry,
+                ),
+                timeout=self.request_timeout,
+            )
+        return self.http_client
+
+    def _queue_message(self, message, callback, attempt=1):
+        """
+        Deliver the message in a task on the running event loop, and
+        call the callback with the response once it was delivered.
+        """
+        if self._closed:
+            raise RuntimeError("The client has been closed")
+        task = asyncio.get_running_loop().create_task(self._deliver_queued_message(message, callback, attempt))
+        self.delivery_tasks.add(task)
+        task.add_done_callback(self.delivery_tasks.discard)
+
+    async def _deliver_queued_message(self, message, callback, attempt):
+        while True:
+            try:
+                response = await self._send_message(message)
+                break
+            except Exception as exc:  # pylint: disable=broad-exception-caught
+                if self._closed or attempt > self.num_delivery_attempts:
+                    logger.error(
+                        "Could not deliver %s to %s at %s after %d attempts.",
+                        message.__class__.__name__,
+                        self.recipient_role,
+                        self.recipient_domain,
+                        attempt,
+                    )
+                    return
+                delay_time = self.exponential_retry_factor * self.exponential_retry_base**attempt
+                logger.warning(
+                    "Outgoing message %s to %s could not be delivered due to a %s, "
+                    "will try again in %.0f seconds.",
+                    message.__class__.__name__,
+                    message.recipient_domain,
+                    exc.__class__.__name__,
+                    delay_time,
+                )
+            task = asyncio.current_task()
+            self.retrying_tasks.add(task)
+            try:
+                await asyncio.sleep(delay_time)
+            except asyncio.CancelledError:
+                logger.warning(
+                    "Not retrying %s to %s, because the client was closed.",
+                    message.__class__.__name__,
+                    self.recipient_domain,
+                )
+                raise
+            finally:
+                self.retrying_tasks.discard(task)
+            attempt += 1
+
+        try:
+            callback(response)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            logger.error(
+                "There was an exception during the callback for a %s message: %s: %s",
+                message.__class__.__name__,
+                err.__class__.__name__,
+                err,
+            )
+
+    def has_pending_messages(self) -> bool:
+        """
+        Return whether there are queued messages that have not been
+        delivered yet, including messages that wait for a retry.
+        """
+        return bool(self.delivery_tasks)
+
+    async def aclose(self):
+        """
+        Wait for the queued messages that are being delivered, and
+        close the pooled connections of this client. Messages that are
+        waiting for a retry are dropped, and queueing messages after
+        closing raises a RuntimeError.
+        """
+        self._closed = True
+        for task in self.retrying_tasks:
+            task.cancel()
+        if self.delivery_tasks:
+            await asyncio.gather(*self.delivery_tasks, return_exceptions=True)
+        if self.http_client is not None:
+            await self.http_client.aclose()
+            self.http_client = None
+        self.auth_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args, **kwargs):
+        await self.aclose()
+
+
+def _coroutine_method(method):
+    @functools.wraps(method)
+    async def wrapper(self, *args, **kwargs):
+        return await method(self, *args, **kwargs)
+
+    return wrapper
+
+
+class AsyncShapeshifterAgrCroClient(AsyncShapeshifterClient, ShapeshifterAgrCroClient):
+    """
+    Asyncio client that allows the Aggregator to connect to the CRO.
+    """
+
+
+class AsyncShapeshifterAgrDsoClient(AsyncShapeshifterClient, ShapeshifterAgrDsoClient):
+    """
+    Asyncio client that allows the Aggregator to connect to the DSO.
+    """
+
+
+class AsyncShapeshifterCroAgrClient(AsyncShapeshifterClient, ShapeshifterCroAgrClient):
+    """
+    Asyncio client that allows the CRO to connect to the Aggregator.
+    """
+
+
+class AsyncShapeshifterCroDsoClient(AsyncShapeshifterClient, ShapeshifterCroDsoClient):
+    """
+    Asyncio client that allows the CRO to connect to the DSO.
+    """
+
+
+class AsyncShapeshifterDsoAgrClient(AsyncShapeshifterClient, ShapeshifterDsoAgrClient):
+    """
+    Asyncio client that allows the DSO to connect to the Aggregator.
+    """
+
+
+class AsyncShapeshifterDsoCroClient(AsyncShapeshifterClient, ShapeshifterDsoCroClient):
+    """
+    Asyncio client that allows the DSO to connect to the CRO.
+    """
@@ -1,23 +1,24 @@
+import logging
 import sched
 import time
 from datetime import datetime, timezone
 from queue import Queue
-from threading import Event, Thread
+from threading import Event, Lock, Thread, current_thread
 from uuid import uuid4
 
-import requests
-
 from .. import transport
 from ..exceptions import ClientTransportException
+from ..keys import SigningKey
 from ..logging import logger
 from ..oauth import OAuthClient, PassthroughOAuthClient
+from ..streaming import MessageWriter
 from ..uftp import (
     PayloadMessage,
-    SignedMessage,
     TestMessage,
     TestMessageResponse,
     UsefRole,
 )
+from .sessions import SessionPool, default_session_pool
 
 
 class ShapeshifterClient:
@@ -36,17 +37,18 @@ class ShapeshifterClient:
     def __init__(
         self,
         sender_domain: str,
-        signing_key: str,
+        signing_key: str | SigningKey,
         recipient_domain: str,
         recipient_endpoint: str | None = None,
         recipient_signing_key: str | None = None,
         oauth_client: OAuthClient | None = None,
-        version: str = "3.1.0"
+        version: str = "3.1.0",
+        session_pool: SessionPool | None = None,
     ):
         """
         Shapeshifter client class that allows you to initiate messages to a different party.
         :param str sender_domain: your sender domain
-        :param str signing_key:   your private signing key
+        :param str signing_key:   your private signing key, base64-encoded or as a SigningKey
         :param str recipient_domain:   the domain of the recipient
         :param str recipient_endpoint: the full http endpoint URL of the recipient. If omitted,
                                        will look up the endpoint using DNS.
@@ -54,6 +56,8 @@ class ShapeshifterClient:
                                               look up the signing key using DNS.
         :param OAuthClient oauth_client: Optional OAuth client instance for using oauth to authenticate outgoing messages.
         :param str version: Version number for the shapeshfter protocol (3.0.0 or 3.1.0)
+        :param SessionPool session_pool: Optional pool of keep-alive HTTP sessions. If omitted,
+                                         the pool that is shared by all clients is used.
         """
         if recipient_domain is None and recipient_endpoint is None:
             raise ValueError(
@@ -70,6 +74,11 @@ class ShapeshifterClient:
         self.recipient_endpoint = recipient_endpoint
         self.recipient_signing_key = recipient_signing_key
 
+        # Outgoing requests reuse pooled keep-alive connections to
+        # the recipient's endpoint, which saves a TCP and TLS
+        # handshake for every message.
+        self.session_pool = session_pool if session_pool is not None else default_session_pool
+
         # The outgoing queue and scheduler are used when queueing
         # messages for delivery later. This allows the Shapeshifter
         # UFTP client to handle message retries on an exponential
@@ -80,6 +89,8 @@ class ShapeshifterClient:
         self.scheduler = sched.scheduler(time.monotonic, time.sleep)
         self.scheduler_event = Event()
         self.scheduler_thread = None
+        self._closed = False
+        self._lock = Lock()
 
         if oauth_client:
             self.oauth_client = oauth_client
@@ -90,12 +101,18 @@ class ShapeshifterClient:
     #                        Test Messages                         #
     # ------------------------------------------------------------ #
     def send_test_message(self, message: TestMessage | None = None):
+        """
+        Send a TestMessage to check the connection to the recipient.
+        """
         if message is None:
             message = TestMessage()
 
         return self._send_message(message)
 
     def send_test_message_response(self, message: TestMessageResponse):
+        """
+        Answer a TestMessage of the recipient.
+        """
         return self._send_message(message)
 
     def _send_message(self, message: PayloadMessage) -> None:
@@ -107,7 +124,26 @@ class ShapeshifterClient:
         actual response always arrives asynchronously on your service
         (which runs separately).
         """
-        if not isinstance(message, PayloadMessage):
+        serialized_message = self._prepare_message(message)
+
+        # Send the request to the relevant endpoint
+        session = self.session_pool.get(self.recipient_endpoint)
+        with self.oauth_client.ensure_authenticated():
+            response = session.post(
+                self.recipient_endpoint,
+                data=serialized_message,
+                headers=self._request_headers(),
+                timeout=self.request_timeout,
+            )
+        self._check_response(response)
+
+    def _prepare_message(self, message: PayloadMessage | MessageWriter) -> bytes:
+        """
+        Fill in the common fields of the message, seal it and wrap it
+        in a serialized SignedMessage that is ready to be sent. The
+        message can also be a streaming MessageWriter.
+        """
+        if not isinstance(message, (PayloadMessage, MessageWriter)):
             raise TypeError(
                 f"'message' must be a (subclass of) PayloadMessage, you provided: {type(message)}"
             )
@@ -126,35 +162,32 @@ class ShapeshifterClient:
         message.message_id = message.message_id or str(uuid4())
         message.conversation_id = message.conversation_id or str(uuid4())
 
-        logger.info(f"The PayloadMessage is: {message}")
+        logger.info(
+            "Sending a %s to %s at %s", message.__class__.__name__, self.recipient_role, self.recipient_domain
+        )
+        logger.debug("The PayloadMessage is: %s", message)
 
         # Seal the message using our own private signing key
         sealed_message = transport.seal_message(message, self.signing_key)
 
-        # Pack up the message into a SignedMessage
-        signed_message = SignedMessage(
-            sender_domain=self.sender_domain,
-            sender_role=self.sender_role,
-            body=sealed_message,
-        )
+        # Pack up the message into a serialized SignedMessage
+        serialized_message = transport.to_signed_xml(self.sender_domain, self.sender_role, sealed_message)
 
-        # Serialize the message into an XML blob
-        serialized_message = transport.to_xml(signed_message)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Sending message to %s:\n%s", self.recipient_endpoint, serialized_message.decode())
+        return serialized_message
 
-        logger.debug(f"Sending message to {self.recipient_endpoint}:")
-        logger.debug(serialized_message)
+    def _request_headers(self) -> dict:
+        return {
+            "Content-Type": "text/xml; charset=utf-8",
+            **self.oauth_client.auth_header
+        }
 
-        # Send the request to the relevant endpoint
-        with self.oauth_client.ensure_authenticated():
-            response = requests.post(
-                self.recipient_endpoint,
-                data=serialized_message,
-                headers={
-                    "Content-Type": "text/xml; charset=utf-8",
-                    **self.oauth_client.auth_header
-                },
-                timeout=self.request_timeout,
-            )
+    def _check_response(self, response):
+        """
+        Raise a ClientTransportException if the recipient did not
+        accept the message.
+        """
         if response.status_code != 200:
             error_msg = (
                 f"Request to {self.recipient_endpoint} was not succesful: "
@@ -169,47 +202,118 @@ class ShapeshifterClient:
     # ------------------------------------------------------------ #
 
     def _queue_message(self, message, callback, attempt=1):
-        self.outgoing_queue.put((message, callback, attempt))
-        self._run_outgoing_workers()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("The client has been closed")
+            self.outgoing_queue.put((message, callback, attempt))
+            self._run_outgoing_workers()
+
+    def _retry_message(self, message, callback, attempt):
+        """
+        Queue a message again after its retry delay, unless the client
+        was closed in the meantime.
+        """
+        try:
+            self._queue_message(message, callback, attempt)
+        except RuntimeError:
+            logger.warning(
+                "Not retrying %s to %s, because the client was closed.",
+                message.__class__.__name__,
+                self.recipient_domain,
+            )
+
+    def has_pending_messages(self) -> bool:
+        """
+        Return whether there are queued messages that have not been
+        delivered yet, including messages that wait for a retry.
+        """
+        return self.outgoing_queue.unfinished_tasks > 0 or not self.scheduler.empty()
+
+    def close(self):
+        """
+        Stop the outgoing workers and the scheduler thread, and wait
+        for them to finish. Queued messages are delivered first, but
+        messages that are waiting for a retry are dropped, and failed
+        deliveries are not retried. Queueing messages after closing
+        raises a RuntimeError.
+        """
+        with self._lock:
+            self._closed = True
+            for event in self.scheduler.queue:
+                try:
+                    self.scheduler.cancel(event)
+                except ValueError:
+                    # The event has just been run.
+                    pass
+            workers, self.outgoing_workers = self.outgoing_workers, None
+            scheduler_thread, self.scheduler_thread = self.scheduler_thread, None
+            for _ in workers or []:
+                self.outgoing_queue.put(None)
+        self.scheduler_event.set()
+
+        for thread in [*(workers or []), scheduler_thread]:
+            if thread is not None and thread is not current_thread():
+                thread.join()
 
     def _outgoing_worker(self):
         while True:
-            message, callback, attempt = self.outgoing_queue.get()
+            item = self.outgoing_queue.get()
+            if item is None:
+                # The client was closed.
+                self.outgoing_queue.task_done()
+                return
+            message, callback, attempt = item
             try:
                 response = self._send_message(message)
             except Exception as exc:  # pylint: disable=broad-exception-caught
-                if attempt <= self.num_delivery_attempts:
+                if self._closed:
+                    logger.warning(
+                        "Outgoing message %s to %s could not be delivered due to a %s, "
+                        "and is not retried because the client was closed.",
+                        message.__class__.__name__,
+                        message.recipient_domain,
+                        exc.__class__.__name__,
+                    )
+                elif attempt <= self.num_delivery_attempts:
                     # Reschedule with exponential backoff
                     delay_time = (
                         self.exponential_retry_factor
                         * self.exponential_retry_base**attempt
                     )
                     logger.warning(
-                        f"Outgoing message {message.__class__.__name__} to "
-                        f"{message.recipient_domain} could not be delivered "
-                        f"due to a {exc.__class__.__name__}, will try again in {delay_time:.0f} seconds."
-                    )
-                    self.scheduler.enter(
-                        delay=delay_time,
-                        priority=1,
-                        action=self._queue_message,
-                        argument=((message, callback, attempt + 1)),
+                        "Outgoing message %s to %s could not be delivered due to a %s, "
+                        "will try again in %.0f seconds.",
+                        message.__class__.__name__,
+                        message.recipient_domain,
+                        exc.__class__.__name__,
+                        delay_time,
                     )
-                    self._run_scheduler()
+                    with self._lock:
+                        if not self._closed:
+                            self.scheduler.enter(
+                                delay=delay_time,
+                                priority=1,
+                                action=self._retry_message,
+                                argument=((message, callback, attempt + 1)),
+                            )
+                            self._run_scheduler()
                 else:
                     logger.error(
-                        f"Could not deliver {message.__class__.__name__} "
-                        f"to {self.recipient_role} at {self.recipient_domain}, "
-                        f"even after {self.num_delivery_attempts} attempts."
+                        "Could not deliver %s to %s at %s, even after %d attempts.",
+                        message.__class__.__name__,
+                        self.recipient_role,
+                        self.recipient_domain,
+                        self.num_delivery_attempts,
                     )
             else:
                 try:
                     callback(response)
                 except Exception as err:  # pylint: disable=broad-exception-caught
                     logger.error(
-                        "There was an exception during the callback "
-                        f"for a {message.__class__.__name__} message: "
-                        f"{err.__class__.__name__}: {err}"
+                        "There was an exception during the callback for a %s message: %s: %s",
+                        message.__class__.__name__,
+                        err.__class__.__name__,
+                        err,
                     )
             finally:
                 self.outgoing_queue.task_done()
@@ -228,10 +332,17 @@ class ShapeshifterClient:
         Intended to run the python scheduler in a background thread.
         You can wake it up anytime by setting the scheduler event.
         """
+        timeout = None
         while True:
-            self.scheduler_event.wait()
+            self.scheduler_event.wait(timeout)
             self.scheduler_event.clear()
-            self.scheduler.run()
+            if self.scheduler_thread is not current_thread():
+                # The client was closed.
+                return
+            # Run the events that are due, and sleep until the next one
+            # (or until we are woken up), so that closing the client
+            # does not have to wait for the next retry.
+            timeout = self.scheduler.run(blocking=False)
 
     def _run_outgoing_workers(self):
         """
@@ -15,11 +15,11 @@ class ShapeshifterCroAgrClient(ShapeshifterClient):
         The DSOPortfolioUpdate is used by the DSO to indicate on which
         congestion points it wants to engage in flexibility trading.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_agr_portfolio_query_response(self, message: AgrPortfolioQueryResponse) -> None:
         """
         DSOPortfolioQuery is used by DSOs to discover which AGRs represent
         connections on its registered congestion point(s).
         """
-        self._send_message(message)
+        return self._send_message(message)
@@ -1,3 +1,4 @@
+from ..streaming import FlexSettlementWriter
 from ..uftp import (
     DPrognosisResponse,
     FlexOfferResponse,
@@ -24,7 +25,7 @@ class ShapeshifterDsoAgrClient(ShapeshifterClient):
         """
         Confirm reception of the D-prognosis.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_request(self, message: FlexRequest) -> None:
         """
@@ -34,13 +35,13 @@ class ShapeshifterDsoAgrClient(ShapeshifterClient):
         message should also include the remaining ISPs for the current period
         where Disposition=Available.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_offer_response(self, message: FlexOfferResponse) -> None:
         """
         Confirm reception of a flex offer.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_order(self, message: FlexOrder) -> None:
         """
@@ -53,7 +54,7 @@ class ShapeshifterDsoAgrClient(ShapeshifterClient):
         (and must) reject FlexOrder messages where the ISP list is not exactly
         the same as offered.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_reservation_update(self, message: FlexReservationUpdate) -> None:
         """
@@ -64,16 +65,17 @@ class ShapeshifterDsoAgrClient(ShapeshifterClient):
         power is still reserved. Zero power means that no power is reserved for
         that ISP and the sign of the power indicates the direction.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
-    def send_flex_settlement(self, message: FlexSettlement) -> None:
+    def send_flex_settlement(self, message: FlexSettlement | FlexSettlementWriter) -> None:
         """
         The FlexSettlement message is sent by DSOs on a regular basis
         (typically monthly) to AGRs, in order to initiate settlement.
         It includes a list of all FlexOrders placed by the
-        originating party during the settlement period.
+        originating party during the settlement period. Large
+        settlements can be built with a streaming FlexSettlementWriter.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_flex_offer_revocation_response(self, message: FlexOfferRevocationResponse) -> None:
         """
@@ -81,10 +83,10 @@ class ShapeshifterDsoAgrClient(ShapeshifterClient):
         receiving implementation must reply with a FlexOfferRevocationResponse,
         indicating whether the revocation was handled successfully.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_metering_response(self, message: MeteringResponse) -> None:
         """
         Confirm reception of metering data.
         """
-        self._send_message(message)
+        return self._send_message(message)
@@ -15,11 +15,11 @@ class ShapeshifterDsoCroClient(ShapeshifterClient):
         The DSOPortfolioUpdate is used by the DSO to indicate on which
         congestion points it wants to engage in flexibility trading.
         """
-        self._send_message(message)
+        return self._send_message(message)
 
     def send_dso_portfolio_query(self, message: DsoPortfolioQuery) -> None:
         """
         DSOPortfolioQuery is used by DSOs to discover which AGRs represent
         connections on its registered congestion point(s).
         """
-        self._send_message(message)
+        return self._send_message(message)
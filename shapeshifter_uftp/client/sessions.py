@@ -0,0 +1,136 @@
+"""
+Pooled, keep-alive HTTP sessions for outgoing messages.
+
+Every recipient endpoint (scheme, host and port) gets its own
+requests.Session with a bounded connection pool, so that consecutive
+messages to the same participant reuse their TCP and TLS connections
+instead of performing a new handshake for every message. Sessions that
+have not been used for a while are closed and evicted.
+
+The sessions are shared by all clients that send to the same endpoint,
+which may be on behalf of different sender domains or OAuth
+credentials. The sessions therefore never store cookies, so that a
+cookie that was set in the response to one client is not sent along
+with the requests of another.
+"""
+import time
+from http.cookiejar import DefaultCookiePolicy
+from threading import Lock
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class SessionPool:
+    """
+    Thread-safe registry of keep-alive sessions, one per recipient
+    endpoint.
+    """
+
+    def __init__(
+        self,
+        pool_maxsize: int = 10,
+        pool_block: bool = True,
+        idle_timeout: float = 300.0,
+    ):
+        """
+        :param int pool_maxsize: the maximum number of connections that
+                                 are kept open to a single endpoint.
+        :param bool pool_block: if True, requests wait for a free
+                                connection when the pool is exhausted,
+                                instead of opening extra throwaway
+                                connections.
+        :param float idle_timeout: the number of seconds after which an
+                                   unused session is closed and evicted.
+        """
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+        self.idle_timeout = idle_timeout
+        self._sessions = {}
+        self._lock = Lock()
+
+    def get(self, url: str) -> requests.Session:
+        """
+        Return the session for the endpoint that the given URL
+        belongs to, creating it if required.
+        """
+        origin = endpoint_origin(url)
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            if origin in self._sessions:
+                session, _ = self._sessions[origin]
+            else:
+                session = self._create_session()
+            self._sessions[origin] = (session, now)
+        return session
+
+    def evict_idle(self):
+        """
+        Close and remove all sessions that have been idle for longer
+        than the idle timeout.
+        """
+        with self._lock:
+            self._evict_idle(time.monotonic())
+
+    def close(self):
+        """
+        Close all sessions and their connections.
+        """
+        with self._lock:
+            for session, _ in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def _evict_idle(self, now: float):
+        expired = [
+            origin
+            for origin, (_, last_used) in self._sessions.items()
+            if now - last_used > self.idle_timeout
+        ]
+        for origin in expired:
+            session, _ = self._sessions.pop(origin)
+            session.close()
+
+    def _create_session(self) -> requests.Session:
+        adapter = HTTPAdapter(
+            pool_connections=1,
+            pool_maxsize=self.pool_maxsize,
+            pool_block=self.pool_block,
+        )
+        session = requests.Session()
+        session.cookies.set_policy(RejectAllCookiesPolicy())
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        return session
+
+
+class RejectAllCookiesPolicy(DefaultCookiePolicy):
+    """
+    Cookie policy that neither stores nor sends any cookies.
+    """
+
+    def set_ok(self, cookie, request):
+        return False
+
+    def return_ok(self, cookie, request):
+        return False
+
+
+def endpoint_origin(url: str) -> tuple:
+    """
+    Return the (scheme, host, port) combination that identifies the
+    connection pool for the given URL.
+    """
+    parts = urlsplit(url)
+    return (parts.scheme, parts.hostname, parts.port)
+
+
+# The default pool is shared by all clients that were not given a
+# pool of their own, so that different client objects talking to the
+# same participant share their connections.
+default_session_pool = SessionPool()
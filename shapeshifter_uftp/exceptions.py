@@ -44,8 +44,9 @@ class InvalidContentTypeException(TransportException):
 
 class TooManyRequestsException(TransportException):
     """
-    Raised when the originating IP address is making too many requests
-    to the service.
+    Raised when the originating IP address or sender is making too many
+    requests to the service, or when the service is too busy to accept
+    more messages.
     """
 
     http_status_code = 429
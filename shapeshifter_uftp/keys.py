@@ -0,0 +1,209 @@
+"""
+Decoded key material for signing and verifying messages.
+
+Keys are passed around as base64 strings: in the configuration, in DNS
+and from key lookup functions. Instead of decoding (and validating)
+them again for every message, this module decodes each key once into
+a SigningKey or VerifyKey object. The seal and unseal functions in
+transport accept these objects directly, as well as the strings, which
+are then looked up in a cache of decoded keys.
+
+Services keep the verify key of every participant in a KeyStore. When
+the key lookup returns a different key for a participant (because the
+participant rotated their keys), it replaces the old one.
+"""
+from base64 import b64decode, b64encode
+from binascii import Error as BinAsciiError
+from collections import OrderedDict
+from threading import Lock
+
+from .logging import logger
+
+# The maximum number of decoded keys that are kept, both in the cache
+# for base64 strings and in a KeyStore.
+KEY_CACHE_SIZE = 4096
+
+
+class Key:
+    """
+    Base class for decoded Ed25519 keys. The raw bytes are used for
+    signing or verifying, the encoded form is the base64 string that
+    the key was created from.
+    """
+
+    __slots__ = ("raw", "encoded")
+
+    length = None
+
+    def __init__(self, raw: bytes, encoded: str | None = None):
+        if not isinstance(raw, bytes):
+            raise TypeError(f"'raw' must be of type 'bytes', not {type(raw)}")
+        if len(raw) != self.length:
+            raise ValueError(
+                f"A {self.__class__.__name__} must be {self.length} bytes long, not {len(raw)}"
+            )
+        self.raw = raw
+        self.encoded = encoded or b64encode(raw).decode()
+
+    @classmethod
+    def from_base64(cls, encoded: str | bytes):
+        """
+        Decode and validate a base64-encoded key.
+        """
+        if not isinstance(encoded, (str, bytes)):
+            raise TypeError(f"The key must be of type 'str', not {type(encoded)}")
+        try:
+            raw = b64decode(encoded)
+        except BinAsciiError as exc:
+            raise ValueError(f"The key is not valid base64: {exc}") from exc
+        if isinstance(encoded, bytes):
+            encoded = encoded.decode("ascii")
+        return cls(raw, encoded)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.raw == self.raw
+
+    def __hash__(self):
+        return hash((type(self), self.raw))
+
+    def __str__(self):
+        return self.encoded
+
+
+class SigningKey(Key):
+    """
+    A private Ed25519 signing key, as a 64-byte secret key.
+    """
+
+    __slots__ = ()
+
+    length = 64
+
+    @property
+    def verify_key(self) -> "VerifyKey":
+        """
+        The public key that belongs to this signing key.
+        """
+        return VerifyKey(self.raw[32:])
+
+    def __repr__(self):
+        # Never show the private key itself.
+        return f"<SigningKey for {self.verify_key.encoded}>"
+
+
+class VerifyKey(Key):
+    """
+    A public Ed25519 verify key.
+    """
+
+    __slots__ = ()
+
+    length = 32
+
+    def __repr__(self):
+        return f"<VerifyKey {self.encoded}>"
+
+
+_decoded_keys = {}
+_decoded_keys_lock = Lock()
+
+
+def _decode(key_class, key):
+    if isinstance(key, key_class):
+        return key
+    if isinstance(key, Key):
+        raise TypeError(f"Expected a {key_class.__name__}, not a {key.__class__.__name__}")
+    decoded = _decoded_keys.get((key_class, key))
+    if decoded is None:
+        decoded = key_class.from_base64(key)
+        remember(decoded, key)
+    return decoded
+
+
+def remember(key: Key, encoded: str | bytes | None = None):
+    """
+    Add a decoded key to the cache, so that its base64 string does not
+    have to be decoded again.
+    """
+    with _decoded_keys_lock:
+        if len(_decoded_keys) >= KEY_CACHE_SIZE:
+            _decoded_keys.clear()
+        _decoded_keys[(type(key), encoded or key.encoded)] = key
+
+
+def signing_key(key: str | bytes | SigningKey) -> SigningKey:
+    """
+    Return the SigningKey for a base64-encoded private key, decoding
+    it only the first time.
+    """
+    return _decode(SigningKey, key)
+
+
+def verify_key(key: str | bytes | VerifyKey) -> VerifyKey:
+    """
+    Return the VerifyKey for a base64-encoded public key, decoding it
+    only the first time.
+    """
+    return _decode(VerifyKey, key)
+
+
+class KeyStore:
+    """
+    Thread-safe store of the decoded verify keys of participants, by
+    (domain, role).
+    """
+
+    def __init__(self, maxsize: int = KEY_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._keys = OrderedDict()
+        self._lock = Lock()
+
+    def verify_key(self, domain: str, role, key: str | VerifyKey) -> VerifyKey:
+        """
+        Return the decoded verify key for the participant. If the given
+        key differs from the one that is stored for the participant,
+        the new key replaces the old one.
+        """
+        participant = (domain, str(role))
+        current = self._keys.get(participant)
+        if current is not None and (current is key or current.encoded == key):
+            return current
+
+        new_key = verify_key(key)
+        with self._lock:
+            self._keys[participant] = new_key
+            self._keys.move_to_end(participant)
+            while len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+        if current is not None and current != new_key:
+            logger.info("The public key of %s at %s has changed", role, domain)
+        return new_key
+
+    def get(self, domain: str, role) -> VerifyKey | None:
+        """
+        Return the stored verify key for the participant, if any.
+        """
+        return self._keys.get((domain, str(role)))
+
+    def invalidate(self, domain: str, role=None):
+        """
+        Remove the keys of a participant, for one role or for all roles.
+        """
+        with self._lock:
+            for participant in list(self._keys):
+                if participant[0] == domain and (role is None or participant[1] == str(role)):
+                    del self._keys[participant]
+
+    def clear(self):
+        """
+        Remove all keys.
+        """
+        with self._lock:
+            self._keys.clear()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, participant):
+        domain, role = participant
+        return (domain, str(role)) in self._keys
@@ -1,4 +1,19 @@
+"""
+Logging for shapeshifter-uftp.
+
+All messages are logged to the "shapeshifter-uftp" logger. Its level
+defaults to INFO and can be set with the SHAPESHIFTER_LOG_LEVEL
+environment variable, or with configure_logging(). The log format can
+be "color" (the default), "json" for structured logs, or "none" to
+leave the output to the handlers of your own application, and can be
+set with the SHAPESHIFTER_LOG_FORMAT environment variable.
+
+Messages are formatted lazily, so logging below the configured level
+costs next to nothing.
+"""
+import json
 import logging
+import os
 from datetime import datetime
 
 from termcolor import colored
@@ -11,27 +26,80 @@ color_map = {
     logging.CRITICAL: "magenta",
 }
 
+def _timestamp(record) -> str:
+    # The UTC offset is determined for every record, so that it follows
+    # daylight saving time.
+    return datetime.fromtimestamp(record.created).astimezone().isoformat()
+
 
 class ShapeshifterLogFormatter(logging.Formatter):
     """
     Formatter for the shapeshifter logs.
     """
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._prefixes = {}
+
     def format(self, record):
         """
         Format log recors using colors.
         """
-        color = color_map[record.levelno]
-        return (
-            colored(f"{record.levelname:10}", color)
-            + f"{datetime.now().astimezone().isoformat()} - {record.getMessage()}"
-        )
+        prefix = self._prefixes.get(record.levelno)
+        if prefix is None:
+            prefix = colored(f"{record.levelname:10}", color_map.get(record.levelno))
+            self._prefixes[record.levelno] = prefix
+        message = f"{prefix}{_timestamp(record)} - {record.getMessage()}"
+        if record.exc_info:
+            message += "\n" + self.formatException(record.exc_info)
+        return message
 
 
-handler = logging.StreamHandler()
-handler.setFormatter(ShapeshifterLogFormatter())
-handler.setLevel(logging.DEBUG)
+class JsonLogFormatter(logging.Formatter):
+    """
+    Formatter that writes every record as a single line of JSON.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": _timestamp(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
 
+formatters = {
+    "color": ShapeshifterLogFormatter,
+    "json": JsonLogFormatter,
+}
+
+handler = logging.StreamHandler()
 logger = logging.getLogger("shapeshifter-uftp")
-logger.addHandler(handler)
-logger.setLevel(logging.DEBUG)
+
+
+def configure_logging(level: str | int | None = None, log_format: str | None = None):
+    """
+    Set the level and the format of the shapeshifter-uftp logs. The
+    format can be "color", "json" or "none"; with "none", records are
+    only passed on to the handlers of your application.
+    """
+    if level is not None:
+        logger.setLevel(level.upper() if isinstance(level, str) else level)
+    if log_format is not None:
+        if log_format == "none":
+            logger.removeHandler(handler)
+        elif log_format in formatters:
+            handler.setFormatter(formatters[log_format]())
+            logger.addHandler(handler)
+        else:
+            raise ValueError(f"'log_format' should be one of {', '.join([*formatters, 'none'])}, not '{log_format}'")
+
+
+configure_logging(
+    level=os.environ.get("SHAPESHIFTER_LOG_LEVEL", "INFO"),
+    log_format=os.environ.get("SHAPESHIFTER_LOG_FORMAT", "color"),
+)
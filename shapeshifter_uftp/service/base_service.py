@@ -1,21 +1,30 @@
+import asyncio
+import inspect
+import multiprocessing
 import re
-from concurrent.futures import ThreadPoolExecutor
-from threading import Thread
-from time import sleep
+import sys
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from queue import Full
+from threading import Lock, Thread
+from time import monotonic, sleep
 
 import uvicorn
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
 from fastapi.exceptions import HTTPException
 from fastapi_xml import XmlAppResponse, XmlRoute
 
-from .. import transport
+from .. import async_discovery, streaming, transport
 from ..client import client_map
 from ..exceptions import (
     FunctionalException,
     InvalidMessageException,
     InvalidSenderException,
+    SchemaException,
+    TooManyRequestsException,
     TransportException,
 )
+from ..keys import KeyStore, VerifyKey
 from ..logging import logger
 from ..uftp import (
     AcceptedRejected,
@@ -26,6 +35,16 @@ from ..uftp import (
     UsefRole,
     request_response_map,
 )
+from .client_registry import ClientRegistry
+from .executors import (
+    AsyncExecutor,
+    BoundedExecutor,
+    LatencyHistogram,
+    OrderedExecutor,
+    PriorityExecutor,
+)
+from .rate_limit import RateLimiter
+from .watchdog import HandlerWatchdog
 
 
 class ShapeshifterService():
@@ -42,6 +61,126 @@ class ShapeshifterService():
     num_inbound_threads = 10
     num_outbound_threads = 10
 
+    # The maximum number of received messages that may wait for an
+    # inbound worker. When the queue is full, new messages are refused
+    # with HTTP 429 (Too Many Requests). None means unbounded.
+    max_inbound_queue_size = None
+
+    # By default, received messages are processed in any order by any
+    # of the inbound threads, so a FlexOrder may be processed before
+    # the FlexOffer that it refers to. Set inbound_ordering to process
+    # messages one at a time and in order of arrival per conversation
+    # ("conversation") or per sender and congestion point
+    # ("congestion_point"; messages without a congestion point are
+    # ordered per conversation). Messages for different conversations
+    # or congestion points are still processed in parallel, on
+    # num_inbound_threads lanes. The max_inbound_queue_size then
+    # applies to each lane.
+    inbound_ordering = None
+
+    # Set inbound_priorities to a {message type: priority} dict to
+    # process urgent messages (like FlexOrders) before others (like
+    # Metering). Lower numbers go first, and message types that are not
+    # listed get default_inbound_priority. A waiting message gains one
+    # priority level every inbound_priority_aging seconds, so that
+    # messages with a low priority are not held up indefinitely. This
+    # cannot be combined with inbound_ordering.
+    inbound_priorities = None
+    default_inbound_priority = 1
+    inbound_priority_aging = 1.0
+
+    # Message types can be processed by a separate pool of threads, so
+    # that slow handlers (for instance for Metering) cannot occupy all
+    # inbound threads while more urgent messages wait. Pools are given
+    # as {name: (message types, num_threads, max_queue_size)}. Message
+    # types that are not in a pool are processed by the inbound
+    # executor. Ordering and priorities apply within each pool.
+    inbound_pools = {}
+
+    # Process methods can also be coroutine functions (async def).
+    # These run on the event loop of the service instead of on the
+    # inbound threads, so that handlers that mostly wait for I/O do not
+    # need a thread each. At most max_concurrent_async_handlers run at
+    # once; the max_inbound_queue_size applies to the ones that wait
+    # for their turn. Ordering, priorities and pools do not apply to
+    # coroutine process methods.
+    max_concurrent_async_handlers = 1000
+
+    # A watchdog logs process methods that have been running for more
+    # than slow_handler_threshold seconds, with a sample of their stack,
+    # and counts the ones that run past their deadline: the number of
+    # seconds in handler_deadlines ({message type: seconds}), or
+    # handler_deadline for other message types. Coroutine process
+    # methods are cancelled at their deadline; regular process methods
+    # cannot be stopped and keep their thread until they return. The
+    # counts are available in watchdog.stats().
+    slow_handler_threshold = None
+    handler_deadline = None
+    handler_deadlines = {}
+
+    # The number of messages per second that a single sender (domain
+    # and role) may send us, and the size of the burst they may send
+    # at once. Senders that exceed their limit receive HTTP 429. Limits
+    # for specific senders can be set in participant_rate_limits, as
+    # {(sender_domain, sender_role): (rate, burst)}. None means unlimited.
+    rate_limit = None
+    rate_limit_burst = None
+    participant_rate_limits = {}
+
+    num_lookup_threads = 10
+    num_unseal_threads = 4
+
+    # Verifying and parsing incoming messages is CPU-bound, and the
+    # unseal threads share a single core because of the GIL. Set
+    # num_unseal_processes to do this work in a pool of worker
+    # processes instead, so that a service can use multiple cores. On
+    # a free-threaded Python build, threads already run in parallel,
+    # so this many threads are used instead of processes. The worker
+    # processes import your service's module, so it must be safe to
+    # import (see the multiprocessing documentation).
+    num_unseal_processes = None
+
+    # When enabled, the SignedMessage envelope is read from the raw
+    # request body by a streaming parser, instead of being parsed by
+    # FastAPI-XML. This is faster for large messages.
+    fast_envelope_parsing = False
+
+    # Message types that are handed to their process method as a
+    # streaming reader (see shapeshifter_uftp.streaming) instead of a
+    # parsed message, so that very large messages don't have to be
+    # held in memory as a whole.
+    streamed_messages = []
+
+    # Participants, as (domain, role) tuples, whose endpoint and key
+    # are looked up when the service starts, so that the first messages
+    # after a restart don't have to wait for DNS.
+    warm_up_participants = []
+
+    # Clients for sending replies are kept and reused. They are closed
+    # after they have been idle for client_idle_timeout seconds, and
+    # the recipient's endpoint and key are looked up again every
+    # client_refresh_interval seconds.
+    client_idle_timeout = 300.0
+    client_refresh_interval = 60.0
+
+    # A file in which the service discovery results are kept between
+    # restarts. They are loaded when the service starts, and
+    # revalidated in the background.
+    discovery_cache_file = None
+
+    # The name of the process method for every acceptable message type,
+    # which is derived once when a service class is created. The method
+    # itself is looked up on the instance for every message, so that
+    # process methods that are replaced on an instance are used.
+    _message_handlers = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._message_handlers = {
+            message_type: f"process_{snake_case(message_type.__name__)}"
+            for message_type in cls.acceptable_messages
+        }
+
     def __init__(
         self,
         sender_domain,
@@ -59,6 +198,7 @@ class ShapeshifterService():
         :param signing_key: the private singing key that we use to sign outgoing messages.
         :param key_lookup_function: A callable that takes a (sender_domain, sender_role)
                                   pair and returns a verify_key (str or bytes).
+                                  This may also be a coroutine function.
                                   Omit parameter to use DNS for key lookup.
         :param key_lookup_function: A callable that takes a (sender_domain, sender_role)
                                   pair and returns a full endpoint URL (str).
@@ -74,6 +214,30 @@ class ShapeshifterService():
         if version not in ("3.0.0", "3.1.0"):
             raise ValueError(f"'version' must be one of '3.0.0' or '3.1.0', not {version}")
 
+        missing_handlers = [name for name in self._message_handlers.values() if getattr(self, name, None) is None]
+        if missing_handlers:
+            raise TypeError(
+                f"{self.__class__.__name__} accepts messages without a process method: {', '.join(missing_handlers)}"
+            )
+
+        # Whether a process method is a coroutine function is decided
+        # here, so a process method that is replaced later on must be of
+        # the same kind.
+        self._async_message_types = frozenset(
+            message_type
+            for message_type, name in self._message_handlers.items()
+            if inspect.iscoroutinefunction(getattr(self, name))
+        )
+
+        unreadable_messages = [
+            message_type.__name__ for message_type in self.streamed_messages if message_type not in streaming.readers
+        ]
+        if unreadable_messages:
+            raise TypeError(
+                f"{self.__class__.__name__} streams messages that have no streaming reader: "
+                f"{', '.join(unreadable_messages)}"
+            )
+
         self.version = version
 
         # Set the sender domain, which is used
@@ -105,7 +269,7 @@ class ShapeshifterService():
         self.app.router.route_class = XmlRoute
         self.app.router.add_api_route(
             path,
-            endpoint=self._receive_message,
+            endpoint=self._receive_raw_message if self.fast_envelope_parsing else self._receive_message,
             response_model=None,
             methods=["POST"],
             status_code=200,
@@ -117,19 +281,143 @@ class ShapeshifterService():
         self.server = uvicorn.Server(config)
         self.server_thread = None
 
-        # Create an inbound executor worker
-        self.inbound_executor = ThreadPoolExecutor(max_workers=self.num_inbound_threads)
+        # Create an inbound executor worker, and the pools for message
+        # types that are processed separately.
+        if self.inbound_ordering is not None and self.inbound_priorities is not None:
+            raise ValueError("'inbound_ordering' and 'inbound_priorities' cannot be combined")
+        if self.inbound_ordering not in (None, "conversation", "congestion_point"):
+            raise ValueError(
+                f"'inbound_ordering' must be one of 'conversation' or 'congestion_point', not {self.inbound_ordering}"
+            )
+        self.inbound_executor = self._create_inbound_executor(
+            self.num_inbound_threads, self.max_inbound_queue_size, "shapeshifter-inbound"
+        )
+        self.inbound_pool_executors = {}
+        self._inbound_executors = {}
+        for pool_name, (message_types, num_threads, max_queue_size) in self.inbound_pools.items():
+            executor = self._create_inbound_executor(num_threads, max_queue_size, f"shapeshifter-{pool_name}")
+            self.inbound_pool_executors[pool_name] = executor
+            for message_type in message_types:
+                if message_type not in self._message_handlers:
+                    raise ValueError(f"Inbound pool '{pool_name}' contains {message_type.__name__}, which is not accepted")
+                if message_type in self._inbound_executors:
+                    raise ValueError(f"{message_type.__name__} is in more than one inbound pool")
+                if message_type in self._async_message_types:
+                    raise ValueError(
+                        f"Inbound pool '{pool_name}' contains {message_type.__name__}, "
+                        "which has a coroutine process method"
+                    )
+                self._inbound_executors[message_type] = executor
+        self.watchdog = self._create_watchdog()
+        self.async_executor = AsyncExecutor(
+            max_concurrency=self.max_concurrent_async_handlers,
+            max_queue_size=self.max_inbound_queue_size,
+            name="shapeshifter-async",
+        )
         self.outbound_executor = ThreadPoolExecutor(max_workers=self.num_outbound_threads)
 
+        # The time between receiving a message and the end of its
+        # processing, per message type.
+        self.inbound_latency = {message_type: LatencyHistogram() for message_type in self._message_handlers}
+
+        # Senders that exceed their rate limit are refused before we
+        # spend any time on verifying their signature.
+        self.rate_limiter = RateLimiter(
+            rate=self.rate_limit,
+            burst=self.rate_limit_burst,
+            participant_limits=self.participant_rate_limits,
+        )
+
+        # Blocking key lookups and the CPU-bound unsealing of incoming
+        # messages run on their own pools, outside of the event loop
+        # that accepts the HTTP requests. This way, a burst of slow
+        # DNS lookups can not starve the request handling.
+        self.lookup_executor = ThreadPoolExecutor(
+            max_workers=self.num_lookup_threads, thread_name_prefix="shapeshifter-lookup"
+        )
+        self.unseal_executor = self._create_unseal_executor()
+        self._unseal_executor_lock = Lock()
+
+        self.client_registry = ClientRegistry(
+            idle_timeout=self.client_idle_timeout,
+            refresh_interval=self.client_refresh_interval,
+        )
+
+        # The decoded public keys of the participants that send us
+        # messages. When a participant rotates their keys, the key
+        # lookup returns the new key, which replaces the old one.
+        self.key_store = KeyStore()
+
+        self.warm_up_thread = None
+
 
     def run(self):
         """
         Start the web server that hosts the FastAPI application. Other
         participants can now send messages to us.
         """
+        # Start with the discovery results of the previous run, and
+        # look up the configured participants in the background.
+        if self.discovery_cache_file:
+            transport.load_discovery_cache(self.discovery_cache_file)
+        if self.warm_up_participants:
+            self.warm_up_thread = Thread(target=self.warm_up, name="shapeshifter-warm-up", daemon=True)
+            self.warm_up_thread.start()
+
         # Start the service and start accepting incoming requests.
         self.server.run()
 
+    def warm_up(self, participants=None) -> dict:
+        """
+        Look up the endpoints and keys of the given participants (by
+        default: warm_up_participants), so that they are cached before
+        we need them. Returns a dict that maps each (domain, role) to
+        its async_discovery.Participant, or to the exception that
+        occurred. From a coroutine, await warm_up_async() instead.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.warm_up_async(participants))
+        raise RuntimeError("warm_up() cannot be called from a running event loop, await warm_up_async() instead")
+
+    async def warm_up_async(self, participants=None) -> dict:
+        """
+        Look up the given participants like warm_up(), from a coroutine.
+        """
+        participants = list(dict.fromkeys(self.warm_up_participants if participants is None else participants))
+        if self.endpoint_lookup_function is transport.get_endpoint and self.key_lookup_function is transport.get_key:
+            # With DNS discovery, all records are resolved concurrently.
+            results = await async_discovery.resolve_participants(participants)
+        else:
+            lookups = await asyncio.gather(
+                *(self._look_up_participant(domain, role) for domain, role in participants),
+                return_exceptions=True,
+            )
+            results = dict(zip(participants, lookups))
+
+        failed = [participant for participant, result in results.items() if isinstance(result, Exception)]
+        if failed:
+            logger.warning("Could not look up %d of %d participants: %s", len(failed), len(results), failed)
+        if self.discovery_cache_file:
+            await asyncio.get_running_loop().run_in_executor(
+                self.lookup_executor, transport.save_discovery_cache, self.discovery_cache_file
+            )
+        return results
+
+    async def _look_up_participant(self, domain, role) -> async_discovery.Participant:
+        """
+        Look up a participant with the configured lookup functions.
+        These don't provide the version and encryption key.
+        """
+        endpoint, signing_key = await asyncio.gather(
+            asyncio.get_running_loop().run_in_executor(
+                self.lookup_executor, self.endpoint_lookup_function, domain, role
+            ),
+            self._lookup_key(domain, role),
+        )
+        return async_discovery.Participant(domain, role, None, endpoint, signing_key, None)
+
     def run_in_thread(self):
         """
         Run the service in a background thread.
@@ -147,6 +435,15 @@ class ShapeshifterService():
         if self.server_thread and self.server_thread.is_alive():
             self.server_thread.join()
         self.server_thread = None
+        self.client_registry.close()
+        if self.watchdog is not None:
+            self.watchdog.close()
+        if isinstance(self.unseal_executor, ProcessPoolExecutor):
+            # Stop the worker processes; new ones are started if the
+            # service is run again.
+            self._replace_unseal_executor(self.unseal_executor)
+        if self.discovery_cache_file:
+            transport.save_discovery_cache(self.discovery_cache_file)
 
 
     # ------------------------------------------------------------ #
@@ -154,24 +451,35 @@ class ShapeshifterService():
     #              Shapeshifter UFTP implementation.               #
     # ------------------------------------------------------------ #
 
-    def _receive_message(self, message: SignedMessage) -> Response:
+    async def _receive_message(self, message: SignedMessage) -> Response:
         """
         The default entrypoint for the route. This will unpack the
         message and validate the signature. It will thes pass the
         PayloadMessago to the pre processing function for a
         response.
         """
-        logger.info(f"Got a request: {message}")
+        logger.info("Got a request from %s at %s", message.sender_role, message.sender_domain)
+        logger.debug("The request was: %s", message)
+        if not self.rate_limiter.allow(message.sender_domain, message.sender_role):
+            logger.warning(
+                "Rate limit exceeded by %s at %s, refusing message.", message.sender_role, message.sender_domain
+            )
+            raise HTTPException(TooManyRequestsException.http_status_code)
+
         # Get the public key that is used to decrypt the message
-        signing_key = self.key_lookup_function(
-            message.sender_domain, message.sender_role
-        )
+        signing_key = await self._lookup_key(message.sender_domain, message.sender_role)
 
-        logger.debug(f"The signing key is {signing_key}")
+        logger.debug("The signing key is %s", signing_key)
 
         # Unseal the message, returning an error if required
+        unseal_executor = self.unseal_executor
         try:
-            unsealed_message = transport.unseal_message(message.body, signing_key)
+            verify_key = self._verify_key(message.sender_domain, message.sender_role, signing_key)
+            unsealed_message = await asyncio.get_running_loop().run_in_executor(
+                unseal_executor, _unseal_message, message.body, verify_key, tuple(self.streamed_messages)
+            )
+            if isinstance(unsealed_message, bytes):
+                unsealed_message = streaming.read_message(unsealed_message)
 
             # Verify that the sender_domain inside the message is the
             # same as the sender_domain of the SignedMessage
@@ -179,78 +487,321 @@ class ShapeshifterService():
             if unsealed_message.sender_domain != message.sender_domain:
                 logger.warning(
                     "Received a message with mismatching sender_domain in the "
-                    f"SignedMessage envelope ({message.sender_domain}) and the "
-                    f"inner PayloadMessage ({unsealed_message.sender_domain})"
+                    "SignedMessage envelope (%s) and the inner PayloadMessage (%s)",
+                    message.sender_domain,
+                    unsealed_message.sender_domain,
                 )
                 raise InvalidSenderException()
 
-            if type(unsealed_message) not in self.acceptable_messages:
+            if _message_type(unsealed_message) not in self._message_handlers:
                 logger.warning(
-                    f"Received a misdirected message of type {unsealed_message.__class__.__name__} "
-                    f"from {unsealed_message.sender_domain}.")
+                    "Received a misdirected message of type %s from %s.",
+                    _message_type(unsealed_message).__name__,
+                    unsealed_message.sender_domain,
+                )
                 raise InvalidMessageException(unsealed_message)
 
         except TransportException as err:
-            logger.warning(f"The original transport error is {err.__class__.__name__}: {err}")
+            logger.warning("The original transport error is %s: %s", err.__class__.__name__, err)
             raise HTTPException(err.http_status_code) from err
 
+        except BrokenProcessPool as err:
+            # A worker process died (for instance, it was killed because
+            # the machine ran out of memory). The pool can not be used
+            # anymore, so it is replaced and the sender can try again.
+            logger.error("An unseal process terminated abruptly, starting new unseal processes.")
+            self._replace_unseal_executor(unseal_executor)
+            raise HTTPException(503) from err
+
         except FunctionalException as err:
             self.outbound_executor.submit(self._reject_message, message, unsealed_message, err.rejection_reason)
 
         else:
             # If the initial checks passed, process the message in the
             # user-defined pipeline.
-            self.inbound_executor.submit(self._process_message, unsealed_message, message.sender_role)
+            try:
+                self._submit_inbound(unsealed_message, message.sender_role)
+            except Full as err:
+                logger.warning(
+                    "The inbound queue is full, refusing %s from %s.",
+                    _message_type(unsealed_message).__name__,
+                    message.sender_domain,
+                )
+                raise HTTPException(TooManyRequestsException.http_status_code) from err
 
         return Response(status_code=200)
 
-    def _process_message(self, message: PayloadMessage, sender_role: UsefRole):
+    async def _receive_raw_message(self, request: Request) -> Response:
+        """
+        Entrypoint for the route when fast_envelope_parsing is
+        enabled. Parses the SignedMessage envelope while the request
+        body streams in, and then handles it like _receive_message.
+        """
+        parser = transport.SignedMessageParser()
+        try:
+            async for chunk in request.stream():
+                parser.feed(chunk)
+            message = parser.close()
+        except TransportException as err:
+            logger.warning("Could not parse the incoming SignedMessage: %s", err)
+            raise HTTPException(err.http_status_code) from err
+        return await self._receive_message(message)
+
+    def _verify_key(self, sender_domain: str, sender_role: UsefRole, signing_key: str | VerifyKey | None):
+        """
+        Return the decoded public key of the sender from the key store.
+        """
+        if signing_key is None:
+            return None
+        try:
+            return self.key_store.verify_key(sender_domain, sender_role, signing_key)
+        except (TypeError, ValueError) as exc:
+            logger.warning("The public key of %s at %s is invalid: %s", sender_role, sender_domain, exc)
+            raise SchemaException(str(exc)) from exc
+
+    def _create_unseal_executor(self):
+        """
+        Create the pool that verifies and parses incoming messages.
+        """
+        if not self.num_unseal_processes:
+            return ThreadPoolExecutor(max_workers=self.num_unseal_threads, thread_name_prefix="shapeshifter-unseal")
+        if not _gil_enabled():
+            return ThreadPoolExecutor(max_workers=self.num_unseal_processes, thread_name_prefix="shapeshifter-unseal")
+        # Forking a process that runs threads (like this service) is
+        # not safe, so the workers are started from a clean process.
+        start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        return ProcessPoolExecutor(
+            max_workers=self.num_unseal_processes,
+            mp_context=multiprocessing.get_context(start_method),
+            initializer=_init_unseal_process,
+            initargs=(transport.USE_COMPILED_CODECS, logger.level),
+        )
+
+    def _replace_unseal_executor(self, executor):
+        """
+        Shut down the given unseal executor and replace it with a new
+        one, unless that already happened.
+        """
+        with self._unseal_executor_lock:
+            if self.unseal_executor is not executor:
+                return
+            self.unseal_executor = self._create_unseal_executor()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _lookup_key(self, sender_domain: str, sender_role: UsefRole):
+        """
+        Look up the sender's public key without blocking the event
+        loop. With DNS discovery, cached keys are returned right away
+        and other keys are resolved on the event loop, so that slow DNS
+        queries don't hold up senders whose keys are cached. Coroutine
+        lookup functions are awaited directly, other lookup functions
+        run on the lookup executor.
+        """
+        if self.key_lookup_function is transport.get_key:
+            signing_key, _ = await async_discovery.get_keys(sender_domain, sender_role)
+            return signing_key
+        if inspect.iscoroutinefunction(self.key_lookup_function):
+            return await self.key_lookup_function(sender_domain, sender_role)
+        return await asyncio.get_running_loop().run_in_executor(
+            self.lookup_executor, self.key_lookup_function, sender_domain, sender_role
+        )
+
+    def _submit_inbound(self, message: PayloadMessage, sender_role: UsefRole):
+        """
+        Queue the message for processing by the inbound executor.
+        """
+        received_at = monotonic()
+        message_type = _message_type(message)
+        if message_type in self._async_message_types:
+            self.async_executor.submit(self._process_message_async, message, sender_role, received_at)
+            return
+        executor = self._inbound_executors.get(message_type, self.inbound_executor)
+        if self.inbound_priorities is not None:
+            priority = self.inbound_priorities.get(message_type, self.default_inbound_priority)
+            executor.submit(priority, self._process_message, message, sender_role, received_at)
+        elif self.inbound_ordering is None:
+            executor.submit(self._process_message, message, sender_role, received_at)
+        else:
+            executor.submit(self._ordering_key(message), self._process_message, message, sender_role, received_at)
+
+    def _create_inbound_executor(self, num_threads: int, max_queue_size: int | None, name: str):
+        """
+        Create a pool that processes received messages, as configured
+        by inbound_priorities and inbound_ordering.
+        """
+        if self.inbound_priorities is not None:
+            return PriorityExecutor(
+                num_threads=num_threads,
+                max_queue_size=max_queue_size,
+                name=name,
+                aging_interval=self.inbound_priority_aging,
+            )
+        if self.inbound_ordering is not None:
+            return OrderedExecutor(num_lanes=num_threads, max_queue_size=max_queue_size, name=name)
+        return BoundedExecutor(num_threads=num_threads, max_queue_size=max_queue_size, name=name)
+
+    def inbound_metrics(self) -> dict:
+        """
+        Return the queue metrics of the inbound executor (as "default")
+        and of each of the inbound pools, including their saturation:
+        the fraction of their threads that is busy. The metrics of the
+        coroutine process methods are included as "async".
+        """
+        executors = {"default": self.inbound_executor, **self.inbound_pool_executors, "async": self.async_executor}
+        return {
+            name: {**executor.metrics.as_dict(), "saturation": executor.saturation}
+            for name, executor in executors.items()
+        }
+
+    def _ordering_key(self, message: PayloadMessage):
+        """
+        Return the key that decides which messages are processed in
+        order, as configured by inbound_ordering.
+        """
+        if self.inbound_ordering == "congestion_point":
+            congestion_point = getattr(message, "congestion_point", None)
+            if isinstance(congestion_point, str):
+                return (message.sender_domain, congestion_point)
+        return message.conversation_id
+
+    def _process_message(self, message: PayloadMessage, sender_role: UsefRole, received_at: float):
         """
         Find the relevant post-processing method to handle the message
         outside of the request context, and run it.
         """
-        process_method_name = f"process_{snake_case(message.__class__.__name__)}"
-        process_method = getattr(self, process_method_name)
+        message_type = _message_type(message)
+        handler_name = self._message_handlers[message_type]
+        process_method = getattr(self, handler_name)
+        watchdog_token = None
+        if self.watchdog is not None:
+            watchdog_token = self.watchdog.start(handler_name, self._handler_deadline(message_type))
         try:
-            if isinstance(message, TestMessage):
+            if message_type is TestMessage:
                 process_method(message, sender_role)
             else:
                 process_method(message)
         except Exception as err:  # pylint: disable=broad-exception-caught
             logger.error(
-                f"An error occurred during the post-processing of a {message.__class__.__name__} message."
-                f"{err.__class__.__name__}: {err}"
+                "An error occurred during the post-processing of a %s message. %s: %s",
+                message_type.__name__,
+                err.__class__.__name__,
+                err,
             )
+        finally:
+            if watchdog_token is not None:
+                self.watchdog.finish(watchdog_token)
+            self.inbound_latency[message_type].record(monotonic() - received_at)
+
+    async def _process_message_async(self, message: PayloadMessage, sender_role: UsefRole, received_at: float):
+        """
+        Run a coroutine process method for the message on the event loop.
+        """
+        message_type = _message_type(message)
+        handler_name = self._message_handlers[message_type]
+        process_method = getattr(self, handler_name)
+        deadline = self._handler_deadline(message_type)
+        watchdog_token = None
+        if self.watchdog is not None:
+            watchdog_token = self.watchdog.start(handler_name, deadline, task=asyncio.current_task())
+        timeout = asyncio.timeout(deadline)
+        try:
+            # The process method runs in this task, so that the stack
+            # sample of the watchdog shows where it is waiting.
+            async with timeout:
+                if message_type is TestMessage:
+                    await process_method(message, sender_role)
+                else:
+                    await process_method(message)
+        except Exception as err:  # pylint: disable=broad-exception-caught
+            # A TimeoutError can also come from the process method itself.
+            if isinstance(err, TimeoutError) and timeout.expired():
+                logger.error(
+                    "The processing of a %s message was cancelled after its deadline of %s seconds.",
+                    message_type.__name__,
+                    deadline,
+                )
+            else:
+                logger.error(
+                    "An error occurred during the post-processing of a %s message. %s: %s",
+                    message_type.__name__,
+                    err.__class__.__name__,
+                    err,
+                )
+        finally:
+            if watchdog_token is not None:
+                self.watchdog.finish(watchdog_token)
+            self.inbound_latency[message_type].record(monotonic() - received_at)
+
+    def _handler_deadline(self, message_type: type) -> float | None:
+        return self.handler_deadlines.get(message_type, self.handler_deadline)
+
+    def _create_watchdog(self) -> HandlerWatchdog | None:
+        """
+        Create the watchdog for the process methods, if a slow handler
+        threshold or deadlines are configured.
+        """
+        durations = [
+            duration
+            for duration in (self.slow_handler_threshold, self.handler_deadline, *self.handler_deadlines.values())
+            if duration is not None
+        ]
+        if not durations:
+            return None
+        # Check often enough to notice handlers soon after they pass
+        # the shortest threshold.
+        return HandlerWatchdog(slow_threshold=self.slow_handler_threshold, interval=min(1.0, min(durations) / 2))
 
     def _get_client(self, recipient_domain: str, recipient_role: UsefRole, version: str = "3.1.0"):
         """
         Method to get a relevant client to communicate to the
-        indicated participant.
+        indicated participant. Clients are reused for each recipient
+        and version.
         """
+        return self.client_registry.get(
+            (recipient_domain, str(recipient_role), version),
+            create=lambda: self._create_client(recipient_domain, recipient_role, version),
+            refresh=self._refresh_client,
+        )
+
+    def _create_client(self, recipient_domain: str, recipient_role: UsefRole, version: str):
         client_cls = client_map[(self.sender_role, recipient_role)]
-        recipient_endpoint = self.endpoint_lookup_function(recipient_domain, recipient_role)
-        recipient_signing_key = self.key_lookup_function(recipient_domain, recipient_role)
         oauth_client = self.oauth_lookup_function(recipient_domain, recipient_role) if self.oauth_lookup_function else None
         return client_cls(
             sender_domain = self.sender_domain,
             signing_key = self.signing_key,
             recipient_domain = recipient_domain,
-            recipient_endpoint = recipient_endpoint,
-            recipient_signing_key = recipient_signing_key,
+            recipient_endpoint = self.endpoint_lookup_function(recipient_domain, recipient_role),
+            recipient_signing_key = self._lookup_recipient_key(recipient_domain, recipient_role),
             oauth_client = oauth_client,
             version=version,
         )
 
+    def _refresh_client(self, client):
+        """
+        Look up the endpoint and key of the client's recipient again,
+        as they may have changed since the client was created.
+        """
+        client.recipient_endpoint = self.endpoint_lookup_function(client.recipient_domain, client.recipient_role)
+        client.recipient_signing_key = self._lookup_recipient_key(client.recipient_domain, client.recipient_role)
+
+    def _lookup_recipient_key(self, recipient_domain: str, recipient_role: UsefRole):
+        # The recipient's key is not required for sending messages, so
+        # coroutine key lookups are not awaited from this (sync) context.
+        if inspect.iscoroutinefunction(self.key_lookup_function):
+            return None
+        return self.key_lookup_function(recipient_domain, recipient_role)
+
     def _reject_message(self, message, unsealed_message, reason):
         """
         Send a rejection to the sending party.
         """
-        if type(unsealed_message) not in request_response_map:
+        message_type = _message_type(unsealed_message)
+        if message_type not in request_response_map:
             return
 
         client = self._get_client(message.sender_domain, message.sender_role, unsealed_message.version)
-        response_type = request_response_map[type(unsealed_message)]
-        response_id_field = snake_case(type(unsealed_message).__name__) + "_message_id"
+        response_type = request_response_map[message_type]
+        response_id_field = _response_id_fields[message_type]
         message_contents = {
             "recipient_domain": message.sender_domain,
             "conversation_id": unsealed_message.conversation_id,
@@ -291,16 +842,60 @@ class ShapeshifterService():
     def process_test_message(self, message: TestMessage, sender_role: UsefRole):
         logger.info(
             "Received a TestMessage, will respond with TestMessageResponse. "
-            f"Implement the process_test_message method on your {self.__class__.__qualname__} "
-            f"to implement custom behavior. The message was: {message}"
+            "Implement the process_test_message method on your %s "
+            "to implement custom behavior. The message was: %s",
+            self.__class__.__qualname__,
+            message,
         )
         response = TestMessageResponse(conversation_id=message.conversation_id)
         client = self._get_client(message.sender_domain, sender_role, version=message.version or self.version)
         client.send_test_message_response(response)
 
     def process_test_message_response(self, message: TestMessage):
-        logger.info(f"Received a TestMessageResponse: {message}")
+        logger.info("Received a TestMessageResponse: %s", message)
+
 
+def _unseal_message(body: bytes, signing_key: VerifyKey | None, streamed_messages: tuple):
+    """
+    Verify and parse the signed body of a message. For message types
+    in streamed_messages, the verified XML is returned instead, to be
+    read by a streaming reader.
+
+    This runs on the unseal executor, which may be a process pool, so
+    it only takes and returns picklable objects.
+    """
+    if not streamed_messages:
+        return transport.unseal_message(body, signing_key)
+    unsealed_message = transport.verify_message(body, signing_key)
+    if streaming.message_type(unsealed_message) in streamed_messages:
+        return unsealed_message
+    return transport.parse_message(unsealed_message)
+
+
+def _init_unseal_process(use_compiled_codecs: bool, log_level: int):
+    """
+    Apply the settings of the service to an unseal worker process.
+    """
+    transport.USE_COMPILED_CODECS = use_compiled_codecs
+    logger.setLevel(log_level)
+
+
+def _gil_enabled() -> bool:
+    """
+    Whether the GIL is enabled; it can be disabled on free-threaded
+    builds of Python 3.13 and later.
+    """
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled() if is_gil_enabled else True
+
+
+def _message_type(message) -> type:
+    """
+    Return the message class of a parsed message or a streaming reader.
+    """
+    if isinstance(message, streaming.MessageReader):
+        return message.message_type
+    return type(message)
 
 
 def snake_case(text):
@@ -308,3 +903,11 @@ def snake_case(text):
     Convert text from CamelCase to snake_case.
     """
     return re.sub(r"(.)([A-Z][a-z])", r"\1_\2", text).lower()
+
+
+# The field of each response message that refers to the message id of
+# the request, e.g. flex_request_message_id in a FlexRequestResponse.
+_response_id_fields = {
+    message_type: f"{snake_case(message_type.__name__)}_message_id"
+    for message_type in request_response_map
+}
@@ -0,0 +1,100 @@
+"""
+Long-lived clients for the replies that a service sends.
+
+A service keeps one client per (recipient_domain, recipient_role,
+version), so that replies, rejections and messages from the
+role-pair client methods share their outgoing queue, worker threads
+and OAuth tokens, instead of creating new ones for every message.
+Clients that have not been used for a while (and have nothing left to
+deliver) are closed and evicted.
+"""
+import time
+from threading import Lock
+
+
+class ClientRegistry:
+    """
+    Thread-safe registry of clients, one per recipient and version.
+    """
+
+    def __init__(self, idle_timeout: float = 300.0, refresh_interval: float = 60.0):
+        """
+        :param float idle_timeout: the number of seconds after which an
+                                   unused client is closed and evicted.
+        :param float refresh_interval: the number of seconds after which
+                                       the recipient's endpoint and key
+                                       are looked up again.
+        """
+        self.idle_timeout = idle_timeout
+        self.refresh_interval = refresh_interval
+        self._clients = {}
+        self._lock = Lock()
+
+    def get(self, key, create, refresh=None):
+        """
+        Return the client for the key, calling create() to make it if
+        it does not exist. If the client was last refreshed more than
+        refresh_interval seconds ago, refresh(client) is called to
+        update its recipient details.
+        """
+        now = time.monotonic()
+        with self._lock:
+            evicted = self._evict_idle(now)
+            entry = self._clients.get(key)
+            if entry is not None:
+                entry[1] = now
+        self._close_all(evicted)
+
+        if entry is None:
+            # Create the client outside of the lock, because creating it
+            # may involve lookups. If another thread was quicker, its
+            # client is used instead.
+            client = create()
+            with self._lock:
+                entry = self._clients.setdefault(key, [client, now, now])
+            if entry[0] is not client:
+                client.close()
+            return entry[0]
+
+        client, _, refreshed_at = entry
+        if refresh is not None and now - refreshed_at > self.refresh_interval:
+            entry[2] = now
+            refresh(client)
+        return client
+
+    def evict_idle(self):
+        """
+        Close and remove all clients that have been idle for longer
+        than the idle timeout.
+        """
+        with self._lock:
+            evicted = self._evict_idle(time.monotonic())
+        self._close_all(evicted)
+
+    def close(self):
+        """
+        Close all clients.
+        """
+        with self._lock:
+            clients = [client for client, _, _ in self._clients.values()]
+            self._clients.clear()
+        self._close_all(clients)
+
+    def __len__(self):
+        return len(self._clients)
+
+    def __contains__(self, key):
+        return key in self._clients
+
+    def _evict_idle(self, now: float) -> list:
+        expired = [
+            key
+            for key, (client, last_used, _) in self._clients.items()
+            if now - last_used > self.idle_timeout and not client.has_pending_messages()
+        ]
+        return [self._clients.pop(key)[0] for key in expired]
+
+    @staticmethod
+    def _close_all(clients):
+        for client in clients:
+            client.close()
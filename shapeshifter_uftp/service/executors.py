@@ -0,0 +1,472 @@
+"""
+Worker pools that process incoming messages outside of the request
+context.
+
+A BoundedExecutor runs work in any order on any of its threads. An
+OrderedExecutor divides work over lanes by a key (for instance the
+conversation), so that work with the same key runs in the order in
+which it was submitted, while work in other lanes runs in parallel. A
+PriorityExecutor runs urgent work first, but lets work that has waited
+long enough go ahead of newer, more urgent work. An AsyncExecutor runs
+coroutines on the event loop, with a limit on how many run at once.
+"""
+import asyncio
+import math
+import time
+from bisect import bisect_left
+from concurrent.futures import Future
+from itertools import count
+from queue import Full, PriorityQueue, Queue
+from threading import Lock, Thread
+
+from ..logging import logger
+
+
+class QueueMetrics:
+    """
+    Thread-safe counters describing the queue of a worker pool: how
+    many items are waiting, how many were accepted or rejected, and
+    how long items waited before a worker picked them up. The depth is
+    the number of items that were submitted but not started yet.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self.max_depth = 0
+        self.submitted = 0
+        self.started = 0
+        self.rejected = 0
+        self.completed = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def record_submitted(self):
+        """
+        Count an item that was accepted into the queue.
+        """
+        with self._lock:
+            self.submitted += 1
+            self.max_depth = max(self.max_depth, self.depth)
+
+    def record_rejected(self):
+        """
+        Count an item that was refused because the queue was full.
+        """
+        with self._lock:
+            self.rejected += 1
+
+    def record_started(self, wait_time: float):
+        """
+        Count an item that a worker picked up after waiting 'wait_time' seconds.
+        """
+        with self._lock:
+            self.started += 1
+            self.total_wait_time += wait_time
+            self.max_wait_time = max(self.max_wait_time, wait_time)
+
+    def record_completed(self):
+        """
+        Count an item that a worker has finished.
+        """
+        with self._lock:
+            self.completed += 1
+
+    @classmethod
+    def combine(cls, metrics: list["QueueMetrics"]) -> "QueueMetrics":
+        """
+        Return the metrics of several queues added together. The depth
+        is the total of the current depths, while max_depth and
+        max_wait_time are those of the worst queue.
+        """
+        combined = cls()
+        for item in metrics:
+            with item._lock:  # pylint: disable=protected-access
+                combined.max_depth = max(combined.max_depth, item.max_depth)
+                combined.submitted += item.submitted
+                combined.started += item.started
+                combined.rejected += item.rejected
+                combined.completed += item.completed
+                combined.total_wait_time += item.total_wait_time
+                combined.max_wait_time = max(combined.max_wait_time, item.max_wait_time)
+        return combined
+
+    @property
+    def depth(self) -> int:
+        """
+        The number of items that wait to be started.
+        """
+        # A worker can record the start of an item just before its
+        # submission is recorded.
+        return max(0, self.submitted - self.started)
+
+    @property
+    def average_wait_time(self) -> float:
+        """
+        The average number of seconds that the started items waited.
+        """
+        return self.total_wait_time / self.started if self.started else 0.0
+
+    @property
+    def active(self) -> int:
+        """
+        The number of items that are being worked on.
+        """
+        return self.started - self.completed
+
+    def as_dict(self) -> dict:
+        """
+        Return a snapshot of the metrics, suitable for exporting to a
+        monitoring system.
+        """
+        with self._lock:
+            return {
+                "depth": self.depth,
+                "max_depth": self.max_depth,
+                "submitted": self.submitted,
+                "started": self.started,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "active": self.active,
+                "average_wait_time": self.average_wait_time,
+                "max_wait_time": self.max_wait_time,
+            }
+
+
+class LatencyHistogram:
+    """
+    Thread-safe histogram of durations, in seconds. counts[i] is the
+    number of durations up to buckets[i] (and above buckets[i - 1]);
+    the last count is for durations longer than the last bucket.
+    """
+
+    default_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self, buckets: tuple = default_buckets):
+        self._lock = Lock()
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def record(self, duration: float):
+        """
+        Add a duration to the histogram.
+        """
+        with self._lock:
+            self.counts[bisect_left(self.buckets, duration)] += 1
+            self.count += 1
+            self.sum += duration
+            self.max = max(self.max, duration)
+
+    @property
+    def average(self) -> float:
+        """
+        The average of the recorded durations.
+        """
+        return self.sum / self.count if self.count else 0.0
+
+    def as_dict(self) -> dict:
+        """
+        Return a snapshot of the histogram, suitable for exporting to a
+        monitoring system.
+        """
+        with self._lock:
+            return {
+                "buckets": dict(zip([*self.buckets, math.inf], self.counts)),
+                "count": self.count,
+                "sum": self.sum,
+                "average": self.average,
+                "max": self.max,
+            }
+
+
+class BoundedExecutor:
+    """
+    Pool of worker threads that take work from a queue with a
+    maximum size. When the queue is full, submitting more work raises
+    queue.Full instead of growing the queue without limit.
+    """
+
+    def __init__(self, num_threads: int, max_queue_size: int | None = None, name: str = "shapeshifter"):
+        """
+        :param int num_threads: the number of worker threads.
+        :param int max_queue_size: the maximum number of items that may
+                                   wait for a worker. None means unbounded.
+        :param str name: prefix for the names of the worker threads.
+        """
+        self.num_threads = num_threads
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.metrics = QueueMetrics()
+        self._queue = self._create_queue(max_queue_size or 0)
+        self._workers = []
+        self._lock = Lock()
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) for execution on one of the
+        workers. Raises queue.Full if the queue is at its maximum size.
+        """
+        return self._submit(fn, args, kwargs)
+
+    def _submit(self, fn, args, kwargs, **put_kwargs) -> Future:
+        self._start_workers()
+        future = Future()
+        try:
+            self._put((time.monotonic(), future, fn, args, kwargs), **put_kwargs)
+        except Full:
+            self.metrics.record_rejected()
+            raise
+        self.metrics.record_submitted()
+        return future
+
+    @property
+    def saturation(self) -> float:
+        """
+        The fraction of the workers that is busy.
+        """
+        return self.metrics.active / self.num_threads
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers after the queued work has been processed.
+        """
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for _ in workers:
+            self._put(None, block=True)
+        if wait:
+            for worker in workers:
+                worker.join()
+
+    def _start_workers(self):
+        if self._workers:
+            return
+        with self._lock:
+            if self._workers:
+                return
+            self._workers = [
+                Thread(target=self._worker, name=f"{self.name}-{i}", daemon=True)
+                for i in range(self.num_threads)
+            ]
+            for worker in self._workers:
+                worker.start()
+
+    def _worker(self):
+        while True:
+            item = self._get()
+            if item is None:
+                return
+            enqueued_at, future, fn, args, kwargs = item
+            self.metrics.record_started(time.monotonic() - enqueued_at)
+            if future.set_running_or_notify_cancel():
+                try:
+                    future.set_result(fn(*args, **kwargs))
+                except Exception as err:  # pylint: disable=broad-exception-caught
+                    logger.error("Unhandled exception in %s worker: %s: %s", self.name, err.__class__.__name__, err)
+                    future.set_exception(err)
+            self.metrics.record_completed()
+
+    def _create_queue(self, maxsize: int):
+        return Queue(maxsize=maxsize)
+
+    def _put(self, item, block: bool = False):
+        self._queue.put(item, block=block)
+
+    def _get(self):
+        return self._queue.get()
+
+
+class PriorityExecutor(BoundedExecutor):
+    """
+    Pool of worker threads that take the most urgent work from a
+    queue first. Priorities are numbers, and lower numbers go first.
+    To keep less urgent work from waiting forever, work gains one
+    priority level for every 'aging_interval' seconds that it waits.
+    """
+
+    def __init__(
+        self,
+        num_threads: int,
+        max_queue_size: int | None = None,
+        name: str = "shapeshifter",
+        aging_interval: float = 1.0,
+    ):
+        """
+        :param int num_threads: the number of worker threads.
+        :param int max_queue_size: the maximum number of items that may
+                                   wait for a worker. None means unbounded.
+        :param str name: prefix for the names of the worker threads.
+        :param float aging_interval: the number of seconds after which
+                                     waiting work gains one priority level.
+        """
+        super().__init__(num_threads, max_queue_size, name)
+        self.aging_interval = aging_interval
+        self._sequence = count()
+
+    def submit(self, priority: float, fn, *args, **kwargs) -> Future:  # pylint: disable=arguments-differ
+        """
+        Schedule fn(*args, **kwargs) for execution with the given
+        priority. Raises queue.Full if the queue is at its maximum size.
+        """
+        return self._submit(fn, args, kwargs, priority=priority)
+
+    def _create_queue(self, maxsize: int):
+        return PriorityQueue(maxsize=maxsize)
+
+    def _put(self, item, block: bool = False, priority: float = 0):
+        # Work is ordered by the time at which it would have the
+        # highest priority, so that waiting work overtakes newer work of
+        # a higher priority once it has waited long enough. Workers are
+        # stopped after all work has been done.
+        if item is None:
+            sort_key = math.inf
+        else:
+            enqueued_at = item[0]
+            sort_key = enqueued_at + priority * self.aging_interval
+        self._queue.put((sort_key, next(self._sequence), item), block=block)
+
+    def _get(self):
+        return self._queue.get()[2]
+
+
+class OrderedExecutor:
+    """
+    Pool of lanes, each with a single worker thread and its own queue.
+    Work is assigned to a lane by its key, so work with the same key
+    runs one at a time and in the order in which it was submitted.
+    """
+
+    def __init__(self, num_lanes: int, max_queue_size: int | None = None, name: str = "shapeshifter"):
+        """
+        :param int num_lanes: the number of lanes (and worker threads).
+        :param int max_queue_size: the maximum number of items that may
+                                   wait in each lane. None means unbounded.
+        :param str name: prefix for the names of the worker threads.
+        """
+        self.num_lanes = num_lanes
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.lanes = [
+            BoundedExecutor(num_threads=1, max_queue_size=max_queue_size, name=f"{name}-lane-{i}")
+            for i in range(num_lanes)
+        ]
+
+    def submit(self, key, fn, *args, **kwargs) -> Future:
+        """
+        Schedule fn(*args, **kwargs) for execution on the lane for the
+        key, after the work that was submitted earlier for that lane.
+        Raises queue.Full if the queue of the lane is at its maximum
+        size.
+        """
+        return self.lane(key).submit(fn, *args, **kwargs)
+
+    def lane(self, key) -> BoundedExecutor:
+        """
+        Return the lane that runs the work for the key.
+        """
+        return self.lanes[hash(key) % self.num_lanes]
+
+    @property
+    def metrics(self) -> QueueMetrics:
+        """
+        The metrics of all lanes together.
+        """
+        return QueueMetrics.combine([lane.metrics for lane in self.lanes])
+
+    @property
+    def saturation(self) -> float:
+        """
+        The fraction of the lanes that is busy.
+        """
+        return self.metrics.active / self.num_lanes
+
+    @property
+    def lane_metrics(self) -> list[QueueMetrics]:
+        """
+        The metrics of each lane, to find lanes that fall behind.
+        """
+        return [lane.metrics for lane in self.lanes]
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stop the workers of all lanes after the queued work has been
+        processed.
+        """
+        for lane in self.lanes:
+            lane.shutdown(wait=wait)
+
+
+class AsyncExecutor:
+    """
+    Runs coroutine functions as tasks on the running event loop, at
+    most max_concurrency at a time; the others wait for their turn.
+    When max_queue_size tasks are waiting, submitting more work raises
+    queue.Full. Work must be submitted from the event loop.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue_size: int | None = None, name: str = "shapeshifter"):
+        """
+        :param int max_concurrency: the number of tasks that may run at once.
+        :param int max_queue_size: the maximum number of tasks that may
+                                   wait for their turn. None means unbounded.
+        :param str name: the name of the executor, used in logging.
+        """
+        self.max_concurrency = max_concurrency
+        self.max_queue_size = max_queue_size
+        self.name = name
+        self.metrics = QueueMetrics()
+        self._loop = None
+        self._semaphore = None
+        self._waiting = 0
+        self._tasks = set()
+
+    def submit(self, fn, *args, **kwargs) -> asyncio.Task:
+        """
+        Schedule the coroutine fn(*args, **kwargs) as a task on the
+        running event loop. Raises queue.Full if the maximum number of
+        tasks is waiting.
+        """
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # The semaphore belongs to the loop on which it is used, and
+            # a service gets a new loop every time it is started.
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._waiting = 0
+        if self.max_queue_size is not None and self._waiting >= self.max_queue_size:
+            self.metrics.record_rejected()
+            raise Full()
+        self._waiting += 1
+        self.metrics.record_submitted()
+        task = loop.create_task(self._run(time.monotonic(), self._semaphore, fn, args, kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    @property
+    def saturation(self) -> float:
+        """
+        The fraction of the allowed number of tasks that is running.
+        """
+        return self.metrics.active / self.max_concurrency
+
+    async def _run(self, enqueued_at: float, semaphore: asyncio.Semaphore, fn, args, kwargs):
+        async with semaphore:
+            self._waiting -= 1
+            self.metrics.record_started(time.monotonic() - enqueued_at)
+            try:
+                return await fn(*args, **kwargs)
+            except Exception as err:
+                logger.error("Unhandled exception in %s task: %s: %s", self.name, err.__class__.__name__, err)
+                raise
+            finally:
+                self.metrics.record_completed()
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        # The exception has been logged already; retrieving it keeps
+        # asyncio from logging it again.
+        if not task.cancelled():
+            task.exception()
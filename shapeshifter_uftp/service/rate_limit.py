@@ -0,0 +1,100 @@
+"""
+Per-sender rate limiting of incoming messages, using token buckets.
+
+Every sender (the combination of sender domain and sender role from
+the SignedMessage envelope) gets its own bucket that refills at a
+fixed rate. Each incoming message takes one token; when the bucket is
+empty the message is refused. This check is cheap and runs before the
+signature of the message is verified.
+"""
+import time
+from collections import OrderedDict
+from threading import Lock
+
+
+class TokenBucket:
+    """
+    A bucket that holds at most 'burst' tokens and refills with 'rate'
+    tokens per second.
+    """
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    def consume(self, now: float) -> bool:
+        """
+        Take a token from the bucket if one is available.
+        """
+        self.tokens = min(self.burst, self.tokens + max(0.0, now - self.updated_at) * self.rate)
+        self.updated_at = max(now, self.updated_at)
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def is_full(self, now: float) -> bool:
+        """
+        Return whether the bucket has refilled completely.
+        """
+        return self.tokens + max(0.0, now - self.updated_at) * self.rate >= self.burst
+
+
+class RateLimiter:
+    """
+    Thread-safe collection of token buckets, one per sender.
+    """
+
+    # When there are this many buckets, the bucket of the sender that
+    # has been quiet for the longest time is dropped for every new
+    # sender. By then it has usually refilled, and it is recreated
+    # when the sender returns.
+    max_buckets = 10000
+
+    def __init__(
+        self,
+        rate: float | None = None,
+        burst: float | None = None,
+        participant_limits: dict | None = None,
+    ):
+        """
+        :param float rate: the default number of messages per second
+                           that each sender may send. None means
+                           unlimited.
+        :param float burst: the default number of messages that a sender
+                            may send in a burst. Defaults to the rate.
+        :param dict participant_limits: limits for specific senders, as
+                                        a mapping of (sender_domain,
+                                        sender_role) to a (rate, burst)
+                                        tuple. A rate of None means that
+                                        the sender is not limited.
+        """
+        self.default_limit = (rate, burst)
+        self.participant_limits = {
+            (domain, str(role)): limit
+            for (domain, role), limit in (participant_limits or {}).items()
+        }
+        self._buckets = OrderedDict()
+        self._lock = Lock()
+
+    def allow(self, sender_domain: str, sender_role: str) -> bool:
+        """
+        Return whether the sender may send another message right now.
+        """
+        key = (sender_domain, str(sender_role))
+        rate, burst = self.participant_limits.get(key, self.default_limit)
+        if rate is None:
+            return True
+
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                while len(self._buckets) >= self.max_buckets:
+                    self._buckets.popitem(last=False)
+                bucket = self._buckets[key] = TokenBucket(rate, burst or max(rate, 1))
+            else:
+                self._buckets.move_to_end(key)
+            return bucket.consume(now)
@@ -0,0 +1,164 @@
+"""
+Detection of slow and hung process methods.
+
+The watchdog keeps track of the process methods that are running. A
+background thread checks on them periodically: a process method that
+has been running for longer than the slow threshold is logged once,
+together with a sample of its stack, so that you can see where it is
+waiting. A process method that runs past its deadline is logged and
+counted. Threads cannot be stopped from the outside, so it is up to
+the caller to cancel work that has passed its deadline, where that is
+possible.
+"""
+import sys
+import time
+import traceback
+from collections import Counter
+from itertools import count
+from threading import Event, Lock, Thread, get_ident
+
+from ..logging import logger
+
+
+class _RunningHandler:
+    __slots__ = ("name", "started_at", "deadline", "thread_id", "task", "reported_slow", "exceeded")
+
+    def __init__(self, name: str, started_at: float, deadline: float | None, thread_id: int, task=None):
+        self.name = name
+        self.started_at = started_at
+        self.deadline = deadline
+        self.thread_id = thread_id
+        self.task = task
+        self.reported_slow = False
+        self.exceeded = False
+
+
+class HandlerWatchdog:
+    """
+    Thread-safe registry of running handlers, which reports the ones
+    that are slow or that have passed their deadline.
+    """
+
+    def __init__(self, slow_threshold: float | None = None, interval: float = 1.0):
+        """
+        :param float slow_threshold: the number of seconds after which a
+                                     running handler is logged with a
+                                     sample of its stack. None disables this.
+        :param float interval: the number of seconds between checks.
+        """
+        self.slow_threshold = slow_threshold
+        self.interval = interval
+        self.slow = Counter()
+        self.exceeded = Counter()
+        self._running = {}
+        self._tokens = count()
+        self._lock = Lock()
+        self._thread = None
+        self._stopped = None
+
+    def start(self, name: str, deadline: float | None = None, task=None) -> int:
+        """
+        Register a handler that starts running on the current thread,
+        or as an asyncio task. Returns a token for finish().
+        """
+        self._start_thread()
+        token = next(self._tokens)
+        handler = _RunningHandler(name, time.monotonic(), deadline, get_ident(), task)
+        with self._lock:
+            self._running[token] = handler
+        return token
+
+    def finish(self, token: int) -> float:
+        """
+        Unregister a handler that is done, and return how long it ran.
+        A handler that passed its deadline since the last check is
+        counted as well.
+        """
+        with self._lock:
+            handler = self._running.pop(token)
+        duration = time.monotonic() - handler.started_at
+        self._check_deadline(handler, duration)
+        return duration
+
+    def check(self):
+        """
+        Report the handlers that have become slow or have passed their
+        deadline since the last check.
+        """
+        now = time.monotonic()
+        with self._lock:
+            running = list(self._running.values())
+        for handler in running:
+            duration = now - handler.started_at
+            if self.slow_threshold is not None and duration > self.slow_threshold and not handler.reported_slow:
+                handler.reported_slow = True
+                with self._lock:
+                    self.slow[handler.name] += 1
+                logger.warning(
+                    "%s has been running for %.1f seconds:\n%s", handler.name, duration, self._stack_sample(handler)
+                )
+            self._check_deadline(handler, duration)
+
+    def stats(self) -> dict:
+        """
+        Return the number of running handlers, and the number of slow
+        handlers and handlers that passed their deadline, per handler.
+        """
+        with self._lock:
+            return {
+                "running": len(self._running),
+                "slow": dict(self.slow),
+                "exceeded": dict(self.exceeded),
+            }
+
+    def close(self):
+        """
+        Stop the background thread. It is started again when the next
+        handler is registered.
+        """
+        with self._lock:
+            thread, stopped = self._thread, self._stopped
+            self._thread = self._stopped = None
+        if thread is not None:
+            stopped.set()
+            thread.join()
+
+    def _check_deadline(self, handler: _RunningHandler, duration: float):
+        if handler.deadline is None or duration <= handler.deadline:
+            return
+        with self._lock:
+            # The handler may be checked by finish() and check() at once.
+            if handler.exceeded:
+                return
+            handler.exceeded = True
+            self.exceeded[handler.name] += 1
+        logger.error(
+            "%s has been running for %.1f seconds, which is past its deadline of %.1f seconds",
+            handler.name,
+            duration,
+            handler.deadline,
+        )
+
+    @staticmethod
+    def _stack_sample(handler: _RunningHandler) -> str:
+        if handler.task is not None:
+            frames = handler.task.get_stack()
+            return "".join(traceback.format_list(traceback.StackSummary.extract(
+                (frame, frame.f_lineno) for frame in frames
+            )))
+        frame = sys._current_frames().get(handler.thread_id)  # pylint: disable=protected-access
+        return "".join(traceback.format_stack(frame)) if frame is not None else "(no stack available)"
+
+    def _start_thread(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._stopped = Event()
+            self._thread = Thread(target=self._run, args=(self._stopped,), name="shapeshifter-watchdog", daemon=True)
+            self._thread.start()
+
+    def _run(self, stopped: Event):
+        while not stopped.wait(self.interval):
+            self.check()
@@ -0,0 +1,453 @@
+"""
+Streaming readers and writers for large messages.
+
+Some messages, like the portfolio query responses from the CRO or a
+monthly FlexSettlement, can contain thousands of congestion points,
+connections or settled orders. Parsing them with from_xml() builds the
+complete tree of dataclasses before any of it can be used, and
+creating them requires the complete tree up front. The readers in this
+module instead walk through the (verified) XML one element at a time,
+and release every element after it has been yielded, so that memory
+use stays flat regardless of the size of the message. The writers
+serialize the repeated elements one at a time into a byte buffer,
+which is signed and sent as a whole.
+
+The readers don't validate the message as a whole the way the
+dataclasses do; they only convert the values that they yield.
+
+A service can receive these messages through a reader by listing them
+in its streamed_messages. The process method for the message then
+gets the reader instead of the parsed message. The writers can be
+passed to the clients' send methods instead of the message.
+"""
+import dataclasses
+from dataclasses import dataclass
+from io import BytesIO
+
+from lxml import etree
+from xsdata.exceptions import ConverterError
+from xsdata.formats.converter import converter
+from xsdata.formats.dataclass.context import XmlContext
+
+from . import xml_codecs
+from .exceptions import SchemaException
+from .uftp import (
+    AgrPortfolioQueryResponse,
+    AgrPortfolioQueryResponseCongestionPoint,
+    AgrPortfolioQueryResponseConnection,
+    ContractSettlement,
+    DsoPortfolioQueryCongestionPoint,
+    DsoPortfolioQueryConnection,
+    DsoPortfolioQueryResponse,
+    FlexOrderSettlement,
+    FlexSettlement,
+    RedispatchBy,
+)
+
+_context = XmlContext()
+
+
+def message_type(data: bytes) -> type | None:
+    """
+    Return the message class of the given XML message, by only looking
+    at its root element.
+    """
+    try:
+        for _, element in etree.iterparse(BytesIO(data), events=("start",), resolve_entities=False, no_network=True):
+            return xml_codecs.find_root_class(element.tag)
+    except etree.XMLSyntaxError:
+        return None
+    return None
+
+
+def read_message(data: bytes) -> "MessageReader":
+    """
+    Return a streaming reader for the given (verified) XML message.
+    """
+    clazz = message_type(data)
+    if clazz not in readers:
+        raise SchemaException(f"There is no streaming reader for {clazz.__name__ if clazz else 'this message'}")
+    return readers[clazz](data)
+
+
+class MessageReader:
+    """
+    Base class for the streaming readers. The attributes of the
+    message itself (like message_id and conversation_id) can be read
+    from the reader, the contents are yielded by its methods.
+    """
+
+    message_types = ()
+
+    # The classes of the root element's repeated children, by tag, in
+    # the order in which they appear (see _root_elements).
+    root_elements = {}
+
+    def __init__(self, data: bytes):
+        self._events = etree.iterparse(
+            BytesIO(data),
+            events=("start", "end"),
+            resolve_entities=False,
+            no_network=True,
+            huge_tree=True,
+        )
+        _, root = self._next_event()
+        self.message_type = xml_codecs.find_root_class(root.tag)
+        if self.message_type not in self.message_types:
+            raise SchemaException(f"{self.__class__.__name__} can not read a {root.tag} message")
+        self.attributes = parse_attributes(self.message_type, root)
+        self._root = root
+        self._pending = None
+
+    def __getattr__(self, name):
+        attributes = self.__dict__.get("attributes", {})
+        if name in attributes:
+            return attributes[name]
+        raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{name}'")
+
+    def __repr__(self):
+        return f"<{self.__class__.__name__} for {self.message_type.__name__} {self.attributes}>"
+
+    def _next_event(self):
+        try:
+            return next(self._events)
+        except etree.XMLSyntaxError as exc:
+            raise SchemaException(f"The message is not well-formed XML: {exc}") from exc
+
+    def _iter_events(self):
+        try:
+            yield from self._events
+        except etree.XMLSyntaxError as exc:
+            raise SchemaException(f"The message is not well-formed XML: {exc}") from exc
+
+    def _root_elements(self, tag: str):
+        """
+        Yield the children of the root element with the given tag as
+        objects. Children with a tag that comes earlier in
+        root_elements are skipped, and reading stops at the first
+        child with a tag that comes later, which is kept for the next
+        call.
+        """
+        order = list(self.root_elements)
+        while (element := self._next_root_child()) is not None:
+            if element.tag == tag:
+                item = parse_element(self.root_elements[tag], element)
+                release(element)
+                yield item
+            elif element.tag in order and order.index(element.tag) > order.index(tag):
+                self._pending = element
+                return
+            else:
+                release(element)
+
+    def _next_root_child(self):
+        """
+        Return the next complete child element of the root, or None at
+        the end of the message.
+        """
+        if self._pending is not None:
+            element, self._pending = self._pending, None
+            return element
+        for event, element in self._iter_events():
+            if event == "end" and element.getparent() is self._root:
+                return element
+        return None
+
+    def _children(self, container_tag: str, child_tag: str, clazz: type, first=None):
+        """
+        Yield the child elements of the current container element, up
+        to the end of that container, as objects of the given class.
+        """
+        if first is not None:
+            yield first
+        for event, element in self._iter_events():
+            if event != "end":
+                continue
+            if element.tag == child_tag:
+                child = parse_element(clazz, element)
+                release(element)
+                yield child
+            elif element.tag == container_tag:
+                release(element)
+                return
+
+
+@dataclass
+class PortfolioCongestionPoint:
+    """
+    A congestion point from a portfolio query response. Its
+    connections are yielded separately by the reader. The dso_domain
+    and the congestion point properties are only present in responses
+    to an AgrPortfolioQuery.
+    """
+    entity_address: str
+    dso_domain: str | None = None
+    mutex_offers_supported: bool | None = None
+    day_ahead_redispatch_by: RedispatchBy | None = None
+    intraday_redispatch_by: RedispatchBy | None = None
+
+
+class PortfolioQueryResponseReader(MessageReader):
+    """
+    Streaming reader for AgrPortfolioQueryResponse and
+    DsoPortfolioQueryResponse messages.
+
+    Usage:
+
+    for congestion_point, connections in reader.congestion_points():
+        ...
+        for connection in connections:
+            ...
+    """
+
+    message_types = (AgrPortfolioQueryResponse, DsoPortfolioQueryResponse)
+
+    _classes = {
+        AgrPortfolioQueryResponse: (AgrPortfolioQueryResponseCongestionPoint, AgrPortfolioQueryResponseConnection),
+        DsoPortfolioQueryResponse: (DsoPortfolioQueryCongestionPoint, DsoPortfolioQueryConnection),
+    }
+
+    def congestion_points(self):
+        """
+        Yield a (congestion_point, connections) tuple for every
+        congestion point, in which connections is an iterator over
+        the connections of that congestion point. Consume the
+        connections before moving on to the next congestion point;
+        any connections that were not consumed are skipped.
+
+        Connections in an AgrPortfolioQueryResponse that are not part
+        of a congestion point are yielded with None as the congestion
+        point.
+        """
+        congestion_point_class, connection_class = self._classes[self.message_type]
+        dso_domain = None
+        for event, element in self._iter_events():
+            tag = element.tag
+            if event == "start" and tag == "DSO-Portfolio":
+                dso_domain = element.get("DSO-Domain")
+            elif event == "start" and tag == "CongestionPoint":
+                congestion_point = PortfolioCongestionPoint(
+                    dso_domain=dso_domain,
+                    **parse_attributes(congestion_point_class, element),
+                )
+                connections = self._children("CongestionPoint", "Connection", connection_class)
+                yield congestion_point, connections
+                for _ in connections:
+                    pass
+            elif event == "end" and tag == "Connection":
+                # Connections of the DSO-View, that are not part of a
+                # congestion point. These come after all portfolios.
+                first = parse_element(connection_class, element)
+                release(element)
+                connections = self._children("DSO-View", "Connection", connection_class, first=first)
+                yield None, connections
+                for _ in connections:
+                    pass
+            elif event == "end" and tag in ("DSO-Portfolio", "DSO-View"):
+                dso_domain = None
+                release(element)
+
+
+class FlexSettlementReader(MessageReader):
+    """
+    Streaming reader for FlexSettlement messages.
+
+    Usage:
+
+    for flex_order_settlement in reader.flex_order_settlements():
+        ...
+    for contract_settlement in reader.contract_settlements():
+        ...
+    """
+
+    message_types = (FlexSettlement,)
+
+    root_elements = {
+        "FlexOrderSettlement": FlexOrderSettlement,
+        "ContractSettlement": ContractSettlement,
+    }
+
+    def flex_order_settlements(self):
+        """
+        Yield the FlexOrderSettlements, one at a time.
+        """
+        return self._root_elements("FlexOrderSettlement")
+
+    def contract_settlements(self):
+        """
+        Yield the ContractSettlements, one at a time. These come after
+        the FlexOrderSettlements; any FlexOrderSettlements that were
+        not read yet are skipped.
+        """
+        return self._root_elements("ContractSettlement")
+
+
+readers = {
+    AgrPortfolioQueryResponse: PortfolioQueryResponseReader,
+    DsoPortfolioQueryResponse: PortfolioQueryResponseReader,
+    FlexSettlement: FlexSettlementReader,
+}
+
+
+class MessageWriter:
+    """
+    Base class for the streaming writers. The attributes of the
+    message (like period_start and conversation_id) are given to the
+    constructor, and can be changed until the message is serialized.
+    The repeated child elements are serialized as they are written.
+    """
+
+    message_type = None
+
+    # The classes of the root element's repeated children, by tag, in
+    # the order in which they must be written, with their minimum
+    # number of occurrences.
+    root_elements = {}
+
+    def __init__(self, **attributes):
+        fields = {field.name: field for field in dataclasses.fields(self.message_type)}
+        attribute_names = [var.name for var in _context.build(self.message_type).get_attribute_vars()]
+        for name in attributes:
+            if name not in attribute_names:
+                raise TypeError(f"{self.__class__.__name__}() got an unexpected keyword argument '{name}'")
+        for name in attribute_names:
+            field = fields[name]
+            if name in attributes:
+                value = attributes[name]
+            elif field.default is not dataclasses.MISSING:
+                value = field.default
+            elif field.default_factory is not dataclasses.MISSING:
+                value = field.default_factory()
+            else:
+                raise TypeError(f"{self.__class__.__name__}() missing required keyword argument: '{name}'")
+            setattr(self, name, value)
+        self._buffer = bytearray()
+        self._counts = dict.fromkeys(self.root_elements, 0)
+        self._position = 0
+
+    def __repr__(self):
+        counts = ", ".join(f"{count} {tag}" for tag, count in self._counts.items())
+        return f"<{self.__class__.__name__} for {self.message_type.__name__} with {counts}>"
+
+    def _write(self, tag: str, item):
+        """
+        Serialize a child element of the root and add it to the buffer.
+        """
+        order = list(self.root_elements)
+        clazz, _ = self.root_elements[tag]
+        if not isinstance(item, clazz):
+            raise TypeError(f"Expected a {clazz.__name__}, not {type(item)}")
+        if order.index(tag) < self._position:
+            raise ValueError(f"{tag} elements must be written before {order[self._position]} elements")
+        self._position = order.index(tag)
+        out = []
+        try:
+            xml_codecs.get_codec(clazz).serialize(item, out, f"<{tag}", f"</{tag}>")
+        except xml_codecs.UnsupportedContent as exc:
+            raise ValueError(f"The {tag} can not be serialized: {exc}") from exc
+        self._buffer += "".join(out).encode("utf-8")
+        self._counts[tag] += 1
+
+    def to_xml(self) -> bytes:
+        """
+        Return the complete XML message, the same as transport.to_xml()
+        would for the equivalent message, as bytes.
+        """
+        for tag, (_, min_occurs) in self.root_elements.items():
+            if self._counts[tag] < min_occurs:
+                raise ValueError(
+                    f"At least {min_occurs} {tag} element(s) must be written, not {self._counts[tag]}"
+                )
+        qname = _context.build(self.message_type).qname
+        try:
+            attributes = xml_codecs.serialize_attributes(self.message_type, self)
+        except xml_codecs.UnsupportedContent as exc:
+            raise ValueError(f"The {qname} attributes can not be serialized: {exc}") from exc
+        start = f"{xml_codecs.XML_DECLARATION}<{qname}{attributes}>".encode("utf-8")
+        return b"".join((start, self._buffer, f"</{qname}>".encode("utf-8")))
+
+
+class FlexSettlementWriter(MessageWriter):
+    """
+    Streaming writer for FlexSettlement messages.
+
+    Usage:
+
+    writer = FlexSettlementWriter(period_start=..., period_end=..., currency="EUR")
+    for order in orders:
+        writer.write_flex_order_settlement(FlexOrderSettlement(...))
+    writer.write_contract_settlement(ContractSettlement(...))
+    client.send_flex_settlement(writer)
+    """
+
+    message_type = FlexSettlement
+
+    root_elements = {
+        "FlexOrderSettlement": (FlexOrderSettlement, 1),
+        "ContractSettlement": (ContractSettlement, 1),
+    }
+
+    def write_flex_order_settlement(self, flex_order_settlement: FlexOrderSettlement):
+        """
+        Add a FlexOrderSettlement to the message.
+        """
+        self._write("FlexOrderSettlement", flex_order_settlement)
+
+    def write_contract_settlement(self, contract_settlement: ContractSettlement):
+        """
+        Add a ContractSettlement to the message. These must be written
+        after all FlexOrderSettlements.
+        """
+        self._write("ContractSettlement", contract_settlement)
+
+
+def write_flex_settlement(flex_order_settlements, contract_settlements, **attributes) -> FlexSettlementWriter:
+    """
+    Build a FlexSettlement from (generators of) FlexOrderSettlements and
+    ContractSettlements, without keeping them all in memory.
+    """
+    writer = FlexSettlementWriter(**attributes)
+    for flex_order_settlement in flex_order_settlements:
+        writer.write_flex_order_settlement(flex_order_settlement)
+    for contract_settlement in contract_settlements:
+        writer.write_contract_settlement(contract_settlement)
+    return writer
+
+
+def parse_attributes(clazz: type, element) -> dict:
+    """
+    Convert the XML attributes of the element to a dict of field
+    values of the given class. Missing attributes are None.
+    """
+    attributes = {}
+    for var in _context.build(clazz).get_attribute_vars():
+        value = element.get(var.qname)
+        if value is not None:
+            try:
+                value = converter.deserialize(value, var.types, format=var.format)
+            except ConverterError as exc:
+                raise SchemaException(f"Invalid value for {var.qname}: {exc}") from exc
+        attributes[var.name] = value
+    return attributes
+
+
+def parse_element(clazz: type, element):
+    """
+    Parse a complete element into an object of the given class.
+    """
+    try:
+        return xml_codecs.get_codec(clazz).parse(element)
+    except Exception as exc:  # pylint: disable=broad-exception-caught
+        raise SchemaException(f"Invalid {element.tag} element: {exc}") from exc
+
+
+def release(element):
+    """
+    Free the memory of an element that has been handled, and of its
+    preceding siblings.
+    """
+    element.clear(keep_tail=True)
+    parent = element.getparent()
+    if parent is not None:
+        while element.getprevious() is not None:
+            del parent[0]
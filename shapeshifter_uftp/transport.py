@@ -1,12 +1,18 @@
 """
 Defines the message transport, including message signatures.
 """
+import json
+import logging
+import os
 import re
+import tempfile
 from base64 import b64decode, b64encode
 from binascii import Error as BinAsciiError
-from datetime import datetime
+from binascii import a2b_base64
 
+import dns.exception
 import dns.resolver
+from lxml import etree
 from nacl.bindings import crypto_sign, crypto_sign_open
 from nacl.exceptions import BadSignatureError
 from xsdata.exceptions import ParserError
@@ -15,49 +21,77 @@ from xsdata.formats.dataclass.parsers import JsonParser, XmlParser
 from xsdata.formats.dataclass.serializers import JsonSerializer, XmlSerializer
 from xsdata.formats.dataclass.serializers.config import SerializerConfig
 
+from . import keys, xml_codecs
+from .cache import Expiring, cacheable, ttl_cache
 from .exceptions import (
     AuthenticationTimeoutException,
     InvalidSignatureException,
     SchemaException,
     ServiceDiscoveryException,
 )
+from .keys import SigningKey, VerifyKey
 from .logging import logger
-from .uftp import PayloadMessage, SignedMessage
+from .streaming import MessageWriter
+from .uftp import PayloadMessage, SignedMessage, UsefRole
 
 _context = XmlContext()
-serializer = XmlSerializer(context=_context, config=SerializerConfig(indent="  "))
+
+# Messages are serialized without indentation for signing and sending,
+# which keeps the signed payload (and the network traffic) small. The
+# pretty serializer is meant for logging and debugging.
+serializer = XmlSerializer(context=_context)
+pretty_serializer = XmlSerializer(context=_context, config=SerializerConfig(indent="  "))
 parser = XmlParser(context=_context)
 
+# When enabled, messages are serialized and parsed by the compiled
+# codecs in xml_codecs, which produce the same results as xsdata but
+# are faster. This can be changed at runtime.
+USE_COMPILED_CODECS = False
+
 json_serializer = JsonSerializer()
 json_parser = JsonParser()
 
-def seal_message(message: PayloadMessage, private_key: str) -> bytes:
+def seal_message(message: PayloadMessage | MessageWriter, private_key: str | SigningKey) -> bytes:
     """
     Sign a message using the provided private key. The message should
-    be of type PayloadMessage (or any subtype thereof). The private
-    key should be given in base64-encoded form.
+    be of type PayloadMessage (or any subtype thereof), or a streaming
+    MessageWriter. The private key should be given in base64-encoded
+    form, or as a decoded SigningKey.
 
     The message will be returned as an opaque blob op base64 bytes.
     (In reality, this is the 64-byte signature prepended to the
     original XML message.)
     """
-    if not isinstance(message, PayloadMessage):
+    if isinstance(message, MessageWriter):
+        serialized_message = message.to_xml()
+    elif isinstance(message, PayloadMessage):
+        serialized_message = to_xml(message).encode("utf-8")
+    else:
         raise TypeError(f"'message', must be of type PayloadMessage, got: {type(message)}")
 
-    serialized_message = to_xml(message)
-    logger.debug(f"Signing outgoing message {serialized_message}")
-    sealed_message = crypto_sign(serialized_message.encode("utf-8"), b64decode(private_key))
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Signing outgoing message %s", serialized_message.decode("utf-8"))
+    sealed_message = crypto_sign(serialized_message, keys.signing_key(private_key).raw)
     return sealed_message
 
 
-def unseal_message(message: bytes, public_key: str) -> PayloadMessage:
+def unseal_message(message: bytes, public_key: str | VerifyKey) -> PayloadMessage:
     """
     Validate a message's signature using the provided public key.
     The message can be given as a string or as bytes. The public
-    key should be given in base64-encoded form.
+    key should be given in base64-encoded form, or as a decoded
+    VerifyKey.
 
     The message will be returned as a PayloadMessage object.
     """
+    return parse_message(verify_message(message, public_key))
+
+
+def verify_message(message: bytes, public_key: str | VerifyKey) -> bytes:
+    """
+    Validate a message's signature using the provided public key, and
+    return the signed XML message as bytes, without parsing it.
+    """
     if public_key is None:
         logger.warning(
             "When calling unseal_message, no public key was provided. "
@@ -65,28 +99,150 @@ def unseal_message(message: bytes, public_key: str) -> PayloadMessage:
         )
         raise TypeError("'public_key' must be of type 'str', not None")
     try:
-        unsealed_message = crypto_sign_open(message, b64decode(public_key))
-        logger.debug(f"Incoming Message: {unsealed_message.decode('utf-8')}")
-        return from_xml(unsealed_message)
+        unsealed_message = crypto_sign_open(message, keys.verify_key(public_key).raw)
     except BadSignatureError as exc:
-        logger.warning(f"The XML Signature for message {message} does not match the public key {public_key}: {exc}.")
+        logger.warning("The XML Signature for message %s does not match the public key %s: %s.", message, public_key, exc)
         raise InvalidSignatureException() from exc
+    except (TypeError, ValueError) as exc:
+        logger.warning("The incoming message %s could not be verified: %s.", message, exc)
+        raise SchemaException(str(exc)) from exc
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Incoming Message: %s", unsealed_message.decode("utf-8"))
+    return unsealed_message
+
+
+def parse_message(message: bytes) -> PayloadMessage:
+    """
+    Parse a verified XML message, raising a SchemaException if it
+    does not conform to the XML schema.
+    """
+    try:
+        return from_xml(message)
     except (ParserError, TypeError, ValueError) as exc:
-        logger.warning(f"The incoming XML Message {message} does not conform to the XML schema: {exc}.")
+        logger.warning("The incoming XML Message %s does not conform to the XML schema: %s.", message, exc)
         raise SchemaException(str(exc)) from exc
 
 
-def to_xml(message: PayloadMessage | SignedMessage) -> str:
+def to_xml(message: PayloadMessage | SignedMessage, pretty: bool = False) -> str:
     """
-    Serialize the given PayloadMessage into an XML string.
+    Serialize the given PayloadMessage into an XML string. The result
+    is compact, unless 'pretty' is set, in which case it is indented
+    for readability.
     """
+    if pretty:
+        return pretty_serializer.render(message)
+    if USE_COMPILED_CODECS:
+        return xml_codecs.to_xml(message)
     return serializer.render(message)
 
 
+def to_signed_xml(sender_domain: str, sender_role: str, sealed_message: bytes) -> bytes:
+    """
+    Serialize a SignedMessage envelope around the given sealed message,
+    directly into bytes. The result is the same as that of
+    to_xml(SignedMessage(...)).encode(), but the envelope is simple
+    enough that it does not have to go through the serializer, which
+    saves a second rendering pass and a copy of the (large) body.
+    """
+    return b"".join((
+        b'<?xml version="1.0" encoding="UTF-8"?>\n<SignedMessage SenderDomain="',
+        _attribute_value(sender_domain),
+        b'" SenderRole="',
+        _attribute_value(sender_role),
+        b'" Body="',
+        b64encode(sealed_message),
+        b'"/>',
+    ))
+
+
+def _attribute_value(value) -> bytes:
+    try:
+        return xml_codecs.escape_attribute(str(value)).encode("utf-8")
+    except xml_codecs.UnsupportedContent as exc:
+        raise ValueError(f"Invalid attribute value {value!r}: {exc}") from exc
+
+
+class SignedMessageParser:
+    """
+    Incremental parser for an incoming SignedMessage envelope. Feed it
+    the request body in chunks, and call close() to get the
+    SignedMessage.
+
+    The envelope only consists of three attributes on a single
+    element, so this reads them straight from a streaming XML parser
+    instead of going through the dataclass parser, and decodes the
+    body in a single pass.
+    """
+
+    def __init__(self):
+        self._parser = etree.XMLPullParser(
+            events=("start",),
+            resolve_entities=False,
+            no_network=True,
+            huge_tree=True,
+        )
+        self._attributes = None
+
+    def feed(self, data: bytes):
+        """
+        Feed the next chunk of the envelope to the parser.
+        """
+        try:
+            self._parser.feed(data)
+        except etree.XMLSyntaxError as exc:
+            raise SchemaException(f"The SignedMessage is not well-formed XML: {exc}") from exc
+        if self._attributes is None:
+            for _, element in self._parser.read_events():
+                if element.tag != "SignedMessage":
+                    raise SchemaException(f"Expected a SignedMessage, got: {element.tag}")
+                self._attributes = element.attrib
+                break
+
+    def close(self) -> SignedMessage:
+        """
+        Finish parsing and return the SignedMessage.
+        """
+        try:
+            self._parser.close()
+        except etree.XMLSyntaxError as exc:
+            raise SchemaException(f"The SignedMessage is not well-formed XML: {exc}") from exc
+        if self._attributes is None:
+            raise SchemaException("The request did not contain a SignedMessage")
+
+        try:
+            sender_domain = self._attributes["SenderDomain"]
+            sender_role = UsefRole(self._attributes["SenderRole"])
+            body = _decode_body(self._attributes["Body"])
+        except KeyError as exc:
+            raise SchemaException(f"The SignedMessage is missing the {exc.args[0]} attribute") from exc
+        except ValueError as exc:
+            raise SchemaException(f"The SignedMessage is invalid: {exc}") from exc
+        return SignedMessage(sender_domain=sender_domain, sender_role=sender_role, body=body)
+
+
+def parse_signed_message(data: bytes) -> SignedMessage:
+    """
+    Parse a complete SignedMessage envelope using SignedMessageParser.
+    """
+    parser = SignedMessageParser()
+    parser.feed(data)
+    return parser.close()
+
+
+def _decode_body(value: str) -> bytes:
+    try:
+        return a2b_base64(value, strict_mode=True)
+    except BinAsciiError:
+        # Like the dataclass parser, allow whitespace in the body.
+        return a2b_base64(re.sub(r"\s+", "", value), strict_mode=True)
+
+
 def from_xml(message: str | bytes):
     """
     Parse the given message string into a Shapeshifter UFTP object.
     """
+    if USE_COMPILED_CODECS and isinstance(message, (str, bytes)):
+        return xml_codecs.from_xml(message)
     if isinstance(message, str):
         return parser.from_string(message)
     if isinstance(message, bytes):
@@ -109,40 +265,92 @@ def from_json(message: str, message_type: type):
     return json_parser.from_string(message, message_type)
 
 
-def ttl_cache(ttl):
+# Discovery results are cached for the TTL of the DNS record they came
+# from, bounded by DNS_MIN_TTL and DNS_MAX_TTL. Negative answers (the
+# name or record does not exist, or is invalid) are cached for
+# DNS_NEGATIVE_TTL, so that repeated messages from unknown senders
+# don't each cause a DNS query. After a positive result expires, it is
+# still used for DISCOVERY_CACHE_STALE_TTL seconds while it is
+# refreshed in the background. These values can be changed at runtime;
+# DISCOVERY_CACHE_SIZE takes effect when the next result is stored.
+DNS_MIN_TTL = 60
+DNS_MAX_TTL = 3600
+DNS_NEGATIVE_TTL = 60
+DISCOVERY_CACHE_STALE_TTL = 600
+DISCOVERY_CACHE_SIZE = 4096
+
+
+def record_ttl(ttl: int) -> float:
     """
-    Caching decorator that will cache the result of an operation for 'ttl' seconds.
+    Clamp the TTL of a DNS record to the configured bounds.
     """
+    return min(max(ttl, DNS_MIN_TTL), DNS_MAX_TTL)
 
-    def decorator(func):
-        cached_values = {}
 
-        def wrapper(*args, **kwargs):
-            # Create the cache key from the args and kwargs.
-            cache_key = args
-            if kwargs:
-                cache_key += tuple((kwargs.items()))
+def _resolve(dns_name: str, rdtype: str, exception_class: type, description: str):
+    """
+    Resolve a DNS record, and return the first record of the answer
+    together with its (bounded) TTL.
+    """
+    try:
+        rrset = dns.resolver.resolve(dns_name, rdtype).response.answer[0]
+    except dns.exception.DNSException as exc:
+        raise lookup_error(exc, dns_name, rdtype, exception_class, description) from exc
+    return rrset[0], record_ttl(rrset.ttl)
 
-            # Look up the cache key in the cache
-            if cache_key in cached_values:
-                expiration, data = cached_values[cache_key]
-                if expiration > datetime.now().timestamp():
-                    return data
 
-                # If the key was expired, delete it from the cache.
-                del cached_values[cache_key]
+def lookup_error(exc, dns_name: str, rdtype: str, exception_class: type, description: str) -> Exception:
+    """
+    Translate a DNS error into the exception that is raised to the
+    caller. Negative answers are marked as cacheable.
+    """
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        # Indicates that the domain does not even exist
+        return cacheable(
+            exception_class(f"Could not retrieve {description} at {dns_name}: DNS name not found."),
+            DNS_NEGATIVE_TTL,
+        )
+    if isinstance(exc, dns.resolver.NoAnswer):
+        return cacheable(
+            exception_class(f"Could not retrieve {description} at {dns_name}: no {rdtype} record found."),
+            DNS_NEGATIVE_TTL,
+        )
+    if isinstance(exc, dns.resolver.NoNameservers):
+        return ServiceDiscoveryException(
+            f"Could not retrieve {description} at {dns_name} because no DNS server was available (SERVFAIL). "
+            "Make sure your network setup is working properly. This is not a problem with the receiving participant."
+        )
+    return ServiceDiscoveryException(
+        f"Could not retrieve {description} at {dns_name}: {exc.__class__.__name__}: {exc}"
+    )
 
-            # If not in cache or cache expired, call the original function and return the result
-            data = func(*args, **kwargs)
-            cached_values[cache_key] = (datetime.now().timestamp() + ttl, data)
-            return data
 
-        return wrapper
+def keys_dns_name(domain, role):
+    """
+    The DNS name at which a participant publishes its public keys.
+    """
+    return f"_{role}._usef.{domain}"
 
-    return decorator
 
+def endpoint_dns_name(domain, role):
+    """
+    The DNS name at which a participant publishes its endpoint.
+    """
+    return f"_http._{role}._usef.{domain}"
 
-@ttl_cache(3600)
+
+def version_dns_name(domain):
+    """
+    The DNS name at which a participant publishes its Shapeshifter version.
+    """
+    return f"_usef.{domain}"
+
+
+@ttl_cache(
+    lambda: DNS_MAX_TTL,
+    maxsize=lambda: DISCOVERY_CACHE_SIZE,
+    stale_ttl=lambda: DISCOVERY_CACHE_STALE_TTL,
+)
 def get_keys(domain, role):
     """
     Retrieve the sender's public key using a DNS request. These are published at
@@ -151,58 +359,59 @@ def get_keys(domain, role):
     """
 
     # Perform the DNS lookup at the well-known DNS name
-    try:
-        dns_name = f"_{role}._usef.{domain}"
-        result = dns.resolver.resolve(dns_name, "TXT").response.answer[0][0].strings[0]
-    except dns.resolver.NXDOMAIN as exc:
-        # Indicates that the domain does not even exist
-        raise AuthenticationTimeoutException(
-            f"Could not retrieve public keys at {dns_name}: DNS name not found."
-        ) from exc
-    except dns.resolver.NoNameservers as exc:
-        raise ServiceDiscoveryException(
-            f"Could not retrieve public key at {dns_name} because no DNS server was available (SERVFAIL). "
-            "Make sure your network setup is working properly. This is not a problem with the receiving participant."
-        ) from exc
+    dns_name = keys_dns_name(domain, role)
+    record, ttl = _resolve(dns_name, "TXT", AuthenticationTimeoutException, "public keys")
+    return Expiring(parse_keys(dns_name, record), ttl)
 
 
+def parse_keys(dns_name, record):
+    """
+    Parse the (verify key, encryption key) pair from the TXT record
+    that was published at the given DNS name.
+    """
+    result = record.strings[0]
+
     # Now verify that the string begins with `cs1.`
     if not result.startswith(b"cs1."):
-        raise AuthenticationTimeoutException(
+        raise cacheable(AuthenticationTimeoutException(
             f"Could not retrieve public keys at {dns_name}: "
             f"invalid string (must start with 'cs1.', was: {result.decode()})"
-        )
+        ), DNS_NEGATIVE_TTL)
 
     # Verify that the string is of the expected length (4 + 44 bytes or 4 + 88 bytes)
     if len(result) not in (48, 92):
-        raise AuthenticationTimeoutException(
+        raise cacheable(AuthenticationTimeoutException(
             f"Could not retrieve public key(s) at {dns_name}: "
             f"string '{result}' was not of appropriate length (48 or 90 characters)"
-        )
+        ), DNS_NEGATIVE_TTL)
 
     # Now try to decode the string using base64
     try:
         combined_keys = b64decode(result[4:])
     except BinAsciiError as exc:
-        raise AuthenticationTimeoutException(
+        raise cacheable(AuthenticationTimeoutException(
             f"Could not retrieve public keys at {dns_name}: "
             f"string '{result[4:].decode()}' is not valid base64."
-        ) from exc
+        ), DNS_NEGATIVE_TTL) from exc
 
     # Now verify that the decoded length is 64
     if len(combined_keys) not in (32, 64):
-        raise AuthenticationTimeoutException(
+        raise cacheable(AuthenticationTimeoutException(
             f"Could not retrieve public keys at {dns_name}: "
             f"decoded base64 data should be 32 or 64 bytes long, "
             f"length is: {len(combined_keys)}."
-        )
+        ), DNS_NEGATIVE_TTL)
 
     # Now split the two bytestrings; the first will be the verify key,
-    # the second will be the encryption key.
+    # the second will be the encryption key. The verify key is kept in
+    # decoded form as well, so that it is not decoded again for every
+    # message that it verifies.
+    verify_key = VerifyKey(combined_keys[:32])
+    keys.remember(verify_key)
     if len(combined_keys) == 32:
-        return b64encode(combined_keys).decode(), None
+        return verify_key.encoded, None
 
-    return b64encode(combined_keys[:32]).decode(), b64encode(combined_keys[32:]).decode()
+    return verify_key.encoded, b64encode(combined_keys[32:]).decode()
 
 
 def get_key(domain, role):
@@ -211,48 +420,127 @@ def get_key(domain, role):
     """
     return get_keys(domain, role)[0]
 
-@ttl_cache(3600)
+@ttl_cache(
+    lambda: DNS_MAX_TTL,
+    maxsize=lambda: DISCOVERY_CACHE_SIZE,
+    stale_ttl=lambda: DISCOVERY_CACHE_STALE_TTL,
+)
 def get_endpoint(domain, role):
     """
     Retrieve the recipient's endpoint using DNS. These are published at the
     well-know DNS name _usef._role._domain
     """
-    dns_name = f"_http._{role}._usef.{domain}"
-    try:
-        result = (
-            dns.resolver.resolve(dns_name, "CNAME")
-            .response.answer[0][0]
-            .to_text()
-        )
-    except dns.resolver.NXDOMAIN as exc:
-        raise ServiceDiscoveryException(
-            f"Could not retrieve endpoint at {dns_name}: DNS name not found."
-        ) from exc
+    dns_name = endpoint_dns_name(domain, role)
+    record, ttl = _resolve(dns_name, "CNAME", ServiceDiscoveryException, "endpoint")
 
     # To complete the URL, get the endpoint version
     version = get_version(domain)
-    major_version = version.split(".")[0]
+    return Expiring(endpoint_url(record, version), ttl)
 
-    # Construct the well-known URL using the retrieved endpoint domain and version
-    endpoint_url = f"https://{result.removesuffix('.')}/shapeshifter/api/v{major_version}/message"
-    return endpoint_url
 
+def endpoint_url(record, version):
+    """
+    Construct the well-known URL using the retrieved endpoint domain and version
+    """
+    major_version = version.split(".")[0]
+    return f"https://{record.to_text().removesuffix('.')}/shapeshifter/api/v{major_version}/message"
 
-@ttl_cache(3600)
+
+@ttl_cache(
+    lambda: DNS_MAX_TTL,
+    maxsize=lambda: DISCOVERY_CACHE_SIZE,
+    stale_ttl=lambda: DISCOVERY_CACHE_STALE_TTL,
+)
 def get_version(domain):
     """
     Retrieve the supported Shapeshifter versions by the recipient.
     These are published at the well-known DNS name _usef._domain.
     """
-    dns_name = f"_usef.{domain}"
+    dns_name = version_dns_name(domain)
+    record, ttl = _resolve(dns_name, "TXT", ServiceDiscoveryException, "version")
+    return Expiring(parse_version(record), ttl)
+
+
+def parse_version(record):
+    """
+    Parse the Shapeshifter version from the TXT record that a
+    participant published at its version DNS name.
+    """
+    result = record.strings[0].decode().strip()
+    if not re.match(r"[0-9]+\.[0-9]+\.[0-9]+", result):
+        raise cacheable(ServiceDiscoveryException(
+            f"The retrieved version was not in the format X.Y.Z: {result}"
+        ), DNS_NEGATIVE_TTL)
+    return result
+
+
+def _discovery_caches():
+    return {
+        "keys": get_keys.cache,
+        "endpoint": get_endpoint.cache,
+        "version": get_version.cache,
+    }
+
+
+def discovery_cache_stats() -> dict:
+    """
+    Return the hit, miss and eviction counters of the service
+    discovery caches.
+    """
+    return {name: cache.stats.as_dict() for name, cache in _discovery_caches().items()}
+
+
+def save_discovery_cache(path: str):
+    """
+    Write the current service discovery results, with their expiry
+    times, to a JSON file. The file is replaced atomically.
+    """
+    data = {
+        name: [
+            {"key": list(key), "value": value, "expires_at": expires_at, "stale_until": stale_until}
+            for key, value, expires_at, stale_until in cache.dump()
+        ]
+        for name, cache in _discovery_caches().items()
+    }
+    # Each writer uses its own temporary file, so that concurrent saves
+    # don't write into the same file.
+    file = tempfile.NamedTemporaryFile(  # pylint: disable=consider-using-with
+        "w", encoding="utf-8", dir=os.path.dirname(path) or ".", suffix=".tmp", delete=False
+    )
+    try:
+        with file:
+            json.dump(data, file)
+        os.replace(file.name, path)
+    except BaseException:
+        os.unlink(file.name)
+        raise
+
+
+def load_discovery_cache(path: str) -> int:
+    """
+    Load service discovery results that were written by
+    save_discovery_cache(). Results that have expired since are
+    revalidated in the background when they are first used. Returns
+    the number of results that were loaded.
+    """
     try:
-        result = dns.resolver.resolve(dns_name, "TXT").response.answer[0][0].strings[0].decode().strip()
-        if not re.match(r"[0-9]+\.[0-9]+\.[0-9]+", result):
-            raise ServiceDiscoveryException(
-                f"The retrieved version was not in the format X.Y.Z: {result}"
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        restored = 0
+        for name, cache in _discovery_caches().items():
+            restored += cache.restore(
+                (
+                    tuple(entry["key"]),
+                    tuple(entry["value"]) if name == "keys" else entry["value"],
+                    entry["expires_at"],
+                    entry["stale_until"],
+                )
+                for entry in data.get(name, [])
             )
-        return result
-    except dns.resolver.NXDOMAIN as exc:
-        raise ServiceDiscoveryException(
-            f"Could not retrieve version at {dns_name}: DNS name not found."
-        ) from exc
+    except FileNotFoundError:
+        return 0
+    except (OSError, ValueError, TypeError, KeyError) as exc:
+        logger.warning("Could not load the discovery cache from %s: %s: %s", path, exc.__class__.__name__, exc)
+        return 0
+    logger.info("Loaded %d service discovery results from %s", restored, path)
+    return restored
@@ -0,0 +1,282 @@
+"""
+Compiled XML codecs for the UFTP message classes.
+
+The xsdata serializer and parser inspect the metadata of every object
+they encounter, for every message. This module instead generates a
+specialized serialize and parse function per message class, once, on
+first use, from the same xsdata metadata. The generated code reads
+and writes the attributes and child elements of that class directly.
+
+The output is identical to that of the (compact) xsdata serializer,
+and parsing results in the same objects as the xsdata parser. Anything
+that the generated code does not handle (namespaces, xsi:type,
+unexpected content, values that can't be converted) makes it fall back
+to xsdata for that message, so that the behavior, including any
+errors or warnings, stays the same.
+
+Enable the codecs for the transport functions by setting
+transport.USE_COMPILED_CODECS to True.
+"""
+import re
+from enum import Enum
+
+from lxml import etree
+from xsdata.formats.converter import converter
+from xsdata.formats.dataclass.context import XmlContext
+from xsdata.formats.dataclass.parsers import XmlParser
+from xsdata.formats.dataclass.serializers import XmlSerializer
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>\n'
+
+_context = XmlContext()
+_serializer = XmlSerializer(context=_context)
+_parser = XmlParser(context=_context)
+_xml_parser = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=True)
+
+# Characters that lxml refuses to serialize; values that contain them
+# are left to xsdata, which raises the appropriate error.
+_invalid_characters = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff￾￿]")
+_special_characters = re.compile('[&<>"\n\r\t]')
+_escapes = {
+    "&": "&amp;",
+    "<": "&lt;",
+    ">": "&gt;",
+    '"': "&quot;",
+    "\n": "&#10;",
+    "\r": "&#13;",
+    "\t": "&#9;",
+}
+
+
+class UnsupportedContent(Exception):
+    """
+    Raised by the compiled codecs for content that they leave to xsdata.
+    """
+
+
+def escape_attribute(value: str) -> str:
+    """
+    Escape an attribute value in the same way as the lxml writer.
+    """
+    if _invalid_characters.search(value):
+        raise UnsupportedContent("Value contains characters that are not allowed in XML")
+    if _special_characters.search(value):
+        return _special_characters.sub(lambda match: _escapes[match.group()], value)
+    return value
+
+
+def _attribute_value(value, fmt) -> str:
+    if type(value) is str:  # pylint: disable=unidiomatic-typecheck
+        return escape_attribute(value)
+    if type(value) is int:  # pylint: disable=unidiomatic-typecheck
+        return str(value)
+    if isinstance(value, Enum):
+        return _attribute_value(value.value, fmt)
+    return escape_attribute(converter.serialize(value, format=fmt))
+
+
+def _deserialize(value: str, types: list, fmt):
+    return converter.deserialize(value, types, format=fmt)
+
+
+class Codec:
+    """
+    The compiled serialize and parse functions for a single class.
+    """
+
+    def __init__(self, clazz: type, serialize, parse):
+        self.clazz = clazz
+        self.serialize = serialize
+        self.parse = parse
+
+
+_codecs = {}
+_root_classes = {}
+
+
+def get_codec(clazz: type) -> Codec:
+    """
+    Return the compiled codec for the class, compiling it on first use.
+    """
+    codec = _codecs.get(clazz)
+    if codec is None:
+        try:
+            codec = compile_codec(clazz)
+        except UnsupportedContent:
+            codec = Codec(clazz, _unsupported, _unsupported)
+        _codecs[clazz] = codec
+    return codec
+
+
+def _unsupported(*args):
+    raise UnsupportedContent("This class can not be compiled")
+
+
+def compile_codec(clazz: type) -> Codec:
+    """
+    Generate the serialize and parse functions for a dataclass, and
+    for the classes of its child elements.
+    """
+    meta = _context.build(clazz)
+    namespace = {
+        "clazz": clazz,
+        "attribute_value": _attribute_value,
+        "deserialize": _deserialize,
+        "get_codec": get_codec,
+        "UnsupportedContent": UnsupportedContent,
+    }
+    serialize_lines = ["def serialize(obj, out, open_tag, close_tag):", "    append = out.append", "    append(open_tag)"]
+    parse_lines = [
+        "def parse(element):",
+        "    attrib = element.attrib",
+        "    for key in attrib:",
+        "        if key[0] == '{':",
+        "            raise UnsupportedContent(key)",
+        "    text = element.text",
+        "    if text is not None and not text.isspace():",
+        "        raise UnsupportedContent('text')",
+        "    kwargs = {}",
+    ]
+
+    if meta.namespace or meta.wildcards or meta.any_attributes or meta.text or meta.wrappers or meta.choices:
+        raise UnsupportedContent(f"{clazz.__name__} uses XML features that are not compiled")
+
+    for index, var in enumerate(meta.get_attribute_vars()):
+        if not var.is_attribute or var.tokens or len(var.types) != 1 or var.namespaces:
+            raise UnsupportedContent(f"{clazz.__name__}.{var.name} can not be compiled")
+        namespace[f"format_{index}"] = var.format
+        namespace[f"types_{index}"] = list(var.types)
+        serialize_lines += [
+            f"    value = obj.{var.name}",
+            "    if value is not None:",
+            f"        append({' ' + var.qname + '=' + chr(34)!r})",
+            f"        append(attribute_value(value, format_{index}))",
+            "        append('\"')",
+        ]
+        (var_type,) = var.types
+        if var_type is str:
+            conversion = "value"
+        elif var_type is int:
+            conversion = "int(value)"
+        else:
+            conversion = f"deserialize(value, types_{index}, format_{index})"
+        parse_lines += [
+            f"    value = attrib.get({var.qname!r})",
+            "    if value is not None:",
+            f"        kwargs[{var.name!r}] = {conversion}",
+        ]
+
+    serialize_lines += ["    position = len(out)", "    append('/>')"]
+    children = []
+    for index, var in enumerate(meta.get_element_vars()):
+        if (
+            not var.is_element or var.clazz is None or len(var.types) != 1 or var.nillable
+            or var.is_clazz_union or var.sequence or var.namespaces or var.mixed
+        ):
+            raise UnsupportedContent(f"{clazz.__name__}.{var.name} can not be compiled")
+        child_clazz = var.clazz
+        namespace[f"child_{index}"] = child_clazz
+        open_tag, close_tag = f"<{var.qname}", f"</{var.qname}>"
+        write_child = [
+            f"if type(item) is not child_{index}:",
+            "    raise UnsupportedContent(type(item))",
+            f"get_codec(child_{index}).serialize(item, out, {open_tag!r}, {close_tag!r})",
+        ]
+        if var.list_element:
+            serialize_lines += [f"    for item in obj.{var.name}:", "        if item is not None:"]
+            serialize_lines += [f"            {line}" for line in write_child]
+            parse_lines += [f"    list_{index} = []"]
+            children.append((var.qname, [f"list_{index}.append(get_codec(child_{index}).parse(child))"]))
+        else:
+            serialize_lines += [f"    item = obj.{var.name}", "    if item is not None:"]
+            serialize_lines += [f"        {line}" for line in write_child]
+            children.append((var.qname, [
+                f"if {var.name!r} in kwargs:",
+                "    raise UnsupportedContent(tag)",
+                f"kwargs[{var.name!r}] = get_codec(child_{index}).parse(child)",
+            ]))
+
+    serialize_lines += [
+        "    if len(out) > position + 1:",
+        "        out[position] = '>'",
+        "        append(close_tag)",
+    ]
+
+    parse_lines += ["    for child in element:", "        tag = child.tag"]
+    keyword = "if"
+    for qname, lines in children:
+        parse_lines += [f"        {keyword} tag == {qname!r}:"]
+        parse_lines += [f"            {line}" for line in lines]
+        keyword = "elif"
+    if children:
+        parse_lines += ["        else:", "            raise UnsupportedContent(tag)"]
+    else:
+        parse_lines += ["        raise UnsupportedContent(tag)"]
+    parse_lines += [
+        "        tail = child.tail",
+        "        if tail is not None and not tail.isspace():",
+        "            raise UnsupportedContent('tail')",
+    ]
+    for index, var in enumerate(meta.get_element_vars()):
+        if var.list_element:
+            parse_lines += [f"    if list_{index}:", f"        kwargs[{var.name!r}] = list_{index}"]
+    parse_lines += ["    return clazz(**kwargs)"]
+
+    source = "\n".join(serialize_lines + [""] + parse_lines) + "\n"
+    exec(compile(source, f"<codec for {clazz.__name__}>", "exec"), namespace)  # pylint: disable=exec-used
+    return Codec(clazz, namespace["serialize"], namespace["parse"])
+
+
+def to_xml(message) -> str:
+    """
+    Serialize a message using its compiled codec. The result is the
+    same as that of the compact xsdata serializer.
+    """
+    qname = _context.build(type(message)).qname
+    out = [XML_DECLARATION]
+    try:
+        get_codec(type(message)).serialize(message, out, f"<{qname}", f"</{qname}>")
+    except UnsupportedContent:
+        return _serializer.render(message)
+    return "".join(out)
+
+
+def serialize_attributes(clazz: type, obj) -> str:
+    """
+    Serialize the XML attributes of the class, taking their values
+    from obj, in the same way as the compiled serializer.
+    """
+    out = []
+    for var in _context.build(clazz).get_attribute_vars():
+        value = getattr(obj, var.name)
+        if value is not None:
+            out.append(f' {var.qname}="{_attribute_value(value, var.format)}"')
+    return "".join(out)
+
+
+def from_xml(message: str | bytes):
+    """
+    Parse a message using the compiled codec of its root element.
+    """
+    if isinstance(message, str):
+        message = message.encode("utf-8")
+    try:
+        root = etree.fromstring(message, _xml_parser)
+        clazz = find_root_class(root.tag)
+        if clazz is None:
+            raise UnsupportedContent(root.tag)
+        return get_codec(clazz).parse(root)
+    except Exception:  # pylint: disable=broad-exception-caught
+        # Leave anything unexpected to xsdata, which raises the
+        # appropriate error (or handles the message after all).
+        return _parser.from_bytes(message)
+
+
+def find_root_class(tag: str):
+    """
+    Find the class for a root element in the same way as the xsdata
+    parser does.
+    """
+    if tag not in _root_classes:
+        _root_classes[tag] = _context.find_type(tag)
+    return _root_classes[tag]
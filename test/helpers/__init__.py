@@ -0,0 +1,13 @@
+import time
+
+
+def wait_until(condition, timeout: float = 5.0):
+    """
+    Poll the condition until it is true. Fails the test if it is not
+    true within 'timeout' seconds.
+    """
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise AssertionError(f"Timed out after {timeout} seconds waiting for {condition}")
+        time.sleep(0.001)
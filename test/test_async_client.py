@@ -0,0 +1,230 @@
+import asyncio
+import inspect
+import threading
+import time
+from datetime import datetime
+
+import pytest
+
+from shapeshifter_uftp import (
+    AsyncShapeshifterAgrDsoClient,
+    AsyncShapeshifterDsoAgrClient,
+    FlexOffer,
+    FlexRequest,
+)
+from shapeshifter_uftp.client import async_client_map, client_map
+from shapeshifter_uftp.exceptions import ClientTransportException
+from shapeshifter_uftp.oauth import OAuthClient
+
+from .helpers import wait_until
+from .helpers.messages import messages_by_type
+from .helpers.services import (
+    AGR_PRIVATE_KEY,
+    AGR_PUBLIC_KEY,
+    DSO_PRIVATE_KEY,
+    DSO_PUBLIC_KEY,
+    DummyAgrService,
+    DummyDsoService,
+    endpoint_lookup_function,
+    key_lookup_function,
+)
+
+
+def test_async_client_map():
+    assert async_client_map.keys() == client_map.keys()
+    for key, async_client_cls in async_client_map.items():
+        assert issubclass(async_client_cls, client_map[key])
+
+
+def test_async_send_flex_request():
+    async def send(client):
+        async with client:
+            await client.send_flex_request(messages_by_type[FlexRequest])
+
+    with DummyAgrService() as agr_service:
+        client = AsyncShapeshifterDsoAgrClient(
+            sender_domain="dso.dev",
+            signing_key=DSO_PRIVATE_KEY,
+            recipient_domain="agr.dev",
+            recipient_endpoint=endpoint_lookup_function("agr.dev", "AGR"),
+            recipient_signing_key=AGR_PUBLIC_KEY,
+        )
+        asyncio.run(send(client))
+        assert agr_service.request_futures["process_flex_request"].result(timeout=10) is not None
+        assert client.http_client is None
+
+
+class CountingDsoService(DummyDsoService):
+    """
+    Service whose key lookup takes a while, so that it can tell
+    whether the incoming requests overlap.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.key_lookup_function = self.slow_key_lookup
+        self.lock = threading.Lock()
+        self.message_ids = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def slow_key_lookup(self, domain, role):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.1)
+        self.in_flight -= 1
+        return key_lookup_function(domain, role)
+
+    def process_flex_offer(self, message):
+        with self.lock:
+            self.message_ids.append(message.message_id)
+
+
+def new_flex_offer():
+    message = messages_by_type[FlexOffer]
+    return FlexOffer(**{**vars(message), "message_id": None})
+
+
+def test_async_concurrent_sends():
+    async def send_many(client, messages):
+        async with client:
+            await asyncio.gather(*[client.send_flex_offer(message) for message in messages])
+
+    messages = [new_flex_offer() for _ in range(20)]
+    with CountingDsoService() as dso_service:
+        client = AsyncShapeshifterAgrDsoClient(
+            sender_domain="agr.dev",
+            signing_key=AGR_PRIVATE_KEY,
+            recipient_domain="dso.dev",
+            recipient_endpoint=endpoint_lookup_function("dso.dev", "DSO"),
+            recipient_signing_key=DSO_PUBLIC_KEY,
+        )
+        asyncio.run(send_many(client, messages))
+        wait_until(lambda: len(dso_service.message_ids) == len(messages), timeout=10)
+
+    assert sorted(dso_service.message_ids) == sorted(message.message_id for message in messages)
+    assert dso_service.max_in_flight > 1
+
+
+class SlowOAuthClient(OAuthClient):
+    def __init__(self):
+        super().__init__(url="http://oauth.dev/token", client_id="id", client_secret="secret")
+        self.threads = []
+
+    def authenticate(self):
+        self.threads.append(threading.current_thread())
+        time.sleep(0.1)
+        self.access_token = "token"
+        self.access_token_type = "Bearer"
+        self.access_token_expiry = datetime.now().timestamp() + 3600
+
+
+def test_async_oauth_does_not_block_event_loop():
+    async def send_many(client, messages):
+        ticks = 0
+
+        async def tick():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticker = asyncio.create_task(tick())
+        async with client:
+            await asyncio.gather(*[client.send_flex_offer(message) for message in messages])
+        ticker.cancel()
+        return ticks
+
+    oauth_client = SlowOAuthClient()
+    with DummyDsoService():
+        client = AsyncShapeshifterAgrDsoClient(
+            sender_domain="agr.dev",
+            signing_key=AGR_PRIVATE_KEY,
+            recipient_domain="dso.dev",
+            recipient_endpoint=endpoint_lookup_function("dso.dev", "DSO"),
+            recipient_signing_key=DSO_PUBLIC_KEY,
+            oauth_client=oauth_client,
+        )
+        ticks = asyncio.run(send_many(client, [new_flex_offer() for _ in range(5)]))
+
+    # The token is requested once, off the event loop, and the loop
+    # kept running while it was requested.
+    assert len(oauth_client.threads) == 1
+    assert oauth_client.threads[0] is not threading.main_thread()
+    assert ticks > 5
+
+
+def test_async_transport_error():
+    async def send(client):
+        async with client:
+            await client.send_flex_request(messages_by_type[FlexRequest])
+
+    with DummyAgrService():
+        client = AsyncShapeshifterDsoAgrClient(
+            sender_domain="dso.dev",
+            signing_key=DSO_PRIVATE_KEY,
+            recipient_domain="agr.dev",
+            recipient_endpoint="http://localhost:9001/wrong/path",
+            recipient_signing_key=AGR_PUBLIC_KEY,
+        )
+        with pytest.raises(ClientTransportException) as exc_info:
+            asyncio.run(send(client))
+        assert exc_info.value.response.status_code == 404
+
+
+def test_async_send_methods_are_coroutine_functions():
+    for key, client_cls in async_client_map.items():
+        for name, method in inspect.getmembers(client_cls, inspect.isfunction):
+            if name.startswith("send_"):
+                assert inspect.iscoroutinefunction(method), name
+                assert method.__doc__ == getattr(client_map[key], name).__doc__
+
+
+def test_async_queued_message_is_retried():
+    async def queue(client, responses):
+        async with client:
+            client._queue_message(messages_by_type[FlexRequest], callback=responses.append)
+            assert client.has_pending_messages()
+            await asyncio.sleep(0.05)
+            client.recipient_endpoint = endpoint_lookup_function("agr.dev", "AGR")
+            await asyncio.wait_for(asyncio.gather(*client.delivery_tasks), timeout=10)
+            assert not client.has_pending_messages()
+
+    with DummyAgrService() as agr_service:
+        client = AsyncShapeshifterDsoAgrClient(
+            sender_domain="dso.dev",
+            signing_key=DSO_PRIVATE_KEY,
+            recipient_domain="agr.dev",
+            recipient_endpoint="http://localhost:9001/wrong/path",
+            recipient_signing_key=AGR_PUBLIC_KEY,
+        )
+        client.exponential_retry_factor = 0.05
+        client.exponential_retry_base = 1.0
+        responses = []
+        asyncio.run(queue(client, responses))
+        assert responses == [None]
+        assert agr_service.request_futures["process_flex_request"].result(timeout=10) is not None
+
+
+def test_async_close_drops_retries():
+    async def queue_and_close(client):
+        client._queue_message(messages_by_type[FlexRequest], callback=None)
+        wait_for_retry = asyncio.get_running_loop().time() + 10
+        while not client.retrying_tasks:
+            assert asyncio.get_running_loop().time() < wait_for_retry
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(client.aclose(), timeout=10)
+        assert not client.has_pending_messages()
+        with pytest.raises(RuntimeError):
+            client._queue_message(messages_by_type[FlexRequest], callback=None)
+
+    with DummyAgrService():
+        client = AsyncShapeshifterDsoAgrClient(
+            sender_domain="dso.dev",
+            signing_key=DSO_PRIVATE_KEY,
+            recipient_domain="agr.dev",
+            recipient_endpoint="http://localhost:9001/wrong/path",
+            recipient_signing_key=AGR_PUBLIC_KEY,
+        )
+        client.exponential_retry_factor = 60
+        asyncio.run(queue_and_close(client))
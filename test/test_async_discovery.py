@@ -0,0 +1,119 @@
+import asyncio
+import time
+from base64 import b64encode
+from unittest.mock import patch
+
+import dns.asyncresolver
+import dns.resolver
+import dns.rrset
+import pytest
+
+from shapeshifter_uftp import async_discovery, transport
+from shapeshifter_uftp.exceptions import AuthenticationTimeoutException
+
+PUBLIC_KEY = b64encode(bytes(range(32))).decode()
+DOMAINS = [f"participant{i}.dev" for i in range(10)]
+
+RECORDS = {}
+for _domain in DOMAINS:
+    RECORDS[(f"_usef.{_domain}", "TXT")] = (300, '"3.1.0"')
+    RECORDS[(f"_http._DSO._usef.{_domain}", "CNAME")] = (300, f"shapeshifter.{_domain}.")
+    RECORDS[(f"_DSO._usef.{_domain}", "TXT")] = (300, f'"cs1.{PUBLIC_KEY}"')
+
+
+class FakeAnswer:
+    def __init__(self, rrset):
+        self.response = self
+        self.answer = [rrset]
+
+
+class FakeAsyncResolver:
+    delay = 0.05
+
+    def __init__(self):
+        self.queries = []
+
+    async def resolve(self, dns_name, rdtype):
+        self.queries.append((dns_name, rdtype))
+        await asyncio.sleep(self.delay)
+        if (dns_name, rdtype) not in RECORDS:
+            raise dns.resolver.NXDOMAIN()
+        ttl, text = RECORDS[(dns_name, rdtype)]
+        return FakeAnswer(dns.rrset.from_text(dns_name, ttl, "IN", rdtype, text))
+
+
+def fail_sync_resolve(dns_name, rdtype):
+    raise AssertionError(f"Unexpected synchronous lookup of {dns_name}")
+
+
+@pytest.fixture
+def resolver():
+    fake_resolver = FakeAsyncResolver()
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+    with patch.object(dns.asyncresolver, "resolve", new=fake_resolver.resolve):
+        yield fake_resolver
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+
+
+def test_resolve_participant(resolver):
+    participant = asyncio.run(async_discovery.resolve_participant("participant0.dev", "DSO"))
+    assert participant == async_discovery.Participant(
+        domain="participant0.dev",
+        role="DSO",
+        version="3.1.0",
+        endpoint="https://shapeshifter.participant0.dev/shapeshifter/api/v3/message",
+        signing_key=PUBLIC_KEY,
+        encryption_key=None,
+    )
+    # The version is looked up only once, even though the endpoint needs it too.
+    assert sorted(resolver.queries) == sorted([
+        ("_usef.participant0.dev", "TXT"),
+        ("_http._DSO._usef.participant0.dev", "CNAME"),
+        ("_DSO._usef.participant0.dev", "TXT"),
+    ])
+
+
+def test_resolve_participants_concurrently(resolver):
+    participants = [(domain, "DSO") for domain in DOMAINS] + [("unknown.dev", "DSO")]
+
+    start = time.monotonic()
+    results = asyncio.run(async_discovery.resolve_participants(participants))
+    duration = time.monotonic() - start
+
+    # Every lookup waits for 'delay' seconds; the CNAME record and the
+    # version are resolved concurrently, so everything takes about one delay.
+    assert duration < 10 * resolver.delay
+    assert len(resolver.queries) == 3 * len(participants)
+    assert isinstance(results[("unknown.dev", "DSO")], Exception)
+    for domain in DOMAINS:
+        assert results[(domain, "DSO")].endpoint == f"https://shapeshifter.{domain}/shapeshifter/api/v3/message"
+
+
+def test_resolve_participants_warms_sync_caches(resolver):
+    asyncio.run(async_discovery.resolve_participants([("participant1.dev", "DSO"), ("unknown.dev", "AGR")]))
+
+    with patch.object(dns.resolver, "resolve", new=fail_sync_resolve):
+        assert transport.get_version("participant1.dev") == "3.1.0"
+        assert transport.get_key("participant1.dev", "DSO") == PUBLIC_KEY
+        assert transport.get_endpoint("participant1.dev", "DSO").startswith("https://shapeshifter.participant1.dev/")
+        with pytest.raises(AuthenticationTimeoutException):
+            transport.get_keys("unknown.dev", "AGR")
+
+    # Cached results are not looked up again.
+    queries = len(resolver.queries)
+    asyncio.run(async_discovery.resolve_participant("participant1.dev", "DSO"))
+    assert len(resolver.queries) == queries
+
+
+def test_stale_value_is_refreshed_in_background(resolver):
+    async def main():
+        transport.get_keys.cache.set(("participant0.dev", "DSO"), ("old", None), ttl=0)
+        # The stale keys are returned without waiting for DNS.
+        assert await asyncio.wait_for(async_discovery.get_keys("participant0.dev", "DSO"), 0.01) == ("old", None)
+        await asyncio.sleep(resolver.delay * 2)
+        return await async_discovery.get_keys("participant0.dev", "DSO")
+
+    assert asyncio.run(main()) == (PUBLIC_KEY, None)
+    assert len(resolver.queries) == 1
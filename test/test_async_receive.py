@@ -0,0 +1,147 @@
+import asyncio
+import threading
+from base64 import b64encode
+from queue import Full
+from types import SimpleNamespace
+from unittest.mock import patch
+
+import dns.asyncresolver
+import dns.rrset
+import pytest
+
+from shapeshifter_uftp import transport
+from shapeshifter_uftp.service.executors import AsyncExecutor
+from shapeshifter_uftp.uftp import FlexOffer, FlexOfferRevocation
+
+from .helpers import wait_until
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService, key_lookup_function
+
+
+def test_async_key_lookup_function():
+    lookups = []
+
+    async def async_key_lookup_function(domain, role):
+        lookups.append((domain, role))
+        await asyncio.sleep(0)
+        return key_lookup_function(domain, role)
+
+    with DummyDsoService() as dso_service:
+        dso_service.key_lookup_function = async_key_lookup_function
+        agr_service = DummyAgrService()
+        agr_service.dso_client(dso_service.sender_domain).send_flex_offer(messages_by_type[FlexOffer])
+        assert dso_service.request_futures["process_flex_offer"].result(timeout=10) is not None
+        assert lookups == [("agr.dev", "AGR")]
+
+
+def test_sync_key_lookup_runs_on_lookup_executor():
+    thread_names = []
+
+    def recording_key_lookup_function(domain, role):
+        thread_names.append(threading.current_thread().name)
+        return key_lookup_function(domain, role)
+
+    with DummyDsoService() as dso_service:
+        dso_service.key_lookup_function = recording_key_lookup_function
+        agr_service = DummyAgrService()
+        agr_service.dso_client(dso_service.sender_domain).send_flex_offer(messages_by_type[FlexOffer])
+        assert dso_service.request_futures["process_flex_offer"].result(timeout=10) is not None
+        assert thread_names[0].startswith("shapeshifter-lookup")
+
+
+class UnusableExecutor:
+    def submit(self, *args, **kwargs):
+        raise AssertionError("DNS key lookups should not use the lookup executor")
+
+
+def test_dns_key_lookup_runs_on_event_loop():
+    public_key = b64encode(bytes(range(32))).decode()
+    queries = []
+
+    async def fake_resolve(dns_name, rdtype):
+        queries.append(dns_name)
+        await asyncio.sleep(0)
+        rrset = dns.rrset.from_text(dns_name, 300, "IN", rdtype, f'"cs1.{public_key}"')
+        return SimpleNamespace(response=SimpleNamespace(answer=[rrset]))
+
+    dso_service = DummyDsoService()
+    dso_service.key_lookup_function = transport.get_key
+    dso_service.lookup_executor = UnusableExecutor()
+    transport.get_keys.cache.invalidate(("dns.dev", "AGR"))
+    try:
+        with patch.object(dns.asyncresolver, "resolve", new=fake_resolve):
+            for _ in range(2):
+                key = asyncio.run(dso_service._lookup_key("dns.dev", "AGR"))  # pylint: disable=protected-access
+                assert key == public_key
+    finally:
+        transport.get_keys.cache.invalidate(("dns.dev", "AGR"))
+
+    # The second lookup is served from the cache.
+    assert queries == ["_AGR._usef.dns.dev"]
+
+
+class AsyncHandlerDsoService(DummyDsoService):
+    max_concurrent_async_handlers = 2
+
+    def __init__(self):
+        super().__init__()
+        self.running = 0
+        self.max_running = 0
+        self.threads = set()
+
+    async def process_flex_offer(self, message):
+        self.running += 1
+        self.max_running = max(self.max_running, self.running)
+        self.threads.add(threading.current_thread().name)
+        await asyncio.sleep(0.2)
+        self.running -= 1
+        if self.async_executor.metrics.submitted == 5 and self.running == 0:
+            super().process_flex_offer(message)
+
+    async def process_flex_offer_revocation(self, message):
+        raise ValueError("BOOM")
+
+
+def test_coroutine_process_methods_run_on_event_loop():
+    with AsyncHandlerDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        for _ in range(5):
+            client.send_flex_offer(messages_by_type[FlexOffer])
+        assert dso_service.request_futures["process_flex_offer"].result(timeout=10) is not None
+
+    assert dso_service.max_running == 2
+    assert len(dso_service.threads) == 1
+    assert not dso_service.threads.pop().startswith("shapeshifter-inbound")
+    assert dso_service.inbound_executor.metrics.submitted == 0
+    assert dso_service.inbound_latency[FlexOffer].count == 5
+    assert dso_service.inbound_metrics()["async"]["completed"] == 5
+
+
+def test_failing_coroutine_process_method():
+    with AsyncHandlerDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer_revocation(messages_by_type[FlexOfferRevocation])
+        wait_until(lambda: dso_service.inbound_latency[FlexOfferRevocation].count == 1)
+        assert dso_service.async_executor.metrics.completed == 1
+
+
+def test_async_executor_limits_waiting_tasks():
+    async def main():
+        release = asyncio.Event()
+        executor = AsyncExecutor(max_concurrency=1, max_queue_size=1)
+        running = executor.submit(release.wait)
+        await asyncio.sleep(0)
+        queued = executor.submit(asyncio.sleep, 0, "done")
+        with pytest.raises(Full):
+            executor.submit(asyncio.sleep, 0)
+        assert executor.saturation == 1.0
+
+        release.set()
+        assert await running is True
+        assert await queued == "done"
+        return executor.metrics.as_dict()
+
+    metrics = asyncio.run(main())
+    assert metrics["submitted"] == 2
+    assert metrics["rejected"] == 1
+    assert metrics["completed"] == 2
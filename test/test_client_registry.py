@@ -0,0 +1,143 @@
+import threading
+import time
+
+import pytest
+
+from shapeshifter_uftp import ShapeshifterDsoAgrClient
+from shapeshifter_uftp.service.client_registry import ClientRegistry
+from shapeshifter_uftp.uftp import TestMessage
+
+from .helpers import wait_until
+from .helpers.services import DSO_PRIVATE_KEY, DummyAgrService, DummyDsoService
+
+
+class FakeClient:
+    def __init__(self):
+        self.closed = False
+        self.pending = False
+
+    def has_pending_messages(self):
+        return self.pending
+
+    def close(self):
+        self.closed = True
+
+
+def test_registry_reuses_clients():
+    registry = ClientRegistry()
+    client_1 = registry.get("key", FakeClient)
+    client_2 = registry.get("key", FakeClient)
+    client_3 = registry.get("other", FakeClient)
+    assert client_1 is client_2
+    assert client_1 is not client_3
+    assert len(registry) == 2
+
+
+def test_registry_evicts_idle_clients():
+    registry = ClientRegistry(idle_timeout=0.05)
+    idle_client = registry.get("idle", FakeClient)
+    busy_client = registry.get("busy", FakeClient)
+    busy_client.pending = True
+    time.sleep(0.1)
+    registry.evict_idle()
+
+    assert idle_client.closed
+    assert "idle" not in registry
+    assert not busy_client.closed
+    assert "busy" in registry
+
+
+def test_registry_refreshes_clients():
+    refreshed = []
+    registry = ClientRegistry(refresh_interval=0.05)
+    client = registry.get("key", FakeClient, refresh=refreshed.append)
+    registry.get("key", FakeClient, refresh=refreshed.append)
+    assert not refreshed
+    time.sleep(0.1)
+    registry.get("key", FakeClient, refresh=refreshed.append)
+    assert refreshed == [client]
+
+
+def test_registry_close():
+    registry = ClientRegistry()
+    client = registry.get("key", FakeClient)
+    registry.close()
+    assert client.closed
+    assert len(registry) == 0
+
+
+def test_client_close_stops_threads():
+    client = ShapeshifterDsoAgrClient(
+        sender_domain="dso.dev",
+        signing_key=DSO_PRIVATE_KEY,
+        recipient_domain="agr.dev",
+        recipient_endpoint="http://localhost:1/message",
+    )
+    client._run_outgoing_workers()
+    client._run_scheduler()
+    threads = client.outgoing_workers + [client.scheduler_thread]
+
+    client.close()
+    for thread in threads:
+        thread.join(timeout=5)
+        assert not thread.is_alive()
+    assert not client.has_pending_messages()
+
+
+class FailingClient(ShapeshifterDsoAgrClient):
+    exponential_retry_factor = 0.2
+    exponential_retry_base = 1.0
+
+    def __init__(self):
+        super().__init__(
+            sender_domain="dso.dev",
+            signing_key=DSO_PRIVATE_KEY,
+            recipient_domain="agr.dev",
+            recipient_endpoint="http://localhost:1/message",
+        )
+        self.attempts = 0
+        self.attempted = threading.Event()
+
+    def _send_message(self, message):
+        self.attempts += 1
+        self.attempted.set()
+        raise ConnectionError("unreachable")
+
+
+def test_client_close_drops_retries():
+    client = FailingClient()
+    client._queue_message(TestMessage(), callback=None)
+    assert client.attempted.wait(timeout=5)
+    wait_until(lambda: not client.scheduler.empty())
+    threads = client.outgoing_workers + [client.scheduler_thread]
+
+    client.close()
+    assert client.scheduler.empty()
+    assert not any(thread.is_alive() for thread in threads)
+
+    # The retry would have been due by now.
+    attempts = client.attempts
+    time.sleep(0.5)
+    assert client.attempts == attempts == 1
+    assert client.outgoing_workers is None
+    with pytest.raises(RuntimeError):
+        client._queue_message(TestMessage(), callback=None)
+
+
+def test_service_reuses_clients():
+    service = DummyDsoService()
+    client = service.agr_client("agr.dev")
+    assert service.agr_client("agr.dev") is client
+    assert service.agr_client("agr.dev", version="3.0.0") is not client
+    assert service.cro_client("agr.dev") is not client
+
+
+def test_test_message_replies_reuse_client():
+    with DummyAgrService() as agr_service, DummyDsoService() as dso_service:
+        client = dso_service.agr_client("agr.dev")
+        for _ in range(3):
+            agr_service.reset_futures("test_message")
+            client.send_test_message(TestMessage())
+            dso_service.request_futures["process_test_message_response"].result(timeout=5)
+            dso_service.reset_futures("test_message_response")
+        assert len(agr_service.client_registry) == 1
@@ -0,0 +1,153 @@
+import asyncio
+import json
+import time
+from base64 import b64encode
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import patch
+
+import dns.asyncresolver
+import dns.resolver
+import dns.rrset
+import pytest
+
+from shapeshifter_uftp import async_discovery, transport
+from shapeshifter_uftp.cache import TTLCache
+
+from .helpers.services import (
+    DummyDsoService,
+    endpoint_lookup_function,
+    key_lookup_function,
+)
+
+PUBLIC_KEY = b64encode(bytes(range(32))).decode()
+
+RECORDS = {
+    ("_usef.warm.dev", "TXT"): (300, '"3.1.0"'),
+    ("_http._AGR._usef.warm.dev", "CNAME"): (300, "shapeshifter.warm.dev."),
+    ("_AGR._usef.warm.dev", "TXT"): (300, f'"cs1.{PUBLIC_KEY}"'),
+}
+
+
+class FakeAnswer:
+    def __init__(self, rrset):
+        self.response = self
+        self.answer = [rrset]
+
+
+async def fake_resolve(dns_name, rdtype):
+    if (dns_name, rdtype) not in RECORDS:
+        raise dns.resolver.NXDOMAIN()
+    ttl, text = RECORDS[(dns_name, rdtype)]
+    return FakeAnswer(dns.rrset.from_text(dns_name, ttl, "IN", rdtype, text))
+
+
+@pytest.fixture
+def empty_caches():
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+    yield
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+
+
+def test_dump_and_restore():
+    cache = TTLCache(ttl=60, stale_ttl=60)
+    cache.set("fresh", 1)
+    cache.set("stale", 2, ttl=0)
+    cache.set_error("error", ValueError(), ttl=60)
+
+    entries = cache.dump()
+    assert [entry[0] for entry in entries] == ["fresh", "stale"]
+    assert 50 < entries[0][2] - time.time() <= 60
+
+    restored = TTLCache(ttl=60, stale_ttl=60)
+    expired = ("expired", 3, time.time() - 120, time.time() - 60)
+    assert restored.restore(entries + [expired]) == 2
+    assert restored.get("fresh") == 1
+    assert restored.get("stale") is None
+    assert restored.get_or_load("stale", lambda: 4) == 2
+    assert "expired" not in restored
+
+
+def test_save_and_load_discovery_cache(tmp_path, empty_caches):
+    path = str(tmp_path / "discovery.json")
+    transport.get_keys.cache.set(("agr.dev", "AGR"), (PUBLIC_KEY, None), 300)
+    transport.get_endpoint.cache.set(("agr.dev", "AGR"), "https://agr.dev/message", 300)
+    transport.get_version.cache.set(("agr.dev",), "3.1.0", 300)
+    transport.save_discovery_cache(path)
+
+    with open(path, encoding="utf-8") as file:
+        assert len(json.load(file)["keys"]) == 1
+
+    transport.get_keys.cache.clear()
+    transport.get_endpoint.cache.clear()
+    transport.get_version.cache.clear()
+    assert transport.load_discovery_cache(path) == 3
+    assert transport.get_key("agr.dev", "AGR") == PUBLIC_KEY
+    assert transport.get_endpoint("agr.dev", "AGR") == "https://agr.dev/message"
+
+
+def test_load_missing_or_corrupt_discovery_cache(tmp_path, empty_caches):
+    assert transport.load_discovery_cache(str(tmp_path / "missing.json")) == 0
+    path = tmp_path / "corrupt.json"
+    path.write_text("{not json")
+    assert transport.load_discovery_cache(str(path)) == 0
+
+
+def test_warm_up_with_dns(tmp_path, empty_caches):
+    class WarmDsoService(DummyDsoService):
+        warm_up_participants = [("warm.dev", "AGR"), ("unknown.dev", "AGR")]
+        discovery_cache_file = str(tmp_path / "discovery.json")
+
+    service = WarmDsoService()
+    service.key_lookup_function = transport.get_key
+    service.endpoint_lookup_function = transport.get_endpoint
+
+    with patch.object(dns.asyncresolver, "resolve", new=fake_resolve):
+        results = service.warm_up()
+
+    assert results[("warm.dev", "AGR")].endpoint == "https://shapeshifter.warm.dev/shapeshifter/api/v3/message"
+    assert isinstance(results[("unknown.dev", "AGR")], Exception)
+    with open(WarmDsoService.discovery_cache_file, encoding="utf-8") as file:
+        assert [entry["key"] for entry in json.load(file)["endpoint"]] == [["warm.dev", "AGR"]]
+
+
+def test_save_discovery_cache_concurrently(tmp_path, empty_caches):
+    path = tmp_path / "discovery.json"
+    transport.get_version.cache.set(("agr.dev",), "3.1.0", 300)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        for future in [executor.submit(transport.save_discovery_cache, str(path)) for _ in range(50)]:
+            future.result()
+
+    assert [file.name for file in tmp_path.iterdir()] == ["discovery.json"]
+    assert len(json.loads(path.read_text())["version"]) == 1
+
+
+def test_warm_up_with_lookup_functions():
+    service = DummyDsoService()
+    results = service.warm_up([("agr.dev", "AGR")])
+    assert results == {
+        ("agr.dev", "AGR"): async_discovery.Participant(
+            "agr.dev",
+            "AGR",
+            None,
+            endpoint_lookup_function("agr.dev", "AGR"),
+            key_lookup_function("agr.dev", "AGR"),
+            None,
+        )
+    }
+
+
+def test_warm_up_from_event_loop(empty_caches):
+    service = DummyDsoService()
+    service.key_lookup_function = transport.get_key
+    service.endpoint_lookup_function = transport.get_endpoint
+
+    async def main():
+        with pytest.raises(RuntimeError, match="warm_up_async"):
+            service.warm_up([("warm.dev", "AGR")])
+        return await service.warm_up_async([("warm.dev", "AGR")])
+
+    with patch.object(dns.asyncresolver, "resolve", new=fake_resolve):
+        results = asyncio.run(main())
+    assert results[("warm.dev", "AGR")].signing_key == PUBLIC_KEY
@@ -0,0 +1,112 @@
+import time
+from base64 import b64encode
+from unittest.mock import patch
+
+import dns.resolver
+import dns.rrset
+import pytest
+
+from shapeshifter_uftp import transport
+from shapeshifter_uftp.exceptions import (
+    AuthenticationTimeoutException,
+    ServiceDiscoveryException,
+)
+
+PUBLIC_KEY = b64encode(bytes(range(32))).decode()
+
+RECORDS = {
+    ("_usef.ttl.dev", "TXT"): (120, '"3.1.0"'),
+    ("_http._DSO._usef.ttl.dev", "CNAME"): (30, "shapeshifter.ttl.dev."),
+    ("_DSO._usef.ttl.dev", "TXT"): (86400, f'"cs1.{PUBLIC_KEY}"'),
+    ("_DSO._usef.invalid.dev", "TXT"): (300, '"not-a-key"'),
+}
+
+
+class FakeAnswer:
+    def __init__(self, rrset):
+        self.response = self
+        self.answer = [rrset]
+
+
+class FakeResolver:
+    def __init__(self):
+        self.queries = []
+
+    def resolve(self, dns_name, rdtype):
+        self.queries.append((dns_name, rdtype))
+        if dns_name == "_DSO._usef.servfail.dev":
+            raise dns.resolver.NoNameservers()
+        if (dns_name, rdtype) not in RECORDS:
+            raise dns.resolver.NXDOMAIN()
+        ttl, text = RECORDS[(dns_name, rdtype)]
+        return FakeAnswer(dns.rrset.from_text(dns_name, ttl, "IN", rdtype, text))
+
+
+@pytest.fixture
+def resolver():
+    fake_resolver = FakeResolver()
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+    with patch.object(dns.resolver, "resolve", new=fake_resolver.resolve):
+        yield fake_resolver
+    for function in (transport.get_keys, transport.get_endpoint, transport.get_version):
+        function.cache.clear()
+
+
+def remaining_ttl(function, *args):
+    entry = function.cache._entries[args]
+    return entry.expires_at - time.monotonic()
+
+
+def test_record_ttl_bounds():
+    assert transport.record_ttl(10) == transport.DNS_MIN_TTL
+    assert transport.record_ttl(300) == 300
+    assert transport.record_ttl(86400) == transport.DNS_MAX_TTL
+
+
+def test_discovery_uses_record_ttl(resolver):
+    assert transport.get_version("ttl.dev") == "3.1.0"
+    assert transport.get_endpoint("ttl.dev", "DSO") == "https://shapeshifter.ttl.dev/shapeshifter/api/v3/message"
+    assert transport.get_keys("ttl.dev", "DSO") == (PUBLIC_KEY, None)
+
+    assert 110 < remaining_ttl(transport.get_version, "ttl.dev") <= 120
+    assert transport.DNS_MIN_TTL - 10 < remaining_ttl(transport.get_endpoint, "ttl.dev", "DSO") <= transport.DNS_MIN_TTL
+    assert transport.DNS_MAX_TTL - 10 < remaining_ttl(transport.get_keys, "ttl.dev", "DSO") <= transport.DNS_MAX_TTL
+
+
+def test_negative_answers_are_cached(resolver):
+    negative_hits = transport.get_keys.cache.stats.negative_hits
+    for _ in range(3):
+        with pytest.raises(AuthenticationTimeoutException):
+            transport.get_key("unknown.dev", "AGR")
+        with pytest.raises(ServiceDiscoveryException):
+            transport.get_endpoint("unknown.dev", "AGR")
+        with pytest.raises(AuthenticationTimeoutException):
+            transport.get_keys("invalid.dev", "DSO")
+
+    assert resolver.queries == [
+        ("_AGR._usef.unknown.dev", "TXT"),
+        ("_http._AGR._usef.unknown.dev", "CNAME"),
+        ("_DSO._usef.invalid.dev", "TXT"),
+    ]
+    assert transport.get_keys.cache.stats.negative_hits - negative_hits == 4
+    assert remaining_ttl(transport.get_keys, "unknown.dev", "AGR") <= transport.DNS_NEGATIVE_TTL
+
+
+def test_servfail_is_not_cached(resolver):
+    for _ in range(2):
+        with pytest.raises(ServiceDiscoveryException):
+            transport.get_keys("servfail.dev", "DSO")
+    assert len(resolver.queries) == 2
+
+
+def test_discovery_cache_settings_can_be_changed(resolver):
+    with patch.object(transport, "DISCOVERY_CACHE_STALE_TTL", 0), patch.object(transport, "DISCOVERY_CACHE_SIZE", 1):
+        assert transport.get_version("ttl.dev") == "3.1.0"
+        assert transport.get_keys("ttl.dev", "DSO") == (PUBLIC_KEY, None)
+        transport.get_endpoint.cache.set(("one.dev", "DSO"), "https://one.dev/message", 300)
+        transport.get_endpoint.cache.set(("other.dev", "DSO"), "https://other.dev/message", 300)
+
+        assert list(transport.get_endpoint.cache._entries) == [("other.dev", "DSO")]
+        entry = transport.get_keys.cache._entries[("ttl.dev", "DSO")]
+        assert entry.stale_until == entry.expires_at
@@ -0,0 +1,71 @@
+from base64 import b64encode
+
+import pytest
+import requests
+
+from shapeshifter_uftp.exceptions import SchemaException
+from shapeshifter_uftp.transport import (
+    SignedMessageParser,
+    from_xml,
+    parse_signed_message,
+    to_signed_xml,
+)
+from shapeshifter_uftp.uftp import FlexOffer, UsefRole
+
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
+
+
+def test_parse_signed_message_matches_xsdata():
+    envelope = to_signed_xml("agr.dev", UsefRole.AGR, bytes(range(256)) * 100)
+    assert parse_signed_message(envelope) == from_xml(envelope)
+
+
+def test_parse_signed_message_in_chunks():
+    body = bytes(range(256)) * 100
+    envelope = to_signed_xml("agr.dev", UsefRole.AGR, body)
+    parser = SignedMessageParser()
+    for start in range(0, len(envelope), 1000):
+        parser.feed(envelope[start:start + 1000])
+    message = parser.close()
+    assert message.sender_domain == "agr.dev"
+    assert message.sender_role == UsefRole.AGR
+    assert message.body == body
+
+
+def test_parse_signed_message_allows_whitespace_in_body():
+    body = b64encode(b"hello world").decode()
+    envelope = f'<SignedMessage SenderDomain="agr.dev" SenderRole="AGR" Body="{body[:8]}\n{body[8:]}"/>'
+    assert parse_signed_message(envelope.encode()).body == b"hello world"
+
+
+@pytest.mark.parametrize("envelope", [
+    b"",
+    b"garbage",
+    b"<Other/>",
+    b'<SignedMessage SenderDomain="agr.dev" SenderRole="AGR"/>',
+    b'<SignedMessage SenderDomain="agr.dev" SenderRole="XXX" Body="AAAA"/>',
+    b'<SignedMessage SenderDomain="agr.dev" SenderRole="AGR" Body="!!"/>',
+])
+def test_parse_invalid_signed_message(envelope):
+    with pytest.raises(SchemaException):
+        parse_signed_message(envelope)
+
+
+class FastDsoService(DummyDsoService):
+    fast_envelope_parsing = True
+
+
+def test_service_with_fast_envelope_parsing():
+    with FastDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        assert dso_service.request_futures["process_flex_offer"].result(timeout=5) is not None
+
+        response = requests.post(
+            client.recipient_endpoint,
+            headers={"Content-Type": "text/xml"},
+            data=b"<SignedMessage/>",
+            timeout=5,
+        )
+        assert response.status_code == 400
@@ -0,0 +1,348 @@
+import time
+from queue import Full
+from threading import Event, Lock
+
+import pytest
+
+from shapeshifter_uftp.exceptions import ClientTransportException
+from shapeshifter_uftp.service.executors import (
+    BoundedExecutor,
+    LatencyHistogram,
+    OrderedExecutor,
+    PriorityExecutor,
+)
+from shapeshifter_uftp.uftp import (
+    FlexOffer,
+    FlexOrder,
+    FlexOrderResponse,
+    FlexRequest,
+    FlexSettlement,
+)
+
+from .helpers import wait_until
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
+
+
+def test_bounded_executor_rejects_when_full():
+    release = Event()
+    executor = BoundedExecutor(num_threads=1, max_queue_size=1)
+    running = executor.submit(release.wait)
+    wait_until(lambda: executor.metrics.started == 1)
+
+    queued = executor.submit(lambda: "done")
+    with pytest.raises(Full):
+        executor.submit(lambda: "refused")
+
+    release.set()
+    assert running.result(timeout=5) is True
+    assert queued.result(timeout=5) == "done"
+
+    executor.shutdown()
+    metrics = executor.metrics.as_dict()
+    assert metrics["submitted"] == 2
+    assert metrics["rejected"] == 1
+    assert metrics["completed"] == 2
+    assert metrics["depth"] == 0
+    assert metrics["max_depth"] == 1
+    assert metrics["max_wait_time"] > 0
+
+
+def test_depth_matches_submitted_and_started():
+    release = Event()
+    executor = BoundedExecutor(num_threads=4)
+    for _ in range(4):
+        executor.submit(release.wait)
+    wait_until(lambda: executor.metrics.started == 4)
+    for _ in range(100):
+        executor.submit(lambda: None)
+    assert executor.metrics.depth == 100
+    assert executor.metrics.max_depth == 100
+
+    release.set()
+    wait_until(lambda: executor.metrics.completed == 104)
+    executor.shutdown()
+    metrics = executor.metrics.as_dict()
+    assert metrics["depth"] == metrics["submitted"] - metrics["started"] == 0
+
+
+def test_bounded_executor_propagates_exceptions():
+    def fail():
+        raise ValueError("BOOM")
+
+    executor = BoundedExecutor(num_threads=1)
+    with pytest.raises(ValueError):
+        executor.submit(fail).result(timeout=5)
+    executor.shutdown()
+
+
+class SlowDsoService(DummyDsoService):
+    num_inbound_threads = 1
+    max_inbound_queue_size = 1
+
+    def __init__(self):
+        super().__init__()
+        self.release = Event()
+
+    def process_flex_offer(self, message):
+        self.release.wait(timeout=10)
+        super().process_flex_offer(message)
+
+
+def test_service_answers_429_when_inbound_queue_is_full():
+    with SlowDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+
+        # The first message occupies the only worker, the second one
+        # waits in the queue and the third one is refused.
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        wait_until(lambda: dso_service.inbound_executor.metrics.started == 1)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        with pytest.raises(ClientTransportException) as exc_info:
+            client.send_flex_offer(messages_by_type[FlexOffer])
+        assert exc_info.value.response.status_code == 429
+
+        dso_service.release.set()
+        assert dso_service.request_futures["process_flex_offer"].result(timeout=10) is not None
+        assert dso_service.inbound_executor.metrics.rejected == 1
+
+
+def test_ordered_executor_keeps_order_per_key():
+    executor = OrderedExecutor(num_lanes=4)
+    results = {key: [] for key in "abcdef"}
+
+    def record(key, i):
+        time.sleep(0.001 * (i % 3))
+        results[key].append(i)
+
+    futures = [executor.submit(key, record, key, i) for i in range(20) for key in results]
+    for future in futures:
+        future.result(timeout=10)
+    executor.shutdown()
+
+    assert all(values == list(range(20)) for values in results.values())
+    assert executor.metrics.completed == 120
+    assert sum(metrics.completed for metrics in executor.lane_metrics) == 120
+
+
+def test_ordered_executor_runs_lanes_in_parallel():
+    release = Event()
+    executor = OrderedExecutor(num_lanes=2, max_queue_size=1)
+    blocked_key = "blocked"
+    other_key = next(key for key in range(10) if executor.lane(key) is not executor.lane(blocked_key))
+
+    executor.submit(blocked_key, release.wait)
+    wait_until(lambda: executor.lane(blocked_key).metrics.started == 1)
+    executor.submit(blocked_key, lambda: "queued")
+    with pytest.raises(Full):
+        executor.submit(blocked_key, lambda: "refused")
+
+    # The other lane is not held up by the blocked one.
+    assert executor.submit(other_key, lambda: "done").result(timeout=5) == "done"
+    assert executor.lane(blocked_key).metrics.depth == 1
+    assert executor.metrics.rejected == 1
+
+    release.set()
+    executor.shutdown()
+    assert executor.metrics.completed == 3
+
+
+class OrderedDsoService(DummyDsoService):
+    num_inbound_threads = 4
+    inbound_ordering = "conversation"
+
+    def __init__(self):
+        super().__init__()
+        self.lock = Lock()
+        self.processed = []
+
+    def process_flex_offer(self, message):
+        # The FlexOffer is slow, but the FlexOrder must wait for it.
+        time.sleep(0.2)
+        with self.lock:
+            self.processed.append(message)
+
+    def process_flex_order_response(self, message):
+        with self.lock:
+            self.processed.append(message)
+        super().process_flex_order_response(message)
+
+
+def test_service_processes_conversation_in_order():
+    with OrderedDsoService() as dso_service:
+        assert isinstance(dso_service.inbound_executor, OrderedExecutor)
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        client.send_flex_order_response(messages_by_type[FlexOrderResponse])
+        dso_service.request_futures["process_flex_order_response"].result(timeout=10)
+
+    assert [type(message) for message in dso_service.processed] == [FlexOffer, FlexOrderResponse]
+
+
+def test_invalid_inbound_ordering():
+    class InvalidDsoService(DummyDsoService):
+        inbound_ordering = "sender"
+
+    with pytest.raises(ValueError):
+        InvalidDsoService()
+
+
+def test_ordering_by_congestion_point():
+    class CongestionPointDsoService(DummyDsoService):
+        inbound_ordering = "congestion_point"
+
+    # pylint: disable=protected-access
+    service = CongestionPointDsoService()
+    flex_offer = messages_by_type[FlexOffer]
+    assert service._ordering_key(flex_offer) == (flex_offer.sender_domain, flex_offer.congestion_point)
+    flex_order_response = messages_by_type[FlexOrderResponse]
+    assert service._ordering_key(flex_order_response) == flex_order_response.conversation_id
+
+
+def test_priority_executor_runs_urgent_work_first():
+    release = Event()
+    executor = PriorityExecutor(num_threads=1, aging_interval=10)
+    executor.submit(0, release.wait)
+    wait_until(lambda: executor.metrics.started == 1)
+
+    order = []
+    futures = [
+        executor.submit(priority, order.append, name)
+        for priority, name in [(2, "bulk"), (1, "normal"), (0, "urgent"), (2, "bulk 2"), (0, "urgent 2")]
+    ]
+    release.set()
+    for future in futures:
+        future.result(timeout=5)
+    executor.shutdown()
+    assert order == ["urgent", "urgent 2", "normal", "bulk", "bulk 2"]
+
+
+def test_priority_executor_ages_waiting_work():
+    release = Event()
+    executor = PriorityExecutor(num_threads=1, aging_interval=0.01)
+    executor.submit(0, release.wait)
+    wait_until(lambda: executor.metrics.started == 1)
+
+    order = []
+    waiting = executor.submit(2, order.append, "bulk")
+    time.sleep(0.05)
+    urgent = executor.submit(0, order.append, "urgent")
+    release.set()
+    waiting.result(timeout=5)
+    urgent.result(timeout=5)
+    executor.shutdown()
+    assert order == ["bulk", "urgent"]
+
+
+def test_latency_histogram():
+    histogram = LatencyHistogram(buckets=(0.1, 1.0))
+    for duration in (0.05, 0.1, 0.5, 2.0):
+        histogram.record(duration)
+    assert histogram.as_dict() == {
+        "buckets": {0.1: 2, 1.0: 1, float("inf"): 1},
+        "count": 4,
+        "sum": 2.65,
+        "average": 2.65 / 4,
+        "max": 2.0,
+    }
+
+
+class PriorityAgrService(DummyAgrService):
+    num_inbound_threads = 1
+    inbound_priorities = {FlexOrder: 0, FlexSettlement: 2}
+
+    def __init__(self):
+        super().__init__()
+        self.release = Event()
+        self.processed = []
+
+    def process_flex_request(self, message):
+        self.release.wait(timeout=10)
+        self.processed.append(type(message))
+
+    def process_flex_settlement(self, message):
+        self.processed.append(type(message))
+        super().process_flex_settlement(message)
+
+    def process_flex_order(self, message):
+        self.processed.append(type(message))
+
+
+def test_service_processes_urgent_messages_first():
+    with PriorityAgrService() as agr_service:
+        assert isinstance(agr_service.inbound_executor, PriorityExecutor)
+        client = DummyDsoService().agr_client(agr_service.sender_domain)
+
+        # The FlexRequest occupies the only worker while the others wait.
+        client.send_flex_request(messages_by_type[FlexRequest])
+        wait_until(lambda: agr_service.inbound_executor.metrics.started == 1)
+        client.send_flex_settlement(messages_by_type[FlexSettlement])
+        client.send_flex_order(messages_by_type[FlexOrder])
+
+        agr_service.release.set()
+        agr_service.request_futures["process_flex_settlement"].result(timeout=10)
+
+    assert agr_service.processed == [FlexRequest, FlexOrder, FlexSettlement]
+    assert agr_service.inbound_latency[FlexSettlement].count == 1
+    assert agr_service.inbound_latency[FlexOrder].count == 1
+    assert agr_service.inbound_latency[FlexRequest].count == 1
+
+
+def test_inbound_ordering_and_priorities_cannot_be_combined():
+    class InvalidAgrService(PriorityAgrService):
+        inbound_ordering = "conversation"
+
+    with pytest.raises(ValueError):
+        InvalidAgrService()
+
+
+class BulkheadAgrService(DummyAgrService):
+    num_inbound_threads = 1
+    inbound_pools = {"settlement": ([FlexSettlement], 1, 1)}
+
+    def __init__(self):
+        super().__init__()
+        self.release = Event()
+
+    def process_flex_settlement(self, message):
+        self.release.wait(timeout=10)
+        super().process_flex_settlement(message)
+
+
+def test_slow_pool_does_not_block_other_messages():
+    with BulkheadAgrService() as agr_service:
+        client = DummyDsoService().agr_client(agr_service.sender_domain)
+
+        # The FlexSettlement occupies the settlement pool, but the
+        # FlexOrder is processed by the inbound executor.
+        client.send_flex_settlement(messages_by_type[FlexSettlement])
+        client.send_flex_order(messages_by_type[FlexOrder])
+        assert agr_service.request_futures["process_flex_order"].result(timeout=10) is not None
+
+        wait_until(lambda: agr_service.inbound_pool_executors["settlement"].metrics.started == 1)
+        metrics = agr_service.inbound_metrics()
+        assert metrics["settlement"]["saturation"] == 1.0
+        assert metrics["settlement"]["active"] == 1
+        assert metrics["default"]["submitted"] == 1
+
+        # The settlement pool has room for one more in its queue.
+        client.send_flex_settlement(messages_by_type[FlexSettlement])
+        with pytest.raises(ClientTransportException) as exc_info:
+            client.send_flex_settlement(messages_by_type[FlexSettlement])
+        assert exc_info.value.response.status_code == 429
+
+        agr_service.release.set()
+        agr_service.request_futures["process_flex_settlement"].result(timeout=10)
+
+
+@pytest.mark.parametrize("inbound_pools", [
+    {"misdirected": ([FlexOffer], 1, None)},
+    {"one": ([FlexOrder], 1, None), "two": ([FlexOrder, FlexRequest], 1, None)},
+])
+def test_invalid_inbound_pools(inbound_pools):
+    class InvalidAgrService(DummyAgrService):
+        pass
+
+    InvalidAgrService.inbound_pools = inbound_pools
+    with pytest.raises(ValueError):
+        InvalidAgrService()
@@ -0,0 +1,110 @@
+from base64 import b64encode
+
+import pytest
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import keys, transport
+from shapeshifter_uftp.exceptions import InvalidSignatureException, SchemaException
+from shapeshifter_uftp.keys import KeyStore, SigningKey, VerifyKey
+from shapeshifter_uftp.uftp import DPrognosis, FlexRequest, UsefRole
+
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
+
+
+def keypair():
+    return [b64encode(key).decode() for key in crypto_sign_keypair()]
+
+
+def test_keys_are_decoded_once():
+    public_key, private_key = keypair()
+    assert keys.verify_key(public_key) is keys.verify_key(public_key)
+    assert keys.signing_key(private_key) is keys.signing_key(private_key)
+    assert keys.signing_key(private_key).verify_key == keys.verify_key(public_key)
+    assert str(keys.verify_key(public_key)) == public_key
+    assert private_key not in repr(keys.signing_key(private_key))
+
+
+@pytest.mark.parametrize("key", ["not base64!", b64encode(b"too short").decode()])
+def test_invalid_keys(key):
+    with pytest.raises(ValueError):
+        keys.verify_key(key)
+    with pytest.raises(ValueError):
+        keys.signing_key(key)
+
+
+def test_wrong_key_type():
+    public_key, private_key = keypair()
+    with pytest.raises(TypeError):
+        keys.signing_key(keys.verify_key(public_key))
+    with pytest.raises(TypeError):
+        keys.verify_key(None)
+    assert keys.signing_key(SigningKey.from_base64(private_key)) == keys.signing_key(private_key)
+
+
+def test_seal_and_unseal_with_key_objects():
+    public_key, private_key = keypair()
+    message = messages_by_type[DPrognosis]
+    sealed = transport.seal_message(message, SigningKey.from_base64(private_key))
+    assert sealed == transport.seal_message(message, private_key)
+    assert transport.unseal_message(sealed, VerifyKey.from_base64(public_key)) == message
+
+    other_public_key, _ = keypair()
+    with pytest.raises(InvalidSignatureException):
+        transport.unseal_message(sealed, keys.verify_key(other_public_key))
+
+
+def test_key_store_rotation():
+    store = KeyStore()
+    old_key, _ = keypair()
+    new_key, _ = keypair()
+
+    key = store.verify_key("agr.dev", UsefRole.AGR, old_key)
+    assert store.verify_key("agr.dev", "AGR", old_key) is key
+    assert ("agr.dev", UsefRole.AGR) in store
+
+    rotated = store.verify_key("agr.dev", UsefRole.AGR, new_key)
+    assert rotated == VerifyKey.from_base64(new_key)
+    assert store.get("agr.dev", UsefRole.AGR) is rotated
+    assert len(store) == 1
+
+
+def test_key_store_invalidate():
+    store = KeyStore(maxsize=2)
+    for domain, role in [("agr.dev", "AGR"), ("agr.dev", "CRO"), ("dso.dev", "DSO")]:
+        store.verify_key(domain, role, keypair()[0])
+    assert len(store) == 2
+    assert ("agr.dev", "AGR") not in store
+
+    store.invalidate("agr.dev")
+    assert ("agr.dev", "CRO") not in store
+    assert ("dso.dev", "DSO") in store
+
+
+def test_service_picks_up_rotated_keys():
+    dso_public_key, dso_private_key = keypair()
+
+    class RotatingAgrService(DummyAgrService):
+        def __init__(self):
+            super().__init__()
+            self.key_lookup_function = self.lookup_key
+
+        def lookup_key(self, domain, role):
+            return dso_public_key
+
+    with RotatingAgrService() as agr_service:
+        dso_service = DummyDsoService()
+        for _ in range(2):
+            dso_service.signing_key = dso_private_key
+            dso_service.client_registry.close()
+            agr_service.reset_futures("flex_request")
+            dso_service.agr_client(agr_service.sender_domain).send_flex_request(messages_by_type[FlexRequest])
+            agr_service.request_futures["process_flex_request"].result(timeout=5)
+            assert agr_service.key_store.get("dso.dev", "DSO") == VerifyKey.from_base64(dso_public_key)
+            dso_public_key, dso_private_key = keypair()
+
+
+def test_service_rejects_invalid_public_keys():
+    agr_service = DummyAgrService()
+    with pytest.raises(SchemaException):
+        agr_service._verify_key("dso.dev", UsefRole.DSO, "not a key")
@@ -0,0 +1,85 @@
+import json
+import logging
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from shapeshifter_uftp.logging import (
+    JsonLogFormatter,
+    ShapeshifterLogFormatter,
+    configure_logging,
+    handler,
+    logger,
+)
+
+
+@pytest.fixture
+def restore_logging():
+    level = logger.level
+    formatter = handler.formatter
+    yield
+    logger.setLevel(level)
+    handler.setFormatter(formatter)
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
+
+
+def make_record(msg, *args, level=logging.INFO):
+    return logger.makeRecord(logger.name, level, __file__, 1, msg, args, None)
+
+
+def test_json_formatter():
+    entry = json.loads(JsonLogFormatter().format(make_record("Got %d messages from %s", 3, "agr.dev")))
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "shapeshifter-uftp"
+    assert entry["message"] == "Got 3 messages from agr.dev"
+    assert "time" in entry
+
+
+@pytest.fixture
+def amsterdam_time(monkeypatch):
+    monkeypatch.setenv("TZ", "Europe/Amsterdam")
+    time.tzset()
+    yield
+    monkeypatch.undo()
+    time.tzset()
+
+
+def test_timestamps_follow_daylight_saving_time(amsterdam_time):  # pylint: disable=redefined-outer-name,unused-argument
+    winter = make_record("Winter")
+    winter.created = datetime(2024, 1, 15, 12, tzinfo=timezone.utc).timestamp()
+    summer = make_record("Summer")
+    summer.created = datetime(2024, 7, 15, 12, tzinfo=timezone.utc).timestamp()
+
+    formatter = JsonLogFormatter()
+    assert json.loads(formatter.format(winter))["time"] == "2024-01-15T13:00:00+01:00"
+    assert json.loads(formatter.format(summer))["time"] == "2024-07-15T14:00:00+02:00"
+
+
+def test_color_formatter():
+    line = ShapeshifterLogFormatter().format(make_record("Hello %s", "world", level=logging.WARNING))
+    assert "WARNING" in line
+    assert line.endswith(" - Hello world")
+
+
+def test_configure_logging(restore_logging):  # pylint: disable=redefined-outer-name,unused-argument
+    configure_logging(level="warning", log_format="json")
+    assert logger.level == logging.WARNING
+    assert isinstance(handler.formatter, JsonLogFormatter)
+    assert not logger.isEnabledFor(logging.INFO)
+
+    configure_logging(log_format="none")
+    assert handler not in logger.handlers
+
+    with pytest.raises(ValueError):
+        configure_logging(log_format="xml")
+
+
+def test_messages_are_formatted_lazily(restore_logging):  # pylint: disable=redefined-outer-name,unused-argument
+    class Expensive:
+        def __str__(self):
+            raise AssertionError("The message should not have been formatted")
+
+    configure_logging(level=logging.INFO)
+    logger.debug("The message is %s", Expensive())
@@ -1,4 +1,5 @@
 import itertools
+from concurrent.futures import Future
 
 import pytest
 
@@ -8,6 +9,10 @@ from shapeshifter_uftp import (
     ShapeshifterDsoService,
 )
 from shapeshifter_uftp.service.base_service import snake_case
+from shapeshifter_uftp.uftp import FlexOffer, FlexRequest
+
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
 
 
 @pytest.mark.parametrize('service,message_type,stage',
@@ -21,3 +26,32 @@ def test_presence_of_processing_methods(service, message_type, stage):
     processing_method = f"{stage}_{snake_case(message_type.__name__)}"
     assert hasattr(service, processing_method)
 
+
+
+@pytest.mark.parametrize('service', [ShapeshifterAgrService, ShapeshifterCroService, ShapeshifterDsoService])
+def test_message_handlers(service):
+    # pylint: disable=protected-access
+    assert list(service._message_handlers) == service.acceptable_messages
+    for message_type, handler_name in service._message_handlers.items():
+        assert handler_name == f"process_{snake_case(message_type.__name__)}"
+        assert hasattr(service, handler_name)
+
+
+def test_process_method_replaced_on_instance():
+    received = Future()
+    with DummyDsoService() as dso_service:
+        dso_service.process_flex_offer = received.set_result
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        assert received.result(timeout=10).message_id == messages_by_type[FlexOffer].message_id
+
+    assert not dso_service.request_futures["process_flex_offer"].done()
+
+
+class MisconfiguredDsoService(DummyDsoService):
+    acceptable_messages = [*DummyDsoService.acceptable_messages, FlexRequest]
+
+
+def test_missing_message_handler():
+    with pytest.raises(TypeError, match="process_flex_request"):
+        MisconfiguredDsoService()
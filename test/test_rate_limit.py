@@ -0,0 +1,83 @@
+import time
+
+import pytest
+
+from shapeshifter_uftp.exceptions import ClientTransportException
+from shapeshifter_uftp.service.rate_limit import RateLimiter, TokenBucket
+from shapeshifter_uftp.uftp import FlexOffer, UsefRole
+
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
+
+
+def test_token_bucket():
+    now = time.monotonic()
+    bucket = TokenBucket(rate=10, burst=2)
+    assert bucket.consume(now)
+    assert bucket.consume(now)
+    assert not bucket.consume(now)
+    assert bucket.consume(now + 0.15)
+    assert not bucket.consume(now + 0.15)
+    assert bucket.is_full(now + 1)
+
+
+def test_rate_limiter_unlimited_by_default():
+    limiter = RateLimiter()
+    assert all(limiter.allow("agr.dev", "AGR") for _ in range(1000))
+
+
+def test_rate_limiter_per_sender():
+    limiter = RateLimiter(rate=1, burst=2)
+    assert limiter.allow("agr.dev", "AGR")
+    assert limiter.allow("agr.dev", "AGR")
+    assert not limiter.allow("agr.dev", "AGR")
+
+    # Other senders have their own bucket
+    assert limiter.allow("agr.dev", "CRO")
+    assert limiter.allow("other.dev", "AGR")
+
+
+def test_rate_limiter_participant_limits():
+    limiter = RateLimiter(
+        rate=1,
+        burst=1,
+        participant_limits={
+            ("big.dev", "AGR"): (100, 100),
+            ("trusted.dev", UsefRole.AGR): (None, None),
+        },
+    )
+    assert limiter.allow("small.dev", "AGR")
+    assert not limiter.allow("small.dev", "AGR")
+    assert all(limiter.allow("big.dev", UsefRole.AGR) for _ in range(100))
+    assert not limiter.allow("big.dev", UsefRole.AGR)
+    assert all(limiter.allow("trusted.dev", "AGR") for _ in range(1000))
+
+
+def test_rate_limiter_drops_least_recently_used_buckets():
+    limiter = RateLimiter(rate=0.001, burst=1)
+    limiter.max_buckets = 10
+    for i in range(10):
+        limiter.allow(f"agr{i}.dev", "AGR")
+    assert not limiter.allow("agr0.dev", "AGR")
+
+    # None of the buckets has refilled, but the number of buckets stays
+    # within the limit.
+    for i in range(10, 19):
+        limiter.allow(f"agr{i}.dev", "AGR")
+    assert len(limiter._buckets) == 10
+    assert ("agr0.dev", "AGR") in limiter._buckets
+    assert ("agr1.dev", "AGR") not in limiter._buckets
+
+
+class RateLimitedDsoService(DummyDsoService):
+    rate_limit = 0.001
+    rate_limit_burst = 1
+
+
+def test_service_answers_429_when_rate_limited():
+    with RateLimitedDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        with pytest.raises(ClientTransportException) as exc_info:
+            client.send_flex_offer(messages_by_type[FlexOffer])
+        assert exc_info.value.response.status_code == 429
@@ -8,8 +8,19 @@ import pytest
 from nacl.bindings import crypto_sign, crypto_sign_keypair
 
 from shapeshifter_uftp import TestMessage as UFTPTestMessage
+from shapeshifter_uftp import transport
 from shapeshifter_uftp.exceptions import InvalidSignatureException, SchemaException
-from shapeshifter_uftp.transport import get_key, seal_message, unseal_message
+from shapeshifter_uftp.transport import (
+    from_xml,
+    get_key,
+    seal_message,
+    to_signed_xml,
+    to_xml,
+    unseal_message,
+)
+from shapeshifter_uftp.uftp import FlexOffer, SignedMessage, UsefRole
+
+from .helpers.messages import messages_by_type
 
 public, private = crypto_sign_keypair()
 public_base64 = b64encode(public)
@@ -31,6 +42,39 @@ def test_seal_unseal_message():
     assert msg == unsealed
 
 
+@pytest.mark.parametrize("sender_domain", ["dso.dev", 'odd&"<domain>.dev'])
+def test_signed_message_envelope(sender_domain):
+    msg = UFTPTestMessage(
+        version="3.1.0",
+        sender_domain="dso.dev",
+        recipient_domain="cro.dev",
+        time_stamp=datetime.now(timezone.utc).isoformat(),
+        message_id="1234",
+        conversation_id="1234"
+    )
+    sealed = seal_message(msg, private_base64)
+    signed_message = SignedMessage(sender_domain=sender_domain, sender_role=UsefRole.DSO, body=sealed)
+
+    envelope = to_signed_xml(sender_domain, UsefRole.DSO, sealed)
+    assert envelope == to_xml(signed_message).encode("utf-8")
+    assert from_xml(envelope) == signed_message
+
+
+@pytest.mark.parametrize("use_compiled_codecs", [False, True])
+def test_sealed_message_is_compact(use_compiled_codecs):
+    message = messages_by_type[FlexOffer]
+    with patch.object(transport, "USE_COMPILED_CODECS", use_compiled_codecs):
+        sealed = seal_message(message, private_base64)
+
+    # The sealed message is the 64 byte signature, followed by the XML.
+    payload = sealed[64:]
+    assert payload == transport.serializer.render(message).encode("utf-8")
+    assert b"\n " not in payload
+    assert b"><" in payload
+    assert "\n  <" in transport.pretty_serializer.render(message)
+    assert to_xml(message, pretty=True) == transport.pretty_serializer.render(message)
+
+
 def test_tampered_message():
     msg = UFTPTestMessage(
         version="3.1.0",
@@ -0,0 +1,93 @@
+import time
+
+import responses
+
+from shapeshifter_uftp import FlexOffer, ShapeshifterAgrDsoClient
+from shapeshifter_uftp.client.sessions import SessionPool
+
+from .helpers.messages import messages_by_type
+from .helpers.services import AGR_PRIVATE_KEY, DSO_PUBLIC_KEY
+
+DSO_ENDPOINT = "http://localhost:9003/shapeshifter/api/v3/message"
+
+
+def test_session_per_endpoint():
+    pool = SessionPool()
+    session_1 = pool.get("https://dso.dev/shapeshifter/api/v3/message")
+    session_2 = pool.get("https://dso.dev/other/path")
+    session_3 = pool.get("https://agr.dev/shapeshifter/api/v3/message")
+    assert session_1 is session_2
+    assert session_1 is not session_3
+    assert len(pool) == 2
+
+
+def test_session_pool_adapter_size():
+    pool = SessionPool(pool_maxsize=25, pool_block=False)
+    adapter = pool.get("https://dso.dev/").get_adapter("https://dso.dev/")
+    assert adapter._pool_maxsize == 25
+    assert adapter._pool_block is False
+
+
+def test_session_pool_idle_eviction():
+    pool = SessionPool(idle_timeout=0.05)
+    session_1 = pool.get("https://dso.dev/")
+    time.sleep(0.1)
+    pool.evict_idle()
+    assert len(pool) == 0
+    session_2 = pool.get("https://dso.dev/")
+    assert session_1 is not session_2
+
+
+def test_session_pool_close():
+    pool = SessionPool()
+    pool.get("https://dso.dev/")
+    pool.get("https://agr.dev/")
+    pool.close()
+    assert len(pool) == 0
+
+
+@responses.activate
+def test_clients_share_session_pool():
+    responses.add(responses.POST, DSO_ENDPOINT)
+    pool = SessionPool()
+
+    clients = [
+        ShapeshifterAgrDsoClient(
+            sender_domain="agr.dev",
+            signing_key=AGR_PRIVATE_KEY,
+            recipient_domain="dso.dev",
+            recipient_endpoint=DSO_ENDPOINT,
+            recipient_signing_key=DSO_PUBLIC_KEY,
+            session_pool=pool,
+        )
+        for _ in range(2)
+    ]
+    for client in clients:
+        client.send_flex_offer(messages_by_type[FlexOffer])
+
+    assert len(responses.calls) == 2
+    assert len(pool) == 1
+
+
+@responses.activate
+def test_cookies_do_not_leak_between_clients():
+    responses.add(responses.POST, DSO_ENDPOINT, headers={"Set-Cookie": "session=agr-one; Path=/"})
+    pool = SessionPool()
+
+    clients = [
+        ShapeshifterAgrDsoClient(
+            sender_domain=sender_domain,
+            signing_key=AGR_PRIVATE_KEY,
+            recipient_domain="dso.dev",
+            recipient_endpoint=DSO_ENDPOINT,
+            recipient_signing_key=DSO_PUBLIC_KEY,
+            session_pool=pool,
+        )
+        for sender_domain in ("agr-one.dev", "agr-two.dev")
+    ]
+    for client in clients:
+        client.send_flex_offer(messages_by_type[FlexOffer])
+
+    assert len(responses.calls) == 2
+    assert "Cookie" not in responses.calls[1].request.headers
+    assert not pool.get(DSO_ENDPOINT).cookies
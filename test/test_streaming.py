@@ -0,0 +1,238 @@
+from uuid import uuid4
+
+import pytest
+from xsdata.models.datatype import XmlDate
+
+from shapeshifter_uftp import streaming, transport
+from shapeshifter_uftp.exceptions import SchemaException
+from shapeshifter_uftp.uftp import (
+    AgrPortfolioQueryResponse,
+    AgrPortfolioQueryResponseCongestionPoint,
+    AgrPortfolioQueryResponseConnection,
+    AgrPortfolioQueryResponseDSOPortfolio,
+    AgrPortfolioQueryResponseDSOView,
+    DsoPortfolioQueryResponse,
+    FlexOffer,
+    FlexSettlement,
+    RedispatchBy,
+)
+
+from .helpers.messages import default_args, messages_by_type
+from .helpers.services import DummyAgrService, DummyCroService, DummyDsoService
+
+
+def portfolio_query_response(num_portfolios=2, num_congestion_points=3, num_connections=4, num_view_connections=2):
+    return AgrPortfolioQueryResponse(
+        dso_views=[
+            AgrPortfolioQueryResponseDSOView(
+                dso_portfolios=[
+                    AgrPortfolioQueryResponseDSOPortfolio(
+                        dso_domain=f"dso{p}.dev",
+                        congestion_points=[
+                            AgrPortfolioQueryResponseCongestionPoint(
+                                entity_address=f"ean.{p}{c}",
+                                mutex_offers_supported=bool(c % 2),
+                                day_ahead_redispatch_by=RedispatchBy.AGR,
+                                intraday_redispatch_by=RedispatchBy.DSO,
+                                connections=[
+                                    AgrPortfolioQueryResponseConnection(entity_address=f"ean.{p}{c}{n}")
+                                    for n in range(num_connections)
+                                ],
+                            )
+                            for c in range(num_congestion_points)
+                        ],
+                    )
+                    for p in range(num_portfolios)
+                ],
+                connections=[
+                    AgrPortfolioQueryResponseConnection(entity_address=f"ean.view{n}")
+                    for n in range(num_view_connections)
+                ],
+            )
+        ],
+        period=XmlDate(2023, 1, 1),
+        agr_portfolio_query_message_id=str(uuid4()),
+        **default_args,
+    )
+
+
+def test_message_attributes():
+    message = portfolio_query_response()
+    reader = streaming.read_message(transport.to_xml(message).encode())
+    assert reader.message_type is AgrPortfolioQueryResponse
+    assert reader.message_id == message.message_id
+    assert reader.conversation_id == message.conversation_id
+    assert reader.period == message.period
+    assert reader.agr_portfolio_query_message_id == message.agr_portfolio_query_message_id
+    with pytest.raises(AttributeError):
+        reader.dso_views  # pylint: disable=pointless-statement
+
+
+def test_agr_portfolio_query_response():
+    message = portfolio_query_response()
+    reader = streaming.read_message(transport.to_xml(message).encode())
+
+    expected = []
+    for portfolio in message.dso_views[0].dso_portfolios:
+        for congestion_point in portfolio.congestion_points:
+            expected.append((portfolio.dso_domain, congestion_point))
+    expected_view_connections = message.dso_views[0].connections
+
+    results = [
+        (congestion_point, list(connections))
+        for congestion_point, connections in reader.congestion_points()
+    ]
+    assert len(results) == len(expected) + 1
+    for (congestion_point, connections), (dso_domain, expected_congestion_point) in zip(results, expected):
+        assert congestion_point.dso_domain == dso_domain
+        assert congestion_point.entity_address == expected_congestion_point.entity_address
+        assert congestion_point.mutex_offers_supported == expected_congestion_point.mutex_offers_supported
+        assert congestion_point.day_ahead_redispatch_by == RedispatchBy.AGR
+        assert congestion_point.intraday_redispatch_by == RedispatchBy.DSO
+        assert connections == expected_congestion_point.connections
+    assert results[-1] == (None, expected_view_connections)
+
+
+def test_skipped_connections():
+    message = portfolio_query_response()
+    reader = streaming.read_message(transport.to_xml(message).encode())
+    addresses = [congestion_point and congestion_point.entity_address for congestion_point, _ in reader.congestion_points()]
+    assert addresses == ["ean.00", "ean.01", "ean.02", "ean.10", "ean.11", "ean.12", None]
+
+
+def test_dso_portfolio_query_response():
+    message = messages_by_type[DsoPortfolioQueryResponse]
+    reader = streaming.read_message(transport.to_xml(message).encode())
+    results = [(congestion_point, list(connections)) for congestion_point, connections in reader.congestion_points()]
+    assert len(results) == 1
+    congestion_point, connections = results[0]
+    assert congestion_point.entity_address == message.congestion_point.entity_address
+    assert congestion_point.dso_domain is None
+    assert connections == message.congestion_point.connections
+
+
+@pytest.mark.parametrize("xml_message", [
+    b"garbage",
+    transport.to_xml(messages_by_type[FlexOffer]).encode(),
+])
+def test_unreadable_messages(xml_message):
+    with pytest.raises(SchemaException):
+        streaming.read_message(xml_message)
+
+
+def test_malformed_contents():
+    xml_message = transport.to_xml(portfolio_query_response()).encode()
+    reader = streaming.read_message(xml_message[:len(xml_message) // 2])
+    with pytest.raises(SchemaException):
+        for _, connections in reader.congestion_points():
+            list(connections)
+
+
+class StreamingAgrService(DummyAgrService):
+    streamed_messages = [AgrPortfolioQueryResponse]
+
+    def process_agr_portfolio_query_response(self, message):
+        result = [
+            (congestion_point, [connection.entity_address for connection in connections])
+            for congestion_point, connections in message.congestion_points()
+        ]
+        self.request_futures["process_agr_portfolio_query_response"].set_result((message, result))
+
+
+def test_service_with_streamed_messages():
+    message = portfolio_query_response()
+    with StreamingAgrService() as agr_service:
+        with DummyCroService().agr_client(agr_service.sender_domain) as client:
+            client.send_agr_portfolio_query_response(message)
+            reader, result = agr_service.request_futures["process_agr_portfolio_query_response"].result(timeout=5)
+
+    assert isinstance(reader, streaming.PortfolioQueryResponseReader)
+    assert reader.message_id == message.message_id
+    assert len(result) == 7
+    assert result[0][1] == ["ean.000", "ean.001", "ean.002", "ean.003"]
+
+
+def test_service_without_streaming_reader():
+    class MisconfiguredAgrService(DummyAgrService):
+        streamed_messages = [AgrPortfolioQueryResponse, FlexOffer]
+
+    with pytest.raises(TypeError, match="FlexOffer"):
+        MisconfiguredAgrService()
+
+
+def flex_settlement_attributes(message):
+    return {
+        name: getattr(message, name)
+        for name in ("version", "sender_domain", "recipient_domain", "time_stamp", "message_id",
+                     "conversation_id", "period_start", "period_end", "currency")
+    }
+
+
+def test_flex_settlement_writer_matches_serializer():
+    message = messages_by_type[FlexSettlement]
+    writer = streaming.write_flex_settlement(
+        (settlement for settlement in message.flex_order_settlements * 3),
+        message.contract_settlements,
+        **flex_settlement_attributes(message),
+    )
+    expected = FlexSettlement(
+        flex_order_settlements=message.flex_order_settlements * 3,
+        contract_settlements=message.contract_settlements,
+        **flex_settlement_attributes(message),
+    )
+    assert writer.to_xml() == transport.to_xml(expected).encode()
+
+
+def test_flex_settlement_writer_validation():
+    message = messages_by_type[FlexSettlement]
+    with pytest.raises(TypeError):
+        streaming.FlexSettlementWriter(currency="EUR")
+    with pytest.raises(TypeError):
+        streaming.FlexSettlementWriter(unknown=1, **flex_settlement_attributes(message))
+
+    writer = streaming.FlexSettlementWriter(**flex_settlement_attributes(message))
+    with pytest.raises(TypeError):
+        writer.write_flex_order_settlement(message.contract_settlements[0])
+    writer.write_flex_order_settlement(message.flex_order_settlements[0])
+    with pytest.raises(ValueError):
+        writer.to_xml()
+    writer.write_contract_settlement(message.contract_settlements[0])
+    with pytest.raises(ValueError):
+        writer.write_flex_order_settlement(message.flex_order_settlements[0])
+    assert transport.from_xml(writer.to_xml()) == message
+
+
+def test_flex_settlement_reader():
+    message = messages_by_type[FlexSettlement]
+    message = FlexSettlement(
+        flex_order_settlements=message.flex_order_settlements * 5,
+        contract_settlements=message.contract_settlements * 2,
+        **flex_settlement_attributes(message),
+    )
+    reader = streaming.read_message(transport.to_xml(message).encode())
+    assert isinstance(reader, streaming.FlexSettlementReader)
+    assert reader.period_end == message.period_end
+    assert list(reader.flex_order_settlements()) == message.flex_order_settlements
+    assert list(reader.contract_settlements()) == message.contract_settlements
+
+    # Skipping the FlexOrderSettlements
+    reader = streaming.read_message(transport.to_xml(message).encode())
+    assert list(reader.contract_settlements()) == message.contract_settlements
+    assert not list(reader.flex_order_settlements())
+
+
+def test_send_flex_settlement_writer():
+    message = messages_by_type[FlexSettlement]
+    writer = streaming.write_flex_settlement(
+        message.flex_order_settlements * 2,
+        message.contract_settlements,
+        **flex_settlement_attributes(message),
+    )
+    with DummyAgrService() as agr_service:
+        client = DummyDsoService().agr_client(agr_service.sender_domain)
+        client.send_flex_settlement(writer)
+        received = agr_service.request_futures["process_flex_settlement"].result(timeout=5)
+
+    assert received.flex_order_settlements == message.flex_order_settlements * 2
+    assert received.conversation_id == message.conversation_id
+    assert received.sender_domain == client.sender_domain
@@ -1,5 +1,10 @@
 import time
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event
 
+import pytest
+
+from shapeshifter_uftp.cache import Expiring, TTLCache, cache_ttl, cacheable
 from shapeshifter_uftp.transport import ttl_cache
 
 
@@ -48,3 +53,116 @@ def test_ttl_cache_with_kwargs():
     time.sleep(0.06)
     result_5 = dummy_function("hello", key="one")
     assert result_1 != result_5
+
+
+def test_ttl_cache_lru_eviction():
+    @ttl_cache(60, maxsize=2)
+    def identity(value):
+        return object()
+
+    first = identity(1)
+    identity(2)
+    assert identity(1) is first
+    identity(3)
+    assert identity.cache.stats.evictions == 1
+    assert (2,) not in identity.cache
+    assert identity(1) is first
+
+
+def test_ttl_cache_single_flight():
+    calls = []
+    release = Event()
+
+    @ttl_cache(60)
+    def slow_lookup(key):
+        calls.append(key)
+        release.wait(timeout=5)
+        return key.upper()
+
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        futures = [executor.submit(slow_lookup, "dso.dev") for _ in range(10)]
+        time.sleep(0.05)
+        release.set()
+        assert {future.result() for future in futures} == {"DSO.DEV"}
+
+    assert calls == ["dso.dev"]
+    assert slow_lookup.cache.stats.misses == 10
+
+
+def test_ttl_cache_errors_are_not_cached():
+    calls = []
+
+    @ttl_cache(60)
+    def failing():
+        calls.append(1)
+        raise ValueError("BOOM")
+
+    for _ in range(2):
+        with pytest.raises(ValueError):
+            failing()
+    assert len(calls) == 2
+    assert failing.cache.stats.load_errors == 2
+
+
+def test_ttl_cache_stale_while_revalidate():
+    refreshed = Event()
+    values = iter(["old", "new"])
+
+    @ttl_cache(0.05, stale_ttl=10)
+    def lookup():
+        value = next(values)
+        if value == "new":
+            refreshed.set()
+        return value
+
+    assert lookup() == "old"
+    time.sleep(0.06)
+
+    # The expired value is returned while it is refreshed in the background
+    assert lookup() == "old"
+    assert refreshed.wait(timeout=5)
+    while lookup.cache._pending:
+        time.sleep(0.01)
+    assert lookup() == "new"
+
+    stats = lookup.cache.stats.as_dict()
+    assert stats["stale_hits"] == 1
+    assert stats["refreshes"] == 1
+    assert stats["hits"] == 1
+
+
+def test_ttl_cache_settings_are_read_when_used():
+    settings = {"ttl": 60, "maxsize": 2}
+    cache = TTLCache(lambda: settings["ttl"], maxsize=lambda: settings["maxsize"])
+    cache.set("a", 1)
+    cache.set("b", 2)
+    settings["maxsize"] = 1
+    settings["ttl"] = 0
+    cache.set("c", 3)
+    assert list(cache._entries) == ["c"]
+    assert cache.get("c") is None
+
+
+def test_ttl_cache_store_result_and_error():
+    cache = TTLCache(60)
+    assert cache.store_result("plain", 1) == 1
+    assert cache.store_result("expiring", Expiring(2, 0)) == 2
+    assert cache.get("plain") == 1
+    assert cache.get("expiring") is None
+
+    cache.store_error("error", ValueError())
+    assert "error" not in cache
+    cache.store_error("error", cacheable(ValueError(), 60))
+    assert cache_ttl(cache._entries["error"].error) == 60
+    with pytest.raises(ValueError):
+        cache.get("error")
+
+
+def test_ttl_cache_set_and_invalidate():
+    cache = TTLCache(60)
+    cache.set("key", "value")
+    assert cache.get_or_load("key", lambda: "other") == "value"
+    cache.invalidate("key")
+    assert cache.get_or_load("key", lambda: "other") == "other"
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,104 @@
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor
+
+import requests
+
+from shapeshifter_uftp.transport import seal_message, to_xml
+from shapeshifter_uftp.uftp import AgrPortfolioQueryResponse, FlexOffer, SignedMessage
+
+from .helpers import wait_until
+from .helpers.messages import messages_by_type
+from .helpers.services import (
+    AGR_PRIVATE_KEY,
+    DSO_PRIVATE_KEY,
+    DummyAgrService,
+    DummyCroService,
+    DummyDsoService,
+)
+
+
+class ProcessDsoService(DummyDsoService):
+    num_unseal_processes = 2
+
+
+class ProcessAgrService(DummyAgrService):
+    num_unseal_processes = 2
+    streamed_messages = [AgrPortfolioQueryResponse]
+
+
+def test_service_unseals_in_processes():
+    with ProcessDsoService() as dso_service:
+        assert isinstance(dso_service.unseal_executor, ProcessPoolExecutor)
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        message = messages_by_type[FlexOffer]
+        client.send_flex_offer(message)
+        received = dso_service.request_futures["process_flex_offer"].result(timeout=30)
+        assert received.message_id == message.message_id
+        assert received.offer_options == message.offer_options
+
+
+def test_invalid_signature_in_process():
+    with ProcessDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        signed_message = SignedMessage(
+            sender_domain="agr.dev",
+            sender_role="AGR",
+            # Signed with the wrong key
+            body=seal_message(messages_by_type[FlexOffer], DSO_PRIVATE_KEY),
+        )
+        response = requests.post(
+            client.recipient_endpoint,
+            headers={"Content-Type": "text/xml"},
+            data=to_xml(signed_message),
+            timeout=30,
+        )
+        assert response.status_code == 401
+
+
+def test_killed_unseal_process_is_replaced():
+    with ProcessDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        dso_service.request_futures["process_flex_offer"].result(timeout=30)
+
+        executor = dso_service.unseal_executor
+        os.kill(next(iter(executor._processes)), signal.SIGKILL)  # pylint: disable=protected-access
+        wait_until(lambda: executor._broken)  # pylint: disable=protected-access
+
+        signed_message = SignedMessage(
+            sender_domain="agr.dev",
+            sender_role="AGR",
+            body=seal_message(messages_by_type[FlexOffer], AGR_PRIVATE_KEY),
+        )
+        response = requests.post(
+            client.recipient_endpoint,
+            headers={"Content-Type": "text/xml"},
+            data=to_xml(signed_message),
+            timeout=30,
+        )
+        assert response.status_code == 503
+        assert dso_service.unseal_executor is not executor
+
+        dso_service.reset_futures("flex_offer")
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        received = dso_service.request_futures["process_flex_offer"].result(timeout=30)
+        assert received.message_id == messages_by_type[FlexOffer].message_id
+
+
+def test_streamed_messages_with_processes():
+    with ProcessAgrService() as agr_service:
+        with DummyCroService().agr_client(agr_service.sender_domain) as client:
+            client.send_agr_portfolio_query_response(messages_by_type[AgrPortfolioQueryResponse])
+            reader = agr_service.request_futures["process_agr_portfolio_query_response"].result(timeout=30)
+        assert [congestion_point.entity_address for congestion_point, _ in reader.congestion_points()] == [
+            "ean.123456789012"
+        ]
+
+
+def test_stop_replaces_process_pool():
+    service = ProcessDsoService()
+    executor = service.unseal_executor
+    service.stop()
+    assert service.unseal_executor is not executor
+    assert isinstance(service.unseal_executor, ProcessPoolExecutor)
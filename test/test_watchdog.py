@@ -0,0 +1,125 @@
+import asyncio
+import time
+from threading import Event
+
+from shapeshifter_uftp.service.watchdog import HandlerWatchdog
+from shapeshifter_uftp.uftp import FlexOffer, FlexOfferRevocation
+
+from .helpers import wait_until
+from .helpers.messages import messages_by_type
+from .helpers.services import DummyAgrService, DummyDsoService
+
+
+def slow_handler(watchdog, seconds, deadline=None):
+    token = watchdog.start("slow_handler", deadline)
+    time.sleep(seconds)
+    return watchdog.finish(token)
+
+
+def test_slow_handler_is_logged_with_stack(caplog):
+    watchdog = HandlerWatchdog(slow_threshold=0.05, interval=0.01)
+    duration = slow_handler(watchdog, 0.2)
+    watchdog.close()
+
+    assert duration >= 0.2
+    assert watchdog.stats() == {"running": 0, "slow": {"slow_handler": 1}, "exceeded": {}}
+    messages = [record.getMessage() for record in caplog.records if record.levelname == "WARNING"]
+    assert len(messages) == 1
+    assert "slow_handler has been running for" in messages[0]
+    assert "time.sleep(seconds)" in messages[0]
+
+
+def test_deadline_is_counted_once():
+    watchdog = HandlerWatchdog(interval=0.01)
+    slow_handler(watchdog, 0.1, deadline=0.02)
+    slow_handler(watchdog, 0.01, deadline=1)
+    watchdog.close()
+    assert watchdog.stats()["exceeded"] == {"slow_handler": 1}
+
+
+def test_deadline_is_counted_when_handler_finishes():
+    # The handler finishes before the watchdog checks on it.
+    watchdog = HandlerWatchdog(interval=60)
+    slow_handler(watchdog, 0.05, deadline=0.01)
+    watchdog.close()
+    assert watchdog.stats()["exceeded"] == {"slow_handler": 1}
+
+
+def test_stack_of_coroutine():
+    async def wait_for_database(event):
+        await event.wait()
+
+    async def main():
+        event = asyncio.Event()
+        task = asyncio.create_task(wait_for_database(event))
+        await asyncio.sleep(0)
+        watchdog = HandlerWatchdog()
+        token = watchdog.start("process_flex_offer", task=task)
+        stack = watchdog._stack_sample(watchdog._running[token])  # pylint: disable=protected-access
+        event.set()
+        await task
+        watchdog.finish(token)
+        return stack
+
+    assert "await event.wait()" in asyncio.run(main())
+
+
+class WatchedDsoService(DummyDsoService):
+    handler_deadline = 0.05
+    handler_deadlines = {FlexOfferRevocation: 0.1}
+
+    def __init__(self):
+        super().__init__()
+        self.cancelled = Event()
+
+    def process_flex_offer(self, message):
+        time.sleep(0.1)
+        super().process_flex_offer(message)
+
+    async def process_flex_offer_revocation(self, message):
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            self.cancelled.set()
+            raise
+
+
+def test_service_counts_handlers_past_their_deadline():
+    with WatchedDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer(messages_by_type[FlexOffer])
+        client.send_flex_offer_revocation(messages_by_type[FlexOfferRevocation])
+        dso_service.request_futures["process_flex_offer"].result(timeout=10)
+
+        # The coroutine process method is cancelled at its deadline.
+        assert dso_service.cancelled.wait(timeout=10)
+        wait_until(lambda: dso_service.inbound_latency[FlexOfferRevocation].count == 1)
+        assert dso_service.inbound_latency[FlexOfferRevocation].max < 5
+
+    assert dso_service.watchdog.stats()["exceeded"] == {
+        "process_flex_offer": 1,
+        "process_flex_offer_revocation": 1,
+    }
+
+
+def test_no_watchdog_by_default():
+    assert DummyDsoService().watchdog is None
+
+
+class TimingOutDsoService(DummyDsoService):
+    handler_deadline = 10
+
+    async def process_flex_offer_revocation(self, message):
+        raise TimeoutError("The database did not answer")
+
+
+def test_own_timeout_of_coroutine_process_method(caplog):
+    with TimingOutDsoService() as dso_service:
+        client = DummyAgrService().dso_client(dso_service.sender_domain)
+        client.send_flex_offer_revocation(messages_by_type[FlexOfferRevocation])
+        wait_until(lambda: dso_service.inbound_latency[FlexOfferRevocation].count == 1)
+
+    messages = [record.getMessage() for record in caplog.records if record.levelname == "ERROR"]
+    assert any("TimeoutError: The database did not answer" in message for message in messages)
+    assert not any("deadline" in message for message in messages)
+    assert dso_service.watchdog.stats()["exceeded"] == {}
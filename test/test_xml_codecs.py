@@ -0,0 +1,91 @@
+import os
+import warnings
+from base64 import b64encode
+
+import pytest
+import xmlschema
+from nacl.bindings import crypto_sign_keypair
+
+from shapeshifter_uftp import transport, xml_codecs
+from shapeshifter_uftp.uftp import (
+    DPrognosis,
+    Metering,
+    SignedMessage,
+    UsefRole,
+    destination_map,
+)
+
+from .helpers.messages import messages, messages_by_type
+
+base_url = os.path.join(os.path.dirname(__file__), 'schema')
+
+schemas = {
+    "AGR": xmlschema.XMLSchema("UFTP-agr.xsd", base_url=base_url),
+    "CRO": xmlschema.XMLSchema("UFTP-cro.xsd", base_url=base_url),
+    "DSO": xmlschema.XMLSchema("UFTP-dso.xsd", base_url=base_url),
+}
+
+message_ids = [message.__class__.__name__ for message in messages]
+
+
+@pytest.mark.parametrize('message', messages, ids=message_ids)
+def test_compiled_serializer_matches_xsdata(message):
+    xml_message = xml_codecs.to_xml(message)
+    assert xml_message == transport.serializer.render(message)
+    schemas[destination_map[type(message)]].validate(xml_message)
+
+
+@pytest.mark.parametrize('message', messages, ids=message_ids)
+def test_compiled_parser_matches_xsdata(message):
+    xml_message = transport.serializer.render(message)
+    assert xml_codecs.from_xml(xml_message) == transport.parser.from_string(xml_message)
+    assert xml_codecs.from_xml(xml_message.encode()) == message
+
+
+def test_pretty_input_is_parsed():
+    message = messages_by_type[Metering]
+    assert xml_codecs.from_xml(transport.to_xml(message, pretty=True)) == message
+
+
+def test_attribute_escaping_matches_xsdata():
+    message = SignedMessage(sender_domain='a\n\t\r\'>&<"é.dev', sender_role=UsefRole.DSO, body=b"body")
+    assert xml_codecs.to_xml(message) == transport.serializer.render(message)
+    assert xml_codecs.from_xml(xml_codecs.to_xml(message)) == message
+
+
+def test_invalid_characters_fall_back_to_xsdata():
+    message = SignedMessage(sender_domain="a\x01.dev", sender_role=UsefRole.DSO, body=b"body")
+    with pytest.raises(ValueError):
+        xml_codecs.to_xml(message)
+
+
+@pytest.mark.parametrize("xml_message", [
+    # Namespaced root element
+    '<TestMessage xmlns="urn:example" Version="3.1.0" SenderDomain="a.dev"/>',
+    # Unknown child element
+    '<D-Prognosis Version="3.1.0" Revision="1"><Unknown/></D-Prognosis>',
+    # Value that can not be converted
+    '<D-Prognosis Version="3.1.0" ISP-Duration="PT15M" Period="2023-01-01" CongestionPoint="ean.1" Revision="one"/>',
+    # Missing required attributes
+    '<D-Prognosis Version="3.1.0"/>',
+    # Not XML at all
+    'garbage',
+])
+def test_fallback_matches_xsdata(xml_message):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        try:
+            expected = transport.parser.from_string(xml_message)
+        except Exception as exc:  # pylint: disable=broad-exception-caught
+            with pytest.raises(type(exc)):
+                xml_codecs.from_xml(xml_message)
+        else:
+            assert xml_codecs.from_xml(xml_message) == expected
+
+
+def test_transport_with_compiled_codecs(monkeypatch):
+    monkeypatch.setattr(transport, "USE_COMPILED_CODECS", True)
+    public_key, private_key = [b64encode(key).decode() for key in crypto_sign_keypair()]
+    for message in (messages_by_type[DPrognosis], messages_by_type[Metering]):
+        sealed = transport.seal_message(message, private_key)
+        assert transport.unseal_message(sealed, public_key) == message